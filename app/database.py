@@ -1,6 +1,7 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from pathlib import Path
 import os
 
 # Database configuration
@@ -25,4 +26,18 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def init_db():
+    """Bring the schema up to date by running any pending migrations (see migrations/)"""
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(str(Path(__file__).resolve().parent.parent / "alembic.ini"))
+    with engine.begin() as conn:
+        config.attributes["connection"] = conn
+        inspector = inspect(conn)
+        if inspector.has_table("funeral_programs") and not inspector.has_table("alembic_version"):
+            # Created before migrations existed, with the original release's tables
+            command.stamp(config, "0001")
+        command.upgrade(config, "head")
@@ -1 +1 @@
-from .funeral import FuneralProgram, ProgramEvent, Obituary, AdminUser
\ No newline at end of file
+from .funeral import FuneralProgram, ProgramEvent, Obituary, AdminUser, CacheInvalidation, ArchivedProgram
\ No newline at end of file
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, JSON, LargeBinary, Index
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from app.database import Base
+from app.utils.dates import parse_date, parse_datetime
 
 class FuneralProgram(Base):
     __tablename__ = "funeral_programs"
@@ -12,15 +13,41 @@ class FuneralProgram(Base):
     date_of_death = Column(String(50))
     funeral_date = Column(String(50), nullable=False)
     funeral_location = Column(String(500), nullable=False)
+    # Typed copies of the display strings above, NULL when those don't parse
+    born_on = Column(Date)
+    died_on = Column(Date)
+    funeral_at = Column(DateTime, index=True)  # Local time at the venue; midnight when no time was given
     deceased_photo_url = Column(String(500))
+    photo_variants = Column(JSON)  # {format: {width: url}} resized copies of the photo
     qr_code_id = Column(String(100), unique=True, index=True)
+    short_code = Column(String(16), unique=True, index=True)  # Base62 code behind the /p/<code> QR URL
     is_active = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped on every change to the program or its children
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set on insert too, so the change feed can page through every program by (updated_at, id)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    
+    # Ids are never reused (SQLite otherwise hands out the max id again once that row is gone):
+    # archived rows, tombstones and the change feed keep referring to a program by its id
+    __table_args__ = (
+        Index("ix_funeral_programs_updated_at_id", "updated_at", "id"),
+        {"sqlite_autoincrement": True},
+    )
     
     # Relationships
     program_events = relationship("ProgramEvent", back_populates="funeral_program", cascade="all, delete-orphan")
     obituary = relationship("Obituary", back_populates="funeral_program", uselist=False, cascade="all, delete-orphan")
+    
+    @validates("date_of_birth", "date_of_death", "funeral_date")
+    def _sync_typed_date(self, key, value):
+        """Keep the typed date columns in step with the display strings"""
+        if key == "funeral_date":
+            self.funeral_at = parse_datetime(value)
+        elif key == "date_of_birth":
+            self.born_on = parse_date(value)
+        else:
+            self.died_on = parse_date(value)
+        return value
 
 class ProgramEvent(Base):
     __tablename__ = "program_events"
@@ -47,6 +74,7 @@ class Obituary(Base):
     photos = Column(JSON)  # Store list of photo URLs
     tributes = Column(JSON)  # Store list of tribute messages
     pdf_url = Column(String(500))  # URL to generated PDF
+    pdf_version = Column(Integer)  # Program version the PDF was built from
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -62,4 +90,56 @@ class AdminUser(Base):
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped to revoke issued tokens
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class CacheInvalidation(Base):
+    __tablename__ = "cache_invalidations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String(50), nullable=False)  # e.g. "program", "admin_user"
+    key = Column(String(100))  # Affected entity id, or NULL for the whole scope
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class ArchivedProgram(Base):
+    __tablename__ = "archived_programs"
+    
+    id = Column(Integer, primary_key=True)  # The program's original id
+    qr_code_id = Column(String(100), unique=True, index=True)
+    short_code = Column(String(16), unique=True, index=True)
+    deceased_name = Column(String(255), nullable=False)
+    funeral_date = Column(String(50))
+    deceased_photo_url = Column(String(500), index=True)  # "" when there is none; photos can be shared with live programs
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON of the program, events and obituary rows
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+    
+    id = Column(Integer, primary_key=True)
+    program_id = Column(Integer, nullable=False)  # Id of the program that left the live tables
+    qr_code_id = Column(String(100))
+    reason = Column(String(20), nullable=False)  # "deleted" or "archived"
+    removed_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    
+    __table_args__ = (Index("ix_tombstones_removed_at_id", "removed_at", "id"),)
+
+class Task(Base):
+    __tablename__ = "tasks"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)  # Handler name, e.g. "qr_codes"
+    payload = Column(JSON)
+    idempotency_key = Column(String(200), unique=True)  # Enqueueing the same key again is a no-op
+    status = Column(String(20), nullable=False, default="queued", server_default="queued")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False, default=5, server_default="5")
+    run_at = Column(DateTime, nullable=False)  # UTC; pushed back after each failed attempt
+    locked_by = Column(String(100))
+    locked_at = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (Index("ix_tasks_status_run_at", "status", "run_at"),)
@@ -1,28 +1,54 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Form, UploadFile, File, Cookie
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import bindparam, delete, func, insert, select, update
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 from typing import List, Optional
-import shutil
 import os
-from pathlib import Path
-from datetime import timedelta
+from datetime import date, datetime, timedelta
 
 from app.database import get_db
-from app.models.funeral import FuneralProgram, ProgramEvent, Obituary, AdminUser
+from app.models.funeral import FuneralProgram, ProgramEvent, Obituary, AdminUser, ArchivedProgram
 from app.schemas.funeral import (
     FuneralProgramCreate, FuneralProgramUpdate, 
-    ProgramEventCreate, ObituaryCreate, AdminUserCreate
+    ProgramEventCreate, ObituaryCreate, AdminUserCreate,
+    ProgramEventsUpdate, ProgramEventsState
 )
-from app.utils.qr_generator import generate_qr_code_id, create_qr_code
+from app.utils.qr_generator import generate_qr_code_id
 from app.utils.auth import (
-    get_password_hash, authenticate_user, create_access_token, 
-    require_admin_user, get_current_user_optional, ACCESS_TOKEN_EXPIRE_MINUTES
+    get_password_hash_async, authenticate_user_async, create_access_token,
+    login_throttle, require_admin_user, get_current_user_optional, forget_token, revoke_user_tokens,
+    Principal, ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from app.utils.uploads import save_photo_upload, UploadRejected
+from app.utils.storage import get_storage, key_from_url, StorageError
+from app.utils.invalidation import publish
+from app.utils.templating import templates
+from app.utils.profiling import list_profiles, get_profile
+from app.utils.bulk_import import detect_format, import_programs, open_text, ImportFormatError
+from app.utils.bulk_export import COMPRESSIONS, compression_available, export_stream
+from app.utils.archive import restore_program
+from app.utils.changes import record_removals
+from app.utils.prewarm import build_pdf, current_pdf
+from app.utils.short_codes import new_short_codes
+from app.utils.tasks import (
+    STATUSES, list_tasks, queue_obituary_pdf, queue_photo_variants, queue_program_cleanup,
+    queue_qr_codes, retry_tasks, task_counts
 )
-from app.utils.pdf_generator import create_obituary_pdf, cleanup_temp_images
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+
+# Dashboard settings
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+DASHBOARD_VIEWS = {
+    "upcoming": "Upcoming",
+    "recent": "Last 30 days",
+    "all": "All programs",
+}
+
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
 
 # Authentication routes
 @router.get("/login", response_class=HTMLResponse)
@@ -41,7 +67,15 @@ async def login(
     db: Session = Depends(get_db)
 ):
     """Process admin login"""
-    user = authenticate_user(db, username, password)
+    throttle_keys = (f"user:{username}", f"ip:{_client_ip(request)}")
+    retry_after = login_throttle.hit(*throttle_keys)
+    if retry_after:
+        return templates.TemplateResponse("login.html", {
+            "request": request,
+            "error": "Too many login attempts. Please try again shortly."
+        }, status_code=429, headers={"Retry-After": str(int(retry_after) + 1)})
+    
+    user = await authenticate_user_async(db, username, password)
     if not user:
         return templates.TemplateResponse("login.html", {
             "request": request,
@@ -54,10 +88,12 @@ async def login(
             "error": "Account is inactive"
         })
     
+    login_throttle.reset(f"user:{username}")
+    
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "ver": user.token_version or 0}, expires_delta=access_token_expires
     )
     
     # Redirect to dashboard with token in cookie
@@ -90,6 +126,13 @@ async def register(
     db: Session = Depends(get_db)
 ):
     """Process admin registration"""
+    retry_after = login_throttle.hit(f"ip:{_client_ip(request)}")
+    if retry_after:
+        return templates.TemplateResponse("register.html", {
+            "request": request,
+            "error": "Too many attempts. Please try again shortly."
+        }, status_code=429, headers={"Retry-After": str(int(retry_after) + 1)})
+    
     # Validation
     if password != confirm_password:
         return templates.TemplateResponse("register.html", {
@@ -116,7 +159,7 @@ async def register(
         })
     
     # Create new admin user
-    hashed_password = get_password_hash(password)
+    hashed_password = await get_password_hash_async(password)
     new_user = AdminUser(
         username=username,
         email=email,
@@ -134,8 +177,9 @@ async def register(
     })
 
 @router.post("/logout")
-async def logout():
+async def logout(session_token: Optional[str] = Cookie(None)):
     """Logout admin user"""
+    forget_token(session_token)
     response = RedirectResponse(url="/api/admin/login", status_code=303)
     response.delete_cookie(key="session_token")
     return response
@@ -147,24 +191,59 @@ def get_current_admin_user(
     """Dependency to get current admin user with proper error handling"""
     return require_admin_user(credentials=None, session_token=session_token, db=db)
 
+@router.post("/logout-all")
+def logout_all(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Sign the current admin out on every device by revoking all their tokens"""
+    revoke_user_tokens(db, db.get(AdminUser, current_user.id))
+    response = RedirectResponse(url="/api/admin/login", status_code=303)
+    response.delete_cookie(key="session_token")
+    return response
+
 @router.get("/dashboard", response_class=HTMLResponse)
 async def admin_dashboard(
     request: Request, 
+    view: str = "upcoming",
+    page: int = 1,
     db: Session = Depends(get_db),
-    current_user: AdminUser = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
-    """Admin dashboard showing all funeral programs"""
-    programs = db.query(FuneralProgram).order_by(FuneralProgram.created_at.desc()).all()
+    """Admin dashboard: upcoming services by default, recent or all programs on request"""
+    if view not in DASHBOARD_VIEWS:
+        view = "upcoming"
+    page = max(page, 1)
+    
+    today = datetime.combine(date.today(), datetime.min.time())
+    query = db.query(FuneralProgram)
+    if view == "upcoming":
+        # Range scans on the funeral_at index instead of loading every program
+        query = query.filter(FuneralProgram.funeral_at >= today).order_by(FuneralProgram.funeral_at, FuneralProgram.id)
+    elif view == "recent":
+        query = query.filter(
+            FuneralProgram.funeral_at >= today - timedelta(days=30),
+            FuneralProgram.funeral_at < today
+        ).order_by(FuneralProgram.funeral_at.desc(), FuneralProgram.id.desc())
+    else:
+        query = query.order_by(FuneralProgram.created_at.desc(), FuneralProgram.id.desc())
+    
+    # One extra row tells whether there is a next page
+    programs = query.offset((page - 1) * DASHBOARD_PAGE_SIZE).limit(DASHBOARD_PAGE_SIZE + 1).all()
     return templates.TemplateResponse("admin_dashboard.html", {
         "request": request,
-        "programs": programs,
+        "programs": programs[:DASHBOARD_PAGE_SIZE],
+        "view": view,
+        "views": DASHBOARD_VIEWS,
+        "page": page,
+        "has_next": len(programs) > DASHBOARD_PAGE_SIZE,
         "current_user": current_user
     })
 
 @router.get("/create", response_class=HTMLResponse)
 async def create_program_form(
     request: Request,
-    current_user: AdminUser = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """Show form to create new funeral program"""
     return templates.TemplateResponse("create_program.html", {
@@ -185,29 +264,18 @@ async def create_funeral_program(
     special_message: str = Form(""),
     deceased_photo: UploadFile = File(None),
     db: Session = Depends(get_db),
-    current_user: AdminUser = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """Create a new funeral program"""
     try:
         # Handle photo upload
         deceased_photo_url = None
         if deceased_photo and deceased_photo.filename:
-            # Create uploads directory if it doesn't exist
-            upload_dir = Path("static/uploads")
-            upload_dir.mkdir(exist_ok=True)
-            
-            # Save uploaded file
-            file_extension = deceased_photo.filename.split(".")[-1]
-            filename = f"{deceased_name.replace(' ', '_')}_{generate_qr_code_id()[:8]}.{file_extension}"
-            file_path = upload_dir / filename
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(deceased_photo.file, buffer)
-            
-            deceased_photo_url = f"/static/uploads/{filename}"
+            deceased_photo_url = await save_photo_upload(deceased_photo)
         
-        # Generate unique QR code ID
+        # Generate unique QR code ID and the short code its QR code points at
         qr_code_id = generate_qr_code_id()
+        short_code = new_short_codes(db, 1)[0]
         
         # Create funeral program
         program = FuneralProgram(
@@ -217,7 +285,8 @@ async def create_funeral_program(
             funeral_date=funeral_date,
             funeral_location=funeral_location,
             deceased_photo_url=deceased_photo_url,
-            qr_code_id=qr_code_id
+            qr_code_id=qr_code_id,
+            short_code=short_code
         )
         
         db.add(program)
@@ -234,13 +303,20 @@ async def create_funeral_program(
         )
         
         db.add(obituary)
-        db.commit()
+        db.flush()
         
-        # Generate QR code
-        create_qr_code(qr_code_id)
+        # QR codes, photo variants and the PDF are built by the task workers once this commits
+        queue_qr_codes(db, qr_code_id, short_code)
+        if deceased_photo_url:
+            queue_photo_variants(db, program.id, deceased_photo_url)
+        queue_obituary_pdf(db, program.id, program.version)
+        db.commit()
         
         return RedirectResponse(url=f"/api/admin/program/{program.id}", status_code=303)
         
+    except UploadRejected as e:
+        db.rollback()
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating program: {str(e)}")
@@ -250,7 +326,7 @@ async def view_program_admin(
     request: Request, 
     program_id: int, 
     db: Session = Depends(get_db),
-    current_user: AdminUser = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """View funeral program in admin interface"""
     program = db.query(FuneralProgram).filter(FuneralProgram.id == program_id).first()
@@ -273,7 +349,7 @@ async def edit_program_form(
     request: Request, 
     program_id: int, 
     db: Session = Depends(get_db),
-    current_user: AdminUser = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """Show form to edit funeral program"""
     program = db.query(FuneralProgram).filter(FuneralProgram.id == program_id).first()
@@ -306,10 +382,10 @@ async def add_program_event(
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     
-    # Get the next order index
-    max_order = db.query(ProgramEvent).filter(
+    # Append after the last event (a count would collide with existing indexes after deletes); numbering starts at 1
+    max_order = db.query(func.coalesce(func.max(ProgramEvent.order_index), 0)).filter(
         ProgramEvent.funeral_program_id == program_id
-    ).count()
+    ).scalar()
     
     event = ProgramEvent(
         funeral_program_id=program_id,
@@ -321,10 +397,140 @@ async def add_program_event(
     )
     
     db.add(event)
+    db.flush()
+    queue_obituary_pdf(db, program_id, program.version)
     db.commit()
     
     return RedirectResponse(url=f"/api/admin/program/{program_id}/edit", status_code=303)
 
+def _program_events_state(db: Session, program_id: int, version: int) -> ProgramEventsState:
+    events = db.query(ProgramEvent).filter(
+        ProgramEvent.funeral_program_id == program_id
+    ).order_by(ProgramEvent.order_index, ProgramEvent.id).all()
+    return ProgramEventsState(program_id=program_id, version=version, events=events)
+
+@router.get("/program/{program_id}/events", response_model=ProgramEventsState)
+async def get_program_events(
+    program_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Ordered events of a program with the version to send back with edits"""
+    version = db.query(FuneralProgram.version).filter(FuneralProgram.id == program_id).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Program not found")
+    
+    return _program_events_state(db, program_id, version)
+
+@router.put("/program/{program_id}/events", response_model=ProgramEventsState)
+async def replace_program_events(
+    program_id: int,
+    changes: ProgramEventsUpdate,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """
+    Apply a complete ordered event list in one transaction.
+    Entries with an id update that event, entries without one are created,
+    events left out are deleted and list position (from 1) becomes order_index.
+    Fails with 409 if the program changed since `version` was read.
+    """
+    # Validate the whole payload before touching the database
+    creates, updates = [], {}
+    for index, change in enumerate(changes.events):
+        position = index + 1
+        fields = change.model_dump(exclude_unset=True, exclude={"id", "order_index"})
+        if change.id is None:
+            try:
+                event = ProgramEventCreate(**fields, order_index=position)
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=[
+                    f"events.{index}.{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                    for error in e.errors()
+                ])
+            creates.append(dict(event.model_dump(), funeral_program_id=program_id))
+        else:
+            if change.id in updates:
+                raise HTTPException(status_code=422, detail=f"events.{index}: event {change.id} is listed twice")
+            for required in ("time", "title"):
+                if required in fields and fields[required] is None:
+                    raise HTTPException(status_code=422, detail=f"events.{index}.{required}: may not be null")
+            updates[change.id] = (position, fields)
+    
+    programs_table = FuneralProgram.__table__
+    events_table = ProgramEvent.__table__
+    
+    # Reject other programs' events before bumping the version. Every change to the events bumps
+    # it as well, so if these rows change after this read the compare-and-swap below fails.
+    existing = {
+        row.id: row for row in db.execute(
+            select(events_table).where(events_table.c.funeral_program_id == program_id)
+        )
+    }
+    unknown = sorted(set(updates) - set(existing))
+    if unknown:
+        if db.query(FuneralProgram.id).filter(FuneralProgram.id == program_id).scalar() is None:
+            raise HTTPException(status_code=404, detail="Program not found")
+        raise HTTPException(status_code=422, detail=f"Events {unknown} do not belong to this program")
+    
+    # Compare-and-swap on the version; the row lock also serialises concurrent edits
+    version = db.execute(
+        update(programs_table)
+        .where(programs_table.c.id == program_id, programs_table.c.version == changes.version)
+        .values(version=programs_table.c.version + 1, updated_at=func.now())
+        .returning(programs_table.c.version)
+    ).scalar()
+    if version is None:
+        current = db.query(FuneralProgram.version).filter(FuneralProgram.id == program_id).scalar()
+        db.rollback()
+        if current is None:
+            raise HTTPException(status_code=404, detail="Program not found")
+        raise HTTPException(status_code=409, detail={
+            "message": "The program was changed by someone else; reload the events and retry",
+            "current_version": current
+        })
+    
+    try:
+        removed = set(existing) - set(updates)
+        if removed:
+            db.execute(delete(events_table).where(events_table.c.id.in_(removed)))
+        
+        if updates:
+            db.execute(
+                update(events_table)
+                .where(events_table.c.id == bindparam("event_id"))
+                .values(
+                    time=bindparam("new_time"), title=bindparam("new_title"),
+                    description=bindparam("new_description"), speaker_name=bindparam("new_speaker_name"),
+                    order_index=bindparam("new_order_index")
+                ),
+                [
+                    {
+                        "event_id": event_id,
+                        "new_time": fields.get("time", existing[event_id].time),
+                        "new_title": fields.get("title", existing[event_id].title),
+                        "new_description": fields.get("description", existing[event_id].description),
+                        "new_speaker_name": fields.get("speaker_name", existing[event_id].speaker_name),
+                        "new_order_index": position,
+                    }
+                    for event_id, (position, fields) in updates.items()
+                ]
+            )
+        
+        if creates:
+            db.execute(insert(events_table), creates)
+        
+        # Built before commit so the response doesn't reload expired rows
+        state = _program_events_state(db, program_id, version)
+        publish(db, "program", str(program_id))
+        queue_obituary_pdf(db, program_id, version)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    return state
+
 @router.post("/program/{program_id}/delete")
 async def delete_program(program_id: int, db: Session = Depends(get_db)):
     """Delete a funeral program"""
@@ -333,16 +539,9 @@ async def delete_program(program_id: int, db: Session = Depends(get_db)):
     if not program:
         raise HTTPException(status_code=404, detail="Program not found")
     
-    # Delete associated files
-    if program.deceased_photo_url:
-        photo_path = Path(f"static{program.deceased_photo_url}")
-        if photo_path.exists():
-            photo_path.unlink()
-    
-    # Delete QR code file
-    qr_path = Path(f"static/qr_codes/{program.qr_code_id}.png")
-    if qr_path.exists():
-        qr_path.unlink()
+    # The photo (unless another program uses it), QR codes and PDF are deleted by a task worker
+    queue_program_cleanup(db, program)
+    record_removals(db, [(program.id, program.qr_code_id)], "deleted")
     
     db.delete(program)
     db.commit()
@@ -354,7 +553,7 @@ async def delete_program(program_id: int, db: Session = Depends(get_db)):
 async def generate_obituary_pdf(
     program_id: int,
     db: Session = Depends(get_db),
-    current_user: AdminUser = Depends(get_current_admin_user)
+    current_user: Principal = Depends(get_current_admin_user)
 ):
     """Generate and download obituary PDF"""
     program = db.query(FuneralProgram).filter(FuneralProgram.id == program_id).first()
@@ -365,30 +564,24 @@ async def generate_obituary_pdf(
         raise HTTPException(status_code=404, detail="No obituary found for this program")
     
     try:
-        # Generate PDF
-        pdf_url = create_obituary_pdf(program, program.obituary)
-        
-        # Update obituary with PDF URL
-        program.obituary.pdf_url = pdf_url
-        db.commit()
-        
-        # Clean up temporary images
-        cleanup_temp_images()
+        # The task workers usually have a PDF of the current version ready
+        pdf_url = current_pdf(program) or build_pdf(db, program)
         
         # Return file for download
-        pdf_path = Path(f".{pdf_url}")
-        if not pdf_path.exists():
-            raise HTTPException(status_code=500, detail="PDF generation failed")
-        
         safe_name = "".join(c for c in program.deceased_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
         safe_name = safe_name.replace(' ', '_')
         
-        return FileResponse(
-            path=pdf_path,
-            media_type="application/pdf",
-            filename=f"{safe_name}_obituary.pdf"
-        )
+        try:
+            return get_storage().file_response(
+                key_from_url(pdf_url),
+                media_type="application/pdf",
+                filename=f"{safe_name}_obituary.pdf"
+            )
+        except StorageError:
+            raise HTTPException(status_code=500, detail="PDF generation failed")
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
 
@@ -405,12 +598,175 @@ async def view_obituary_pdf(
     if not program.obituary or not program.obituary.pdf_url:
         raise HTTPException(status_code=404, detail="No PDF available for this obituary")
     
-    pdf_path = Path(f".{program.obituary.pdf_url}")
-    if not pdf_path.exists():
+    try:
+        return get_storage().file_response(
+            key_from_url(program.obituary.pdf_url),
+            media_type="application/pdf",
+            filename=f"{program.deceased_name.replace(' ', '_')}_obituary.pdf"
+        )
+    except StorageError:
         raise HTTPException(status_code=404, detail="PDF file not found")
+
+# Bulk import
+@router.post("/import")
+async def import_programs_upload(
+    file: UploadFile = File(...),
+    generate_pdfs: bool = Form(False),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Bulk import programs from an uploaded CSV or NDJSON file (optionally .gz)"""
+    try:
+        fmt, compression = detect_format(file.filename or "")
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Parsing, inserts and asset generation are blocking; keep them off the event loop
+    try:
+        result = await run_in_threadpool(
+            import_programs, open_text(file.file, compression), fmt, generate_pdfs=generate_pdfs
+        )
+    except (ImportFormatError, UnicodeDecodeError, OSError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not read import file: {e}")
+    
+    return result.as_dict()
+
+@router.get("/export")
+async def export_programs_download(
+    compression: str = "gzip",
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Stream every program as NDJSON (one consistent snapshot), optionally compressed"""
+    if not compression_available(compression):
+        raise HTTPException(status_code=400, detail=f"Unsupported compression: {compression}")
+    
+    filename = f"programs-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson{COMPRESSIONS[compression]}"
+    media_type = {"gzip": "application/gzip", "zstd": "application/zstd"}.get(compression, "application/x-ndjson")
+    return StreamingResponse(
+        export_stream(compression),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Archive routes
+@router.get("/archive")
+async def list_archived_programs(
+    q: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """List archived programs, newest archive first, optionally filtered by name"""
+    query = db.query(
+        ArchivedProgram.id, ArchivedProgram.qr_code_id, ArchivedProgram.deceased_name,
+        ArchivedProgram.funeral_date, ArchivedProgram.archived_at
+    )
+    if q:
+        query = query.filter(ArchivedProgram.deceased_name.ilike(f"%{q}%"))
+    rows = query.order_by(ArchivedProgram.archived_at.desc(), ArchivedProgram.id.desc()).offset(skip).limit(limit).all()
+    
+    return [
+        {
+            "id": row.id,
+            "qr_code_id": row.qr_code_id,
+            "deceased_name": row.deceased_name,
+            "funeral_date": row.funeral_date,
+            "archived_at": row.archived_at.isoformat() if row.archived_at else None,
+            "public_url": f"/api/funeral/program/{row.qr_code_id}/view",
+            "restore_url": f"/api/admin/archive/{row.id}/restore",
+        }
+        for row in rows
+    ]
+
+@router.post("/archive/{program_id}/restore")
+async def restore_archived_program(
+    program_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Move an archived program back into the live tables"""
+    restored_id = restore_program(db, program_id)
+    if restored_id is None:
+        raise HTTPException(status_code=404, detail="Archived program not found")
     
-    return FileResponse(
-        path=pdf_path,
-        media_type="application/pdf",
-        filename=f"{program.deceased_name.replace(' ', '_')}_obituary.pdf"
-    )
\ No newline at end of file
+    return RedirectResponse(url=f"/api/admin/program/{restored_id}", status_code=303)
+
+# Background task routes
+@router.get("/tasks")
+async def list_background_tasks(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Task counts per status and the most recent tasks, optionally filtered"""
+    if status and status not in STATUSES:
+        raise HTTPException(status_code=422, detail=f"status must be one of {', '.join(STATUSES)}")
+
+    return {
+        "counts": task_counts(db),
+        "tasks": [
+            {
+                "id": task.id,
+                "kind": task.kind,
+                "status": task.status,
+                "idempotency_key": task.idempotency_key,
+                "attempts": task.attempts,
+                "max_attempts": task.max_attempts,
+                "run_at": task.run_at.isoformat() if task.run_at else None,
+                "locked_by": task.locked_by,
+                "last_error": task.last_error,
+                "created_at": task.created_at.isoformat() if task.created_at else None,
+                "finished_at": task.finished_at.isoformat() if task.finished_at else None,
+                "retry_url": f"/api/admin/tasks/{task.id}/retry" if task.status in ("failed", "queued") else None,
+            }
+            for task in list_tasks(db, status, kind, limit)
+        ]
+    }
+
+@router.post("/tasks/{task_id}/retry")
+async def retry_background_task(
+    task_id: int,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Queue a failed task again, or run a task waiting out its backoff now"""
+    if not retry_tasks(db, [task_id]):
+        raise HTTPException(status_code=404, detail="No failed or waiting task with that id")
+
+    return {"retried": task_id}
+
+# Profiling routes
+@router.get("/profiles")
+async def list_request_profiles(current_user: Principal = Depends(get_current_admin_user)):
+    """List recent request profiles captured by this worker"""
+    return [
+        {
+            "id": profile.id,
+            "method": profile.method,
+            "path": profile.path,
+            "trigger": profile.trigger,
+            "started_at": profile.started_at.isoformat(),
+            "duration_ms": round(profile.duration_ms, 2),
+            "samples": profile.samples,
+            "concurrent_requests": profile.concurrent_requests,
+            "download_url": f"/api/admin/profiles/{profile.id}",
+        }
+        for profile in list_profiles()
+    ]
+
+@router.get("/profiles/{profile_id}")
+async def download_request_profile(
+    profile_id: str,
+    current_user: Principal = Depends(get_current_admin_user)
+):
+    """Download a profile as folded stacks (flamegraph.pl / speedscope compatible)"""
+    profile = get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    return PlainTextResponse(
+        profile.folded(),
+        headers={"Content-Disposition": f'attachment; filename="profile_{profile.id}.folded"'}
+    )
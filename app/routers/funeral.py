@@ -1,66 +1,142 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from functools import partial
+from typing import List, Optional
+from datetime import date, datetime, time, timedelta
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app.models.funeral import FuneralProgram, ProgramEvent, Obituary
-from app.schemas.funeral import PublicFuneralProgram, FuneralProgram as FuneralProgramSchema
+from app.schemas.funeral import PublicFuneralProgram, ProgramChanges, FuneralProgram as FuneralProgramSchema
+from app.utils.sqltrace import query_budget
+from app.utils.archive import get_archived_program
+from app.utils.changes import FEED_PAGE_SIZE, CursorError, CursorExpired, changes_since
+from app.utils import live, offline, page_cache, resilience, short_codes
+from app.utils.storage import get_storage, key_from_url, StorageError
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+# Mounted without the /api/funeral prefix
+short_links = APIRouter()
 
-@router.get("/programs", response_model=List[FuneralProgramSchema])
-async def get_all_programs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all funeral programs (for admin use)"""
-    programs = db.query(FuneralProgram).filter(FuneralProgram.is_active == True).offset(skip).limit(limit).all()
-    return programs
-
-@router.get("/program/{qr_code_id}", response_model=PublicFuneralProgram)
-async def get_program_by_qr(qr_code_id: str, db: Session = Depends(get_db)):
-    """Get funeral program by QR code ID (public access)"""
+def _public_program(db: Session, qr_code_id: str) -> FuneralProgram:
+    """Active program by QR code id, falling back to the archive for past funerals"""
     program = db.query(FuneralProgram).filter(
         FuneralProgram.qr_code_id == qr_code_id,
         FuneralProgram.is_active == True
     ).first()
     
+    if program is None:
+        program = get_archived_program(db, qr_code_id)
+        if program is not None and not program.is_active:
+            program = None
+    
     if not program:
         raise HTTPException(status_code=404, detail="Funeral program not found")
     
     return program
 
+def _listed_programs(db: Session):
+    # Load events and obituaries in one query each instead of two per program
+    return db.query(FuneralProgram).options(
+        selectinload(FuneralProgram.program_events),
+        selectinload(FuneralProgram.obituary)
+    ).filter(FuneralProgram.is_active == True)
+
+def _load_page(qr_code_id: str, page: str) -> page_cache.CachedPage:
+    """Load and render one public page; runs on a worker thread with its own session"""
+    db = SessionLocal()
+    try:
+        token = page_cache.generation()
+        program = _public_program(db, qr_code_id)
+        if page == "obituary" and not program.obituary:
+            raise HTTPException(status_code=404, detail="Obituary not found for this program")
+        return page_cache.render_and_store(token, program, page)
+    except HTTPException as e:
+        if e.status_code == 404:
+            # Deleted or unpublished: don't keep serving it during an outage
+            page_cache.forget(qr_code_id)
+        raise
+    finally:
+        db.close()
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(","))
+
+async def _serve_page(request: Request, qr_code_id: str, page: str, response_class, **response_args) -> Response:
+    # Rendered pages are cached per program version (and prewarmed before the service)
+    entry = page_cache.cached(qr_code_id, page)
+    stale = None
+    if entry is None:
+        # Falls back to the last good copy if the database is down or slow
+        entry, stale = await resilience.serve(
+            (qr_code_id, page), partial(_load_page, qr_code_id, page), page_cache.last_good(qr_code_id, page)
+        )
+    # Browsers and the offline service worker revalidate on every use
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if stale:
+        resilience.record_stale(page, stale)
+        headers[resilience.STALE_HEADER] = stale
+    if _etag_matches(request.headers.get("if-none-match", ""), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return response_class(content=entry.body, headers=headers, **response_args)
+
+@router.get("/programs", response_model=List[FuneralProgramSchema])
+@query_budget(3)
+async def get_all_programs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Get all funeral programs (for admin use)"""
+    return _listed_programs(db).offset(skip).limit(limit).all()
+
+@router.get("/programs/changes", response_model=ProgramChanges)
+@query_budget(6)
+async def get_program_changes(cursor: Optional[str] = None, limit: int = FEED_PAGE_SIZE, db: Session = Depends(get_db)):
+    """
+    Programs changed (with their events and obituary) and removed since cursor.
+    Omit cursor for a full sync; keep calling while has_more is true.
+    """
+    try:
+        return changes_since(db, cursor, limit)
+    except CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/programs/upcoming", response_model=List[FuneralProgramSchema])
+@query_budget(3)
+async def get_upcoming_programs(days: int = 7, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Services from today through the next `days` days, soonest first"""
+    today = datetime.combine(date.today(), time.min)
+    return _listed_programs(db).filter(
+        FuneralProgram.funeral_at >= today,
+        FuneralProgram.funeral_at < today + timedelta(days=days)
+    ).order_by(FuneralProgram.funeral_at, FuneralProgram.id).offset(skip).limit(limit).all()
+
+@router.get("/programs/recent", response_model=List[FuneralProgramSchema])
+@query_budget(3)
+async def get_recent_programs(days: int = 30, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Services held in the last `days` days (before today), most recent first"""
+    today = datetime.combine(date.today(), time.min)
+    return _listed_programs(db).filter(
+        FuneralProgram.funeral_at >= today - timedelta(days=days),
+        FuneralProgram.funeral_at < today
+    ).order_by(FuneralProgram.funeral_at.desc(), FuneralProgram.id.desc()).offset(skip).limit(limit).all()
+
+@router.get("/program/{qr_code_id}", response_model=PublicFuneralProgram)
+@query_budget(3)
+async def get_program_by_qr(request: Request, qr_code_id: str):
+    """Get funeral program by QR code ID (public access)"""
+    return await _serve_page(request, qr_code_id, "snapshot", Response, media_type="application/json")
+
 @router.get("/program/{qr_code_id}/view", response_class=HTMLResponse)
-async def view_program(request: Request, qr_code_id: str, db: Session = Depends(get_db)):
+@query_budget(3)
+async def view_program(request: Request, qr_code_id: str):
     """View funeral program in HTML format"""
-    program = db.query(FuneralProgram).filter(
-        FuneralProgram.qr_code_id == qr_code_id,
-        FuneralProgram.is_active == True
-    ).first()
-    
-    if not program:
-        raise HTTPException(status_code=404, detail="Funeral program not found")
-    
-    # Sort events by order_index
-    sorted_events = sorted(program.program_events, key=lambda x: x.order_index)
-    
-    return templates.TemplateResponse("funeral_program.html", {
-        "request": request,
-        "program": program,
-        "events": sorted_events,
-        "obituary": program.obituary
-    })
+    return await _serve_page(request, qr_code_id, "program", HTMLResponse)
 
 @router.get("/program/{qr_code_id}/obituary")
+@query_budget(3)
 async def get_obituary(qr_code_id: str, db: Session = Depends(get_db)):
     """Get obituary for a funeral program"""
-    program = db.query(FuneralProgram).filter(
-        FuneralProgram.qr_code_id == qr_code_id,
-        FuneralProgram.is_active == True
-    ).first()
-    
-    if not program:
-        raise HTTPException(status_code=404, detail="Funeral program not found")
+    program = _public_program(db, qr_code_id)
     
     if not program.obituary:
         raise HTTPException(status_code=404, detail="Obituary not found for this program")
@@ -68,21 +144,102 @@ async def get_obituary(qr_code_id: str, db: Session = Depends(get_db)):
     return program.obituary
 
 @router.get("/program/{qr_code_id}/obituary/view", response_class=HTMLResponse)
-async def view_obituary(request: Request, qr_code_id: str, db: Session = Depends(get_db)):
+@query_budget(3)
+async def view_obituary(request: Request, qr_code_id: str):
     """View obituary in HTML format"""
-    program = db.query(FuneralProgram).filter(
-        FuneralProgram.qr_code_id == qr_code_id,
-        FuneralProgram.is_active == True
-    ).first()
-    
-    if not program:
-        raise HTTPException(status_code=404, detail="Funeral program not found")
+    return await _serve_page(request, qr_code_id, "obituary", HTMLResponse)
+
+@router.get("/program/{qr_code_id}/obituary/pdf")
+@query_budget(3)
+async def get_obituary_pdf(qr_code_id: str, v: Optional[str] = None, db: Session = Depends(get_db)):
+    """Obituary PDF (public access); the page links it with ?v=<pdf version>, so that URL can be cached for good"""
+    program = _public_program(db, qr_code_id)
     
-    if not program.obituary:
-        raise HTTPException(status_code=404, detail="Obituary not found for this program")
+    if not program.obituary or not program.obituary.pdf_url:
+        raise HTTPException(status_code=404, detail="No PDF available for this obituary")
     
-    return templates.TemplateResponse("obituary.html", {
-        "request": request,
-        "program": program,
-        "obituary": program.obituary
-    })
\ No newline at end of file
+    try:
+        response = get_storage().file_response(
+            key_from_url(program.obituary.pdf_url),
+            media_type="application/pdf",
+            filename=f"{program.deceased_name.replace(' ', '_')}_obituary.pdf"
+        )
+    except StorageError:
+        raise HTTPException(status_code=404, detail="PDF file not found")
+    if response.status_code == 200 and v == str(program.obituary.pdf_version or 0):
+        # A rebuilt PDF gets a new version, so the versioned URL always names this file.
+        # Redirects to presigned URLs expire, so only the file itself is cacheable.
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        # Unversioned or outdated links must pick up a rebuilt PDF
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@router.get("/program/{qr_code_id}/live", include_in_schema=False)
+async def live_program(request: Request, qr_code_id: str, rev: Optional[str] = None):
+    """Server-Sent Events stream of the program's order of service (see app/utils/live.py)"""
+    if live.hub.full():
+        raise HTTPException(status_code=503, detail="Too many live viewers", headers={"Retry-After": "30"})
+    try:
+        # Browsers send the last revision they received when they reconnect
+        stream = await live.hub.subscribe(qr_code_id, request.headers.get("last-event-id") or rev)
+    except Exception as e:
+        print(f"Live stream for {qr_code_id} failed: {e}")
+        raise HTTPException(status_code=503, detail="Live updates unavailable", headers={"Retry-After": "30"})
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Funeral program not found")
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        # Proxies must pass each message on at once
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Offline support
+
+@router.get("/program/{qr_code_id}/manifest.webmanifest", include_in_schema=False)
+@query_budget(3)
+async def get_program_manifest(request: Request, qr_code_id: str):
+    """Web app manifest, including the offline bundle the service worker precaches"""
+    return await _serve_page(request, qr_code_id, "manifest", Response, media_type="application/manifest+json")
+
+@router.get("/program/{qr_code_id}/sw.js", include_in_schema=False)
+async def get_service_worker(qr_code_id: str):
+    """Service worker for a program's pages; served under the program's prefix so that is its scope"""
+    return Response(
+        content=offline.service_worker(),
+        media_type="application/javascript",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+# Short links
+
+def _resolve_short_code(short_code: str) -> str:
+    db = SessionLocal()
+    try:
+        qr_code_id = short_codes.resolve(db, short_code)
+    finally:
+        db.close()
+    if qr_code_id is None:
+        raise HTTPException(status_code=404, detail="Funeral program not found")
+    return qr_code_id
+
+@short_links.get("/p/{short_code}")
+@query_budget(4)
+async def view_program_by_short_code(short_code: str):
+    """
+    Redirect a QR code's short URL to the program page. The page's service worker only
+    controls URLs under the program's prefix, so guests must land there for offline use.
+    """
+    if not short_codes.is_short_code(short_code):
+        raise HTTPException(status_code=404, detail="Funeral program not found")
+    qr_code_id = short_codes.cached(short_code)
+    if qr_code_id is None:
+        qr_code_id, _ = await resilience.serve(
+            ("short_code", short_code), partial(_resolve_short_code, short_code), None
+        )
+    # Cached by the browser, so scanning again offline goes straight to the cached page
+    return RedirectResponse(
+        f"/api/funeral/program/{qr_code_id}/view", status_code=301,
+        headers={"Cache-Control": f"public, max-age={short_codes.SHORT_LINK_MAX_AGE}"}
+    )
@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from pathlib import Path
 
 from app.database import get_db
 from app.models.funeral import FuneralProgram
 from app.utils.qr_generator import create_qr_code, create_qr_code_svg
+from app.utils.storage import get_storage, key_from_url, public_path, StorageError
+from app.utils.archive import get_archived_program
 from app.schemas.funeral import QRCodeResponse
 
 router = APIRouter()
@@ -18,9 +18,14 @@ async def generate_qr_code(program_id: int, db: Session = Depends(get_db)):
     if not program:
         raise HTTPException(status_code=404, detail="Funeral program not found")
     
-    # Generate QR code image
-    qr_code_url = create_qr_code(program.qr_code_id)
-    access_url = f"/api/funeral/program/{program.qr_code_id}/view"
+    # Read-only: codes are assigned when programs are created (and by migration 0013 before that)
+    key = f"qr_codes/{program.qr_code_id}.png"
+    storage = get_storage()
+    qr_code_url = public_path(key) if storage.exists(key) else create_qr_code(program.qr_code_id, program.short_code)
+    if program.short_code:
+        access_url = f"/p/{program.short_code}"
+    else:
+        access_url = f"/api/funeral/program/{program.qr_code_id}/view"
     
     return QRCodeResponse(
         qr_code_id=program.qr_code_id,
@@ -32,24 +37,28 @@ async def generate_qr_code(program_id: int, db: Session = Depends(get_db)):
 async def download_qr_code(qr_code_id: str, format: str = "png", db: Session = Depends(get_db)):
     """Download QR code image"""
     program = db.query(FuneralProgram).filter(FuneralProgram.qr_code_id == qr_code_id).first()
+    if not program:
+        # Printed programs outlive the hot tables
+        program = get_archived_program(db, qr_code_id)
     
     if not program:
         raise HTTPException(status_code=404, detail="Funeral program not found")
     
     if format.lower() == "svg":
-        qr_code_path = create_qr_code_svg(qr_code_id)
-        file_path = Path(f".{qr_code_path}")  # qr_code_path already includes /static/
-        media_type = "image/svg+xml"
+        key, create, media_type = f"qr_codes/{qr_code_id}.svg", create_qr_code_svg, "image/svg+xml"
     else:
-        qr_code_path = create_qr_code(qr_code_id)
-        file_path = Path(f".{qr_code_path}")  # qr_code_path already includes /static/
-        media_type = "image/png"
+        key, create, media_type = f"qr_codes/{qr_code_id}.png", create_qr_code, "image/png"
     
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="QR code file not found")
+    # QR codes never change for a program; only generate the file the first time
+    storage = get_storage()
+    if not storage.exists(key):
+        key = key_from_url(create(qr_code_id, program.short_code))
     
-    return FileResponse(
-        path=file_path,
-        media_type=media_type,
-        filename=f"{program.deceased_name.replace(' ', '_')}_qr_code.{format.lower()}"
-    )
\ No newline at end of file
+    try:
+        return storage.file_response(
+            key,
+            media_type=media_type,
+            filename=f"{program.deceased_name.replace(' ', '_')}_qr_code.{format.lower()}"
+        )
+    except StorageError:
+        raise HTTPException(status_code=404, detail="QR code file not found")
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, Field, validator
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 
 # Program Event Schemas
 class ProgramEventBase(BaseModel):
@@ -27,6 +27,20 @@ class ProgramEvent(ProgramEventBase):
     class Config:
         from_attributes = True
 
+class ProgramEventChange(ProgramEventUpdate):
+    """Entry of a bulk event edit: updates the event with this id, or creates one when id is omitted"""
+    id: Optional[int] = None
+
+class ProgramEventsUpdate(BaseModel):
+    """The complete ordered event list; events left out are deleted"""
+    version: int  # Program version the edit was based on
+    events: List[ProgramEventChange] = Field(default_factory=list, max_length=200)
+
+class ProgramEventsState(BaseModel):
+    program_id: int
+    version: int
+    events: List[ProgramEvent]
+
 # Obituary Schemas
 class ObituaryBase(BaseModel):
     biography: str
@@ -68,6 +82,13 @@ class FuneralProgramCreate(FuneralProgramBase):
     program_events: List[ProgramEventCreate] = []
     obituary: Optional[ObituaryCreate] = None
 
+class FuneralProgramImport(FuneralProgramCreate):
+    """One program in a bulk import; qr_code_id and short_code are kept when given so exports round-trip"""
+    qr_code_id: Optional[str] = None
+    short_code: Optional[str] = None
+    is_active: bool = True
+    photo_variants: Optional[Dict[str, Dict[str, str]]] = None
+
 class FuneralProgramUpdate(BaseModel):
     deceased_name: Optional[str] = None
     date_of_birth: Optional[str] = None
@@ -80,7 +101,13 @@ class FuneralProgramUpdate(BaseModel):
 class FuneralProgram(FuneralProgramBase):
     id: int
     qr_code_id: str
+    short_code: Optional[str] = None
+    born_on: Optional[date] = None
+    died_on: Optional[date] = None
+    funeral_at: Optional[datetime] = None  # Parsed from funeral_date, None if it didn't parse
+    photo_variants: Optional[Dict[str, Dict[str, str]]] = None
     is_active: bool
+    version: Optional[int] = None  # Bumped on every change; sync clients skip versions they already have
     created_at: datetime
     updated_at: Optional[datetime] = None
     program_events: List[ProgramEvent] = []
@@ -89,6 +116,19 @@ class FuneralProgram(FuneralProgramBase):
     class Config:
         from_attributes = True
 
+class RemovedProgram(BaseModel):
+    id: int
+    qr_code_id: Optional[str] = None
+    reason: str  # "deleted", "archived" or "inactive"
+    removed_at: Optional[datetime] = None
+
+class ProgramChanges(BaseModel):
+    """A page of the change feed; pass cursor back to get what changed next"""
+    programs: List[FuneralProgram]
+    removed: List[RemovedProgram]
+    cursor: str
+    has_more: bool  # Call again at once with the new cursor
+
 # QR Code Response Schema
 class QRCodeResponse(BaseModel):
     qr_code_id: str
@@ -103,6 +143,7 @@ class PublicFuneralProgram(BaseModel):
     funeral_date: str
     funeral_location: str
     deceased_photo_url: Optional[str] = None
+    photo_variants: Optional[Dict[str, Dict[str, str]]] = None
     program_events: List[ProgramEvent] = []
     obituary: Optional[Obituary] = None
     
@@ -0,0 +1,264 @@
+"""
+Hot/cold tiering of programs whose funeral is long past.
+
+archive_programs() moves programs that haven't changed for ARCHIVE_AFTER_DAYS
+(and whose funeral_at, when known, is at least that old) out of
+funeral_programs, program_events and obituaries into archived_programs, one
+zlib-compressed JSON row per program, in batched transactions. The hot tables
+and their indexes then only hold recent programs, which is where nearly all
+public traffic goes.
+
+Archived pages keep working: the public routes fall back to
+get_archived_program(), which unpacks the archive row into transient model
+objects and caches them per worker. restore_program() moves a program back.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import Date, DateTime, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+import asyncio
+import json
+import zlib
+import os
+
+from app.database import SessionLocal
+from app.models.funeral import FuneralProgram, ProgramEvent, Obituary, ArchivedProgram
+from app.utils.cache import TTLCache
+from app.utils.changes import record_removals
+from app.utils.dates import typed_dates
+from app.utils.invalidation import publish, register_listener
+from app.utils.short_codes import new_short_codes
+
+# Archive settings
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "0"))  # Seconds between in-process runs, 0 = run from cron
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "256"))
+ARCHIVE_CACHE_TTL = float(os.getenv("ARCHIVE_CACHE_TTL", "3600"))
+
+programs_table = FuneralProgram.__table__
+events_table = ProgramEvent.__table__
+obituaries_table = Obituary.__table__
+archive_table = ArchivedProgram.__table__
+
+# qr_code_id -> transient FuneralProgram rebuilt from the archive
+_archive_cache = TTLCache(maxsize=ARCHIVE_CACHE_SIZE, ttl=ARCHIVE_CACHE_TTL, name="archived_program")
+
+def _archive_invalidated(key: Optional[str]) -> None:
+    if key is None:
+        _archive_cache.clear()
+    else:
+        _archive_cache.pop(key)
+
+register_listener("archive", _archive_invalidated)
+
+# Payload encoding
+
+def _encode_row(table, row) -> dict:
+    values = {}
+    for column in table.columns:
+        value = row._mapping[column]
+        values[column.name] = value.isoformat() if isinstance(value, (datetime, date)) else value
+    return values
+
+def _decode_row(table, data: dict) -> dict:
+    """Column values for table from an archived row; unknown keys are dropped"""
+    values = {}
+    for column in table.columns:
+        if column.name not in data:
+            continue
+        value = data[column.name]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, Date):
+            value = date.fromisoformat(value)
+        values[column.name] = value
+    return values
+
+def pack(program: dict, events: List[dict], obituaries: List[dict]) -> bytes:
+    document = {"program": program, "events": events, "obituaries": obituaries}
+    return zlib.compress(json.dumps(document, separators=(",", ":")).encode("utf-8"), 6)
+
+def unpack(payload: bytes) -> dict:
+    """The archived program, events and obituaries as stored (datetimes as ISO strings)"""
+    return json.loads(zlib.decompress(payload))
+
+# Archiving
+
+def _archivable(cutoff: datetime):
+    # Programs set up well ahead of the funeral stay hot until the funeral itself has aged out
+    last_changed = func.coalesce(programs_table.c.updated_at, programs_table.c.created_at)
+    return (last_changed < cutoff) & or_(programs_table.c.funeral_at.is_(None), programs_table.c.funeral_at < cutoff)
+
+def _move_to_archive(db: Session, ids: List[int], cutoff: datetime) -> List[int]:
+    # Lock the rows and re-check their age so a program edited since the scan stays hot
+    programs = db.execute(
+        select(programs_table)
+        .where(programs_table.c.id.in_(ids), _archivable(cutoff))
+        .order_by(programs_table.c.id)
+        .with_for_update(skip_locked=True)
+    ).all()
+    ids = [row.id for row in programs]
+    if not ids:
+        return []
+
+    events = defaultdict(list)
+    for row in db.execute(
+        select(events_table)
+        .where(events_table.c.funeral_program_id.in_(ids))
+        .order_by(events_table.c.funeral_program_id, events_table.c.order_index, events_table.c.id)
+    ):
+        events[row.funeral_program_id].append(_encode_row(events_table, row))
+    obituaries = defaultdict(list)
+    for row in db.execute(
+        select(obituaries_table)
+        .where(obituaries_table.c.funeral_program_id.in_(ids))
+        .order_by(obituaries_table.c.id)
+    ):
+        obituaries[row.funeral_program_id].append(_encode_row(obituaries_table, row))
+
+    db.execute(insert(archive_table), [
+        {
+            "id": row.id,
+            "qr_code_id": row.qr_code_id,
+            "short_code": row.short_code,
+            "deceased_name": row.deceased_name,
+            "funeral_date": row.funeral_date,
+            "deceased_photo_url": row.deceased_photo_url or "",
+            "payload": pack(_encode_row(programs_table, row), events[row.id], obituaries[row.id]),
+        }
+        for row in programs
+    ])
+    db.execute(delete(events_table).where(events_table.c.funeral_program_id.in_(ids)))
+    db.execute(delete(obituaries_table).where(obituaries_table.c.funeral_program_id.in_(ids)))
+    db.execute(delete(programs_table).where(programs_table.c.id.in_(ids)))
+    record_removals(db, [(row.id, row.qr_code_id) for row in programs], "archived")
+    for program_id in ids:
+        publish(db, "program", str(program_id))
+    return ids
+
+def archive_programs(
+    older_than_days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    limit: Optional[int] = None,
+    dry_run: bool = False
+) -> int:
+    """Move programs older than older_than_days into the archive; returns how many were (or would be) moved"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = 0
+    last_id = 0
+    while limit is None or moved < limit:
+        db = SessionLocal()
+        try:
+            ids = db.execute(
+                select(programs_table.c.id)
+                .where(programs_table.c.id > last_id, _archivable(cutoff))
+                .order_by(programs_table.c.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            if limit is not None:
+                ids = ids[:limit - moved]
+            if ids and not dry_run:
+                ids = _move_to_archive(db, ids, cutoff)
+                db.commit()
+            moved += len(ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return moved
+
+async def run_archiver(interval: float = ARCHIVE_INTERVAL) -> None:
+    """Archive old programs every interval seconds; started per worker when ARCHIVE_INTERVAL is set"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            moved = await loop.run_in_executor(None, archive_programs)
+            if moved:
+                print(f"Archived {moved} programs")
+        except Exception as e:
+            # Another worker archiving the same batch ends up here; the next run picks up the rest
+            print(f"Archiving failed: {e}")
+
+# Reading and restoring
+
+def _materialize(document: dict) -> FuneralProgram:
+    """Transient model objects for an archived program (never added to a session)"""
+    program = FuneralProgram(**_decode_row(programs_table, document["program"]))
+    obituaries = document["obituaries"]
+    # Set without attribute events so no back-references are populated, like a lazy load
+    set_committed_value(program, "program_events", [
+        ProgramEvent(**_decode_row(events_table, event)) for event in document["events"]
+    ])
+    set_committed_value(
+        program, "obituary", Obituary(**_decode_row(obituaries_table, obituaries[0])) if obituaries else None
+    )
+    return program
+
+def get_archived_program(db: Session, qr_code_id: str) -> Optional[FuneralProgram]:
+    """An archived program by QR code id, cached per worker; None if it isn't archived"""
+    program = _archive_cache.get(qr_code_id)
+    if program is None:
+        payload = db.execute(
+            select(archive_table.c.payload).where(archive_table.c.qr_code_id == qr_code_id)
+        ).scalar()
+        if payload is None:
+            return None
+        program = _materialize(unpack(payload))
+        _archive_cache.set(qr_code_id, program)
+    return program
+
+def restore_program(db: Session, program_id: int) -> Optional[int]:
+    """
+    Move an archived program back into the hot tables and commit.
+    Returns the program's id (a new one if the old id has been reused),
+    or None if no such program is archived.
+    """
+    archived = db.execute(
+        select(archive_table).where(archive_table.c.id == program_id).with_for_update()
+    ).first()
+    if archived is None:
+        return None
+
+    document = unpack(archived.payload)
+    program = _decode_row(programs_table, document["program"])
+    # Programs archived before the typed date columns existed
+    for column, value in typed_dates(program).items():
+        program.setdefault(column, value)
+    # ...and before short codes
+    if not program.get("short_code"):
+        program["short_code"] = new_short_codes(db, 1)[0]
+    program["version"] = (program.get("version") or 1) + 1
+    # A restore counts as a change, otherwise the next run would archive it straight away
+    program["updated_at"] = func.now()
+    if db.execute(select(programs_table.c.id).where(programs_table.c.id == program_id)).first():
+        del program["id"]
+    new_id = db.execute(insert(programs_table).values(**program).returning(programs_table.c.id)).scalar_one()
+
+    children = [
+        (events_table, document["events"]),
+        (obituaries_table, document["obituaries"]),
+    ]
+    for table, rows in children:
+        values = []
+        for row in rows:
+            row = _decode_row(table, row)
+            row.pop("id", None)
+            row["funeral_program_id"] = new_id
+            values.append(row)
+        if values:
+            db.execute(insert(table), values)
+
+    db.execute(delete(archive_table).where(archive_table.c.id == program_id))
+    publish(db, "program", str(new_id))
+    publish(db, "archive", archived.qr_code_id)
+    db.commit()
+    return new_id
@@ -1,30 +1,147 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status, Cookie
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import Optional
+import asyncio
+import hashlib
+import time
 import os
 
+from app.models.funeral import AdminUser
+from app.utils.cache import TTLCache
+from app.utils.invalidation import register_listener
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes whose cost differs from BCRYPT_ROUNDS are flagged for a transparent rehash on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+_pwd_context = None
+
+def get_pwd_context():
+    """Password hashing context, built on first use so passlib/bcrypt load lazily"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        
+        _pwd_context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=BCRYPT_ROUNDS,
+            bcrypt__min_rounds=BCRYPT_ROUNDS,
+            bcrypt__max_rounds=BCRYPT_ROUNDS,
+        )
+    return _pwd_context
+
+def __getattr__(name):
+    # Keeps `from app.utils.auth import pwd_context` working without an eager passlib import
+    if name == "pwd_context":
+        return get_pwd_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# bcrypt releases the GIL, so a small dedicated thread pool keeps it off the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+# Login throttling
+LOGIN_THROTTLE_ATTEMPTS = int(os.getenv("LOGIN_THROTTLE_ATTEMPTS", "5"))
+LOGIN_THROTTLE_WINDOW = float(os.getenv("LOGIN_THROTTLE_WINDOW", "60"))
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Principal cache settings
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+
+@dataclass(frozen=True)
+class Principal:
+    """Session-independent snapshot of an authenticated admin user"""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_superuser: bool
+    token_version: int
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_active=bool(user.is_active),
+            is_superuser=bool(user.is_superuser),
+            token_version=user.token_version or 0,
+        )
+
+# Authenticated principals keyed by token digest
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL, name="principal")
+
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+async def verify_password_async(plain_password: str, hashed_password: str):
+    """Verify a password on the hashing pool; returns (valid, new_hash_or_None)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_executor, get_pwd_context().verify_and_update, plain_password, hashed_password
+    )
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the hashing pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_pwd_context().hash, password)
+
+class LoginThrottle:
+    """
+    Fixed-window attempt counter keyed by username or client IP.
+    Bounded by a TTLCache so idle keys age out on their own.
+    """
+
+    def __init__(self, max_attempts: int, window: float, maxsize: int = 10000):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._attempts = TTLCache(maxsize=maxsize, ttl=window)
+
+    def hit(self, *keys: str) -> float:
+        """
+        Record an attempt against every key.
+        Returns 0 if allowed, otherwise the seconds until the caller may retry.
+        """
+        now = time.monotonic()
+        retry_after = 0.0
+        for key in keys:
+            window_start, count = self._attempts.get(key, (now, 0))
+            count += 1
+            remaining = window_start + self.window - now
+            self._attempts.set(key, (window_start, count), ttl=remaining)
+            if count > self.max_attempts:
+                retry_after = max(retry_after, remaining)
+        return retry_after
+
+    def reset(self, *keys: str) -> None:
+        for key in keys:
+            self._attempts.pop(key)
+
+login_throttle = LoginThrottle(LOGIN_THROTTLE_ATTEMPTS, LOGIN_THROTTLE_WINDOW)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Create a JWT access token"""
+    from jose import jwt
+    
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -34,41 +151,103 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str):
-    """Verify and decode a JWT token"""
+def decode_token(token: str) -> Optional[dict]:
+    """Verify a JWT token and return its claims"""
+    from jose import JWTError, jwt
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
     except JWTError:
         return None
+    if payload.get("sub") is None:
+        return None
+    return payload
+
+def verify_token(token: str):
+    """Verify and decode a JWT token"""
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    return payload["sub"]
+
+def _user_by_username(db: Session, username: str) -> Optional[AdminUser]:
+    return db.query(AdminUser).filter(AdminUser.username == username).first()
 
 def authenticate_user(db: Session, username: str, password: str):
     """Authenticate a user with username and password"""
-    from app.models.funeral import AdminUser
-    
-    user = db.query(AdminUser).filter(AdminUser.username == username).first()
+    user = _user_by_username(db, username)
     if not user:
         return False
     if not verify_password(password, user.hashed_password):
         return False
     return user
 
-def get_current_user(db: Session, token: Optional[str] = None):
+async def authenticate_user_async(db: Session, username: str, password: str):
+    """Authenticate a user without blocking the event loop, upgrading stale hashes"""
+    # The lookup and the commit hit the database, so they run in the threadpool like a sync route
+    user = await run_in_threadpool(_user_by_username, db, username)
+    if not user:
+        return False
+    valid, new_hash = await verify_password_async(password, user.hashed_password)
+    if not valid:
+        return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
+    return user
+
+def get_current_user(db: Session, token: Optional[str] = None) -> Optional[Principal]:
     """Get current authenticated user from token"""
-    from app.models.funeral import AdminUser
-    
     if not token:
         return None
     
-    username = verify_token(token)
-    if username is None:
+    digest = _token_digest(token)
+    principal = _principal_cache.get(digest)
+    if principal is not None:
+        return principal
+    
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    
+    user = db.query(AdminUser).filter(AdminUser.username == payload["sub"]).first()
+    if user is None:
         return None
     
-    user = db.query(AdminUser).filter(AdminUser.username == username).first()
-    return user
+    # Tokens issued before the user's last revocation are no longer valid
+    if payload.get("ver", 0) != (user.token_version or 0):
+        return None
+    
+    principal = Principal.from_user(user)
+    # Never cache a principal beyond its token's expiry
+    _principal_cache.set(digest, principal, ttl=payload.get("exp", 0) - time.time())
+    return principal
+
+def forget_token(token: Optional[str]) -> None:
+    """Drop a single token from the principal cache (e.g. on logout)"""
+    if token:
+        _principal_cache.pop(_token_digest(token))
+
+def invalidate_user(user_id: int) -> None:
+    """Drop every cached principal belonging to a user"""
+    _principal_cache.invalidate_where(lambda _, principal: principal.id == user_id)
+
+def revoke_user_tokens(db: Session, user, deactivate: bool = False) -> None:
+    """Invalidate every token issued to a user so far, optionally deactivating the account"""
+    user.token_version = (user.token_version or 0) + 1
+    if deactivate:
+        user.is_active = False
+    db.commit()
+
+def _admin_user_invalidated(key: Optional[str]) -> None:
+    # Dispatched after the change commits (by the invalidation poller for other workers), so a
+    # request can't put the old row back in the cache between the flush and the commit
+    if key is None:
+        _principal_cache.clear()
+    else:
+        invalidate_user(int(key))
+
+register_listener("admin_user", _admin_user_invalidated)
 
 # Security scheme for optional authentication
 security = HTTPBearer(auto_error=False)
@@ -0,0 +1,219 @@
+"""
+Streaming NDJSON export of every program, for backups and migrations.
+
+Programs are read in id order with yield_per inside one read transaction
+(REPEATABLE READ, or a plain BEGIN on SQLite), so the output is a
+consistent point-in-time snapshot even while admins keep editing. Events
+and obituaries are fetched per partition with one IN query each, and lines
+are yielded as they are produced, so memory stays flat whatever the size
+of the database.
+
+Archived programs follow the live ones in the same snapshot, so a backup
+covers both tiers. Each line has the FuneralProgramImport shape, which means
+an export can be fed straight back into app.utils.bulk_import (archived
+programs come back as live ones).
+"""
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterator, Optional, Set
+from sqlalchemy import select
+import json
+import zlib
+import os
+
+from app.database import engine
+from app.models.funeral import FuneralProgram, ProgramEvent, Obituary, ArchivedProgram
+from app.utils.archive import unpack
+from app.utils.storage import get_storage, key_from_url, StorageError
+
+# Export settings
+EXPORT_PARTITION_SIZE = int(os.getenv("EXPORT_PARTITION_SIZE", "1000"))
+_CHUNK_SIZE = 64 * 1024
+
+programs_table = FuneralProgram.__table__
+events_table = ProgramEvent.__table__
+obituaries_table = Obituary.__table__
+archive_table = ArchivedProgram.__table__
+
+COMPRESSIONS = {
+    # name -> file suffix
+    "none": "",
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+def _begin_snapshot(conn):
+    """Start a read transaction that sees one consistent snapshot"""
+    if conn.dialect.name == "sqlite":
+        # pysqlite doesn't open a transaction for SELECTs on its own
+        conn.exec_driver_sql("BEGIN")
+        return conn
+    return conn.execution_options(isolation_level="REPEATABLE READ")
+
+# Record builders take column mappings: Core rows' _mapping or unpacked archive rows
+
+def _event_record(row) -> dict:
+    return {
+        "time": row["time"],
+        "title": row["title"],
+        "description": row["description"],
+        "speaker_name": row["speaker_name"],
+        "order_index": row["order_index"],
+    }
+
+def _obituary_record(row) -> dict:
+    return {
+        "biography": row["biography"],
+        "family_details": row["family_details"],
+        "special_message": row["special_message"],
+        "photos": row["photos"] or [],
+        "tributes": row["tributes"] or [],
+    }
+
+def _program_record(row, events: list, obituary: Optional[dict]) -> dict:
+    return {
+        "qr_code_id": row["qr_code_id"],
+        "short_code": row.get("short_code"),
+        "deceased_name": row["deceased_name"],
+        "date_of_birth": row["date_of_birth"],
+        "date_of_death": row["date_of_death"],
+        "funeral_date": row["funeral_date"],
+        "funeral_location": row["funeral_location"],
+        "deceased_photo_url": row["deceased_photo_url"],
+        "photo_variants": row["photo_variants"],
+        "is_active": bool(row["is_active"]),
+        "program_events": events,
+        "obituary": obituary,
+    }
+
+def iter_program_records(partition_size: int = EXPORT_PARTITION_SIZE) -> Iterator[dict]:
+    """Yield every program as a nested dict, in id order, from one snapshot"""
+    with engine.connect() as conn:
+        conn = _begin_snapshot(conn)
+        result = conn.execution_options(yield_per=partition_size).execute(
+            select(programs_table).order_by(programs_table.c.id)
+        )
+        for partition in result.partitions():
+            ids = [row.id for row in partition]
+
+            events = defaultdict(list)
+            for row in conn.execute(
+                select(events_table)
+                .where(events_table.c.funeral_program_id.in_(ids))
+                .order_by(events_table.c.funeral_program_id, events_table.c.order_index, events_table.c.id)
+            ):
+                events[row.funeral_program_id].append(_event_record(row._mapping))
+
+            obituaries = {}
+            for row in conn.execute(
+                select(obituaries_table)
+                .where(obituaries_table.c.funeral_program_id.in_(ids))
+                .order_by(obituaries_table.c.id)
+            ):
+                obituaries.setdefault(row.funeral_program_id, _obituary_record(row._mapping))
+
+            for row in partition:
+                yield _program_record(row._mapping, events.get(row.id, []), obituaries.get(row.id))
+
+        archived = conn.execution_options(yield_per=partition_size).execute(
+            select(archive_table.c.payload).order_by(archive_table.c.id)
+        )
+        for payload in archived.scalars():
+            document = unpack(payload)
+            obituaries = document["obituaries"]
+            yield _program_record(
+                document["program"],
+                [_event_record(event) for event in document["events"]],
+                _obituary_record(obituaries[0]) if obituaries else None
+            )
+        conn.rollback()
+
+def iter_ndjson(records: Iterator[dict]) -> Iterator[bytes]:
+    """Encode records as NDJSON, yielding roughly 64 KB chunks"""
+    buffer = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= _CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def compress_chunks(chunks: Iterator[bytes], compression: str = "none") -> Iterator[bytes]:
+    """Compress a byte stream incrementally with gzip or zstd"""
+    if compression == "none":
+        yield from chunks
+        return
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+        finish = compressor.flush
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd output requires the zstandard package (pip install zstandard)")
+        compressor = zstandard.ZstdCompressor().compressobj()
+        finish = compressor.flush
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+def export_stream(compression: str = "none", partition_size: int = EXPORT_PARTITION_SIZE) -> Iterator[bytes]:
+    """The complete export as (optionally compressed) NDJSON bytes"""
+    return compress_chunks(iter_ndjson(iter_program_records(partition_size)), compression)
+
+def compression_available(compression: str) -> bool:
+    """Whether a compression name is known and its codec installed"""
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            return False
+    return compression in COMPRESSIONS
+
+def media_keys(record: dict) -> Set[str]:
+    """Storage keys of every file a record references"""
+    urls = [record.get("deceased_photo_url")]
+    for sizes in (record.get("photo_variants") or {}).values():
+        urls.extend(sizes.values())
+    urls.extend((record.get("obituary") or {}).get("photos") or [])
+    return {key for key in map(key_from_url, urls) if key}
+
+def copy_media(keys: Set[str], media_dir: Path) -> int:
+    """Copy stored files into media_dir/<key>; returns how many were copied"""
+    storage = get_storage()
+    copied = 0
+    for key in sorted(keys):
+        target = media_dir / key
+        if target.exists():
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(target, "wb") as f:
+                for chunk in storage.stream(key):
+                    f.write(chunk)
+        except StorageError:
+            target.unlink(missing_ok=True)
+            continue
+        copied += 1
+    return copied
+
+def restore_media(media_dir: Path) -> int:
+    """Upload every file under media_dir back into storage under the same key"""
+    storage = get_storage()
+    restored = 0
+    for path in sorted(Path(media_dir).rglob("*")):
+        if path.is_file():
+            key = path.relative_to(media_dir).as_posix()
+            if not storage.exists(key):
+                storage.put(key, path.read_bytes())
+                restored += 1
+    return restored
@@ -0,0 +1,437 @@
+"""
+Bulk import of funeral programs from CSV or NDJSON.
+
+Input is parsed one row at a time and validated with FuneralProgramImport.
+Valid rows are inserted in batched transactions with Core executemany, so
+memory stays bounded by the batch size however large the file is. A batch
+that fails as a whole is retried row by row so one bad row only rejects
+itself. Rows that fail validation or insertion are reported with their
+row number; they never abort the import.
+
+QR codes, photo derivatives and (optionally) obituary PDFs are generated in
+a process pool while later batches are still being inserted.
+
+NDJSON rows use the FuneralProgramImport shape (nested program_events and
+obituary). CSV rows are flat: program columns, the obituary's biography,
+family_details and special_message, and JSON arrays in the events,
+tributes and photos columns.
+"""
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, BrokenExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional, TextIO, Tuple
+from pydantic import ValidationError
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+import multiprocessing
+import csv
+import gzip
+import io
+import json
+import time
+import os
+
+from app.database import engine, SessionLocal
+from app.models.funeral import FuneralProgram, ProgramEvent, Obituary, ArchivedProgram
+from app.schemas.funeral import FuneralProgramImport
+from app.utils.qr_generator import create_qr_code, generate_qr_code_id
+from app.utils.dates import typed_dates
+from app.utils.invalidation import publish
+from app.utils.short_codes import new_short_codes, taken_short_codes
+
+# Import settings
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 2)))
+_MAX_KEPT_ERRORS = 1000  # Errors kept on the result; all of them go to on_error
+_MAX_PENDING_ASSETS_PER_WORKER = 8
+
+programs_table = FuneralProgram.__table__
+events_table = ProgramEvent.__table__
+obituaries_table = Obituary.__table__
+archive_table = ArchivedProgram.__table__
+
+class ImportFormatError(Exception):
+    """Raised when the input format can't be determined or read"""
+
+@dataclass
+class RowError:
+    row: int
+    errors: List[str]
+    deceased_name: Optional[str] = None
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    imported: int = 0
+    failed: int = 0
+    asset_failures: int = 0
+    seconds: float = 0.0
+    errors: List[RowError] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "failed": self.failed,
+            "asset_failures": self.asset_failures,
+            "seconds": round(self.seconds, 2),
+            "errors": [
+                {"row": error.row, "deceased_name": error.deceased_name, "errors": error.errors}
+                for error in self.errors
+            ],
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+# Reading input
+
+def detect_format(filename: str) -> Tuple[str, Optional[str]]:
+    """(format, compression) from a filename such as programs.ndjson.gz"""
+    name = filename.lower()
+    compression = None
+    for suffix, kind in ((".gz", "gzip"), (".zst", "zstd")):
+        if name.endswith(suffix):
+            name, compression = name[:-len(suffix)], kind
+    if name.endswith(".csv"):
+        return "csv", compression
+    if name.endswith((".ndjson", ".jsonl", ".json")):
+        return "ndjson", compression
+    raise ImportFormatError(f"Can't tell the format of {filename}; use .csv, .ndjson or .jsonl")
+
+def open_text(binary, compression: Optional[str] = None) -> TextIO:
+    """Text stream over a binary file object, decompressing gzip or zstd on the fly"""
+    if compression == "gzip":
+        binary = gzip.GzipFile(fileobj=binary, mode="rb")
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportFormatError("zstd input requires the zstandard package (pip install zstandard)")
+        binary = zstandard.ZstdDecompressor().stream_reader(binary)
+    return io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+
+def _json_column(value: str, column: str):
+    if not value or not value.strip():
+        return []
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{column}: not a JSON array ({e.msg})")
+
+def _csv_record(row: dict) -> dict:
+    """Nest a flat CSV row into the FuneralProgramImport shape"""
+    row = {key.strip(): (value if value != "" else None) for key, value in row.items() if key}
+    events = _json_column(row.pop("events", None) or "", "events")
+    if isinstance(events, list):
+        for index, event in enumerate(events):
+            if isinstance(event, dict):
+                event.setdefault("order_index", index)
+
+    obituary = {
+        "biography": row.pop("biography", None),
+        "family_details": row.pop("family_details", None),
+        "special_message": row.pop("special_message", None),
+        "tributes": _json_column(row.pop("tributes", None) or "", "tributes"),
+        "photos": _json_column(row.pop("photos", None) or "", "photos"),
+    }
+    record = dict(row, program_events=events)
+    if obituary["biography"] is not None:
+        record["obituary"] = obituary
+    if record.get("is_active") is None:
+        record.pop("is_active", None)
+    return record
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Yield (row number, record, parse error) for every data row"""
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(stream), start=2):  # Row 1 is the header
+            try:
+                yield number, _csv_record(row), None
+            except ValueError as e:
+                yield number, None, str(e)
+    elif fmt == "ndjson":
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, None, f"invalid JSON: {e.msg}"
+                continue
+            if not isinstance(record, dict):
+                yield number, None, "expected a JSON object"
+                continue
+            yield number, record, None
+    else:
+        raise ImportFormatError(f"Unknown import format: {fmt}")
+
+def _validation_messages(error: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}"
+        for item in error.errors()
+    ]
+
+# Inserting
+
+def _program_values(program: FuneralProgramImport) -> dict:
+    values = {
+        "deceased_name": program.deceased_name,
+        "date_of_birth": program.date_of_birth,
+        "date_of_death": program.date_of_death,
+        "funeral_date": program.funeral_date,
+        "funeral_location": program.funeral_location,
+        "deceased_photo_url": program.deceased_photo_url,
+        "photo_variants": program.photo_variants,
+        "qr_code_id": program.qr_code_id,
+        "short_code": program.short_code,
+        "is_active": program.is_active,
+        "version": 1,
+    }
+    values.update(typed_dates(values))
+    return values
+
+def _insert_programs(conn, batch: List[Tuple[int, FuneralProgramImport]]) -> List[int]:
+    """Insert programs with their events and obituaries; returns the new ids in batch order"""
+    ids = conn.execute(
+        insert(programs_table).returning(programs_table.c.id, sort_by_parameter_order=True),
+        [_program_values(program) for _, program in batch]
+    ).scalars().all()
+
+    events, obituaries = [], []
+    for program_id, (_, program) in zip(ids, batch):
+        events.extend(dict(event.model_dump(), funeral_program_id=program_id) for event in program.program_events)
+        if program.obituary:
+            obituaries.append(dict(program.obituary.model_dump(), funeral_program_id=program_id))
+    if events:
+        conn.execute(insert(events_table), events)
+    if obituaries:
+        conn.execute(insert(obituaries_table), obituaries)
+    return ids
+
+def _existing_qr_codes(conn, qr_code_ids: List[str]) -> set:
+    if not qr_code_ids:
+        return set()
+    # Archived programs still own their QR codes
+    return set(conn.execute(
+        select(programs_table.c.qr_code_id).where(programs_table.c.qr_code_id.in_(qr_code_ids))
+        .union(select(archive_table.c.qr_code_id).where(archive_table.c.qr_code_id.in_(qr_code_ids)))
+    ).scalars())
+
+# Asset generation (runs in worker processes)
+
+def build_assets(program_id: int, qr_code_id: str, short_code: Optional[str], photo_url: Optional[str], with_pdf: bool) -> dict:
+    """Create the QR code, photo derivatives and optionally the PDF for one imported program"""
+    from app.utils.image_pipeline import generate_derivatives
+    from app.utils.storage import get_storage, key_from_url
+
+    result = {"program_id": program_id, "photo_variants": None, "pdf_url": None, "error": None}
+    try:
+        create_qr_code(qr_code_id, short_code)
+        photo_key = key_from_url(photo_url)
+        if photo_key and get_storage().exists(photo_key):
+            result["photo_variants"] = generate_derivatives(photo_url)
+        if with_pdf:
+            from app.utils.pdf_generator import create_obituary_pdf
+
+            db = SessionLocal()
+            try:
+                program = db.get(FuneralProgram, program_id)
+                if program is not None and program.obituary is not None:
+                    if result["photo_variants"]:
+                        program.photo_variants = result["photo_variants"]
+                    result["pdf_url"] = create_obituary_pdf(program, program.obituary)
+            finally:
+                db.rollback()
+                db.close()
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+def _store_asset_results(results: List[dict]) -> None:
+    variants = [
+        {"program_id": r["program_id"], "variants": r["photo_variants"]} for r in results if r["photo_variants"]
+    ]
+    pdfs = [{"program_id": r["program_id"], "pdf": r["pdf_url"]} for r in results if r["pdf_url"]]
+    if not variants and not pdfs:
+        return
+    db = SessionLocal()
+    try:
+        if variants:
+            db.execute(
+                update(programs_table)
+                .where(programs_table.c.id == bindparam("program_id"))
+                .values(photo_variants=bindparam("variants"), version=programs_table.c.version + 1),
+                variants
+            )
+        if pdfs:
+            # The PDF was built with the new variants, so it matches the version just written
+            db.execute(
+                update(obituaries_table)
+                .where(obituaries_table.c.funeral_program_id == bindparam("program_id"))
+                .values(
+                    pdf_url=bindparam("pdf"),
+                    pdf_version=select(programs_table.c.version)
+                    .where(programs_table.c.id == obituaries_table.c.funeral_program_id)
+                    .scalar_subquery()
+                ),
+                pdfs
+            )
+        # Pages may have been viewed (and cached) before their assets were ready
+        for program_id in {row["program_id"] for row in variants + pdfs}:
+            publish(db, "program", str(program_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+class _AssetQueue:
+    """Feeds asset jobs to a process pool, keeping a bounded number in flight"""
+
+    def __init__(self, executor, workers: int, with_pdf: bool):
+        self.executor = executor
+        self.with_pdf = with_pdf
+        self.max_pending = max(1, workers) * _MAX_PENDING_ASSETS_PER_WORKER
+        self.pending = set()
+        self.failures = 0
+
+    def submit(self, program_id: int, qr_code_id: str, short_code: Optional[str], photo_url: Optional[str]) -> None:
+        if len(self.pending) >= self.max_pending:
+            self._collect(FIRST_COMPLETED)
+        try:
+            self.pending.add(self.executor.submit(
+                build_assets, program_id, qr_code_id, short_code, photo_url, self.with_pdf
+            ))
+        except BrokenExecutor:
+            # Rows are already committed; QR codes and PDFs are still created on demand
+            self.failures += 1
+
+    def _collect(self, return_when) -> None:
+        done, self.pending = wait(self.pending, return_when=return_when)
+        results = []
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                self.failures += 1
+                print(f"Asset generation crashed: {e}")
+                continue
+            if result["error"]:
+                self.failures += 1
+                print(f"Asset generation failed for program {result['program_id']}: {result['error']}")
+            results.append(result)
+        _store_asset_results(results)
+
+    def finish(self) -> None:
+        if self.pending:
+            self._collect(ALL_COMPLETED)
+
+# Import driver
+
+def import_programs(
+    stream: TextIO,
+    fmt: str,
+    *,
+    generate_assets: bool = True,
+    generate_pdfs: bool = False,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    workers: int = IMPORT_WORKERS,
+    on_error: Optional[Callable[[RowError], None]] = None,
+    on_progress: Optional[Callable[[ImportResult], None]] = None,
+) -> ImportResult:
+    """Import every row of stream; see the module docstring for the accepted formats"""
+    result = ImportResult()
+    start = time.perf_counter()
+
+    def reject(row: int, errors: List[str], name: Optional[str] = None) -> None:
+        error = RowError(row=row, errors=errors, deceased_name=name)
+        result.failed += 1
+        if len(result.errors) < _MAX_KEPT_ERRORS:
+            result.errors.append(error)
+        if on_error:
+            on_error(error)
+
+    executor = None
+    assets = None
+    if generate_assets:
+        # spawn avoids forking a process that already runs threads
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        assets = _AssetQueue(executor, workers, generate_pdfs)
+
+    def insert_batch(batch: List[Tuple[int, FuneralProgramImport]]) -> None:
+        try:
+            with engine.begin() as conn:
+                existing = _existing_qr_codes(conn, [program.qr_code_id for _, program in batch])
+                if existing:
+                    for row, program in batch:
+                        if program.qr_code_id in existing:
+                            reject(row, [f"qr_code_id: {program.qr_code_id} already exists"], program.deceased_name)
+                    batch = [(row, program) for row, program in batch if program.qr_code_id not in existing]
+                # Imported short codes are kept (printed QR codes point at them); the rest get new ones
+                taken = taken_short_codes(conn, [program.short_code for _, program in batch if program.short_code])
+                if taken:
+                    for row, program in batch:
+                        if program.short_code in taken:
+                            reject(row, [f"short_code: {program.short_code} already exists"], program.deceased_name)
+                    batch = [(row, program) for row, program in batch if program.short_code not in taken]
+                missing = [program for _, program in batch if not program.short_code]
+                kept = {program.short_code for _, program in batch if program.short_code}
+                for program, code in zip(missing, new_short_codes(conn, len(missing), kept)):
+                    program.short_code = code
+                inserted = list(zip(_insert_programs(conn, batch), batch)) if batch else []
+        except IntegrityError:
+            # Find the offending rows by inserting the batch one row at a time
+            inserted = []
+            for row, program in batch:
+                try:
+                    with engine.begin() as conn:
+                        inserted.append((_insert_programs(conn, [(row, program)])[0], (row, program)))
+                except IntegrityError as e:
+                    reject(row, [f"database: {e.orig}"], program.deceased_name)
+
+        result.imported += len(inserted)
+        if assets:
+            for program_id, (_, program) in inserted:
+                assets.submit(program_id, program.qr_code_id, program.short_code, program.deceased_photo_url)
+        if on_progress:
+            on_progress(result)
+
+    try:
+        batch = []
+        for row, record, parse_error in iter_records(stream, fmt):
+            result.rows += 1
+            if parse_error:
+                reject(row, [parse_error])
+                continue
+            try:
+                program = FuneralProgramImport.model_validate(record)
+            except ValidationError as e:
+                reject(row, _validation_messages(e), record.get("deceased_name"))
+                continue
+            if not program.qr_code_id:
+                program.qr_code_id = generate_qr_code_id()
+            batch.append((row, program))
+            if len(batch) >= batch_size:
+                insert_batch(batch)
+                batch = []
+        if batch:
+            insert_batch(batch)
+        if assets:
+            assets.finish()
+            result.asset_failures = assets.failures
+    finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    result.seconds = time.perf_counter() - start
+    return result
+
+def write_error_report(path: str):
+    """CSV error writer for on_error; returns (callback, close)"""
+    report = open(path, "w", newline="", encoding="utf-8")
+    writer = csv.writer(report)
+    writer.writerow(["row", "deceased_name", "errors"])
+
+    def on_error(error: RowError) -> None:
+        writer.writerow([error.row, error.deceased_name or "", "; ".join(error.errors)])
+
+    return on_error, report.close
@@ -0,0 +1,145 @@
+"""
+Incremental change feed for program lists.
+
+Clients that mirror the program list (the dashboard, front-desk tablets)
+pass back the cursor from their previous call and receive only what changed
+since. A change is any program whose updated_at moved, which includes
+changes to its events or obituary since those bump the program. Changed
+programs are sent whole, with their events and obituary. Programs that left
+the list are sent as removals, either from tombstones (deleted or archived)
+or because they were deactivated.
+
+Programs and tombstones are each read in (timestamp, id) order from a
+composite index, so a poll that finds nothing costs two index probes.
+Timestamps are assigned before commit, so a slow transaction can commit
+with a time earlier than rows a client has already seen. The cursor
+therefore never moves past FEED_SETTLE_SECONDS before the database's clock.
+Recent changes are sent again until they settle, and clients skip programs
+whose version they already have.
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import String, and_, delete, func, insert, literal, or_, select
+from sqlalchemy.orm import Session, selectinload
+import base64
+import json
+import os
+
+from app.models.funeral import FuneralProgram, Tombstone
+
+# Change feed settings
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", "100"))
+FEED_MAX_PAGE_SIZE = 500
+FEED_SETTLE_SECONDS = float(os.getenv("FEED_SETTLE_SECONDS", "10"))  # Longer than any write transaction
+FEED_TOMBSTONE_RETENTION_DAYS = float(os.getenv("FEED_TOMBSTONE_RETENTION_DAYS", "30"))
+
+programs_table = FuneralProgram.__table__
+tombstones_table = Tombstone.__table__
+
+# (timestamp, id) of the last row a client has; None means from the beginning
+Position = Optional[Tuple[datetime, int]]
+
+class CursorError(Exception):
+    """Raised for cursors that can't be read"""
+
+class CursorExpired(CursorError):
+    """Raised for cursors older than the retained tombstones; the client has to sync from scratch"""
+
+def encode_cursor(programs: Position, removals: Position) -> str:
+    document = {
+        name: [position[0].isoformat(), position[1]] if position else None
+        for name, position in (("p", programs), ("r", removals))
+    }
+    return base64.urlsafe_b64encode(json.dumps(document, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Tuple[Position, Position]:
+    if not cursor:
+        return None, None
+    try:
+        document = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return tuple(
+            (datetime.fromisoformat(document[name][0]), int(document[name][1])) if document.get(name) else None
+            for name in ("p", "r")
+        )
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        raise CursorError(f"Invalid cursor: {e}")
+
+def _db_time(db, value: datetime):
+    # SQLite keeps CURRENT_TIMESTAMP as 'YYYY-MM-DD HH:MM:SS' text; bind the same format so equal times compare equal
+    if db.get_bind().dialect.name == "sqlite":
+        return literal(value.strftime("%Y-%m-%d %H:%M:%S"), String)
+    return value
+
+def _after(db, time_column, id_column, position: Position):
+    if position is None:
+        return time_column.isnot(None)
+    at = _db_time(db, position[0])
+    return or_(time_column > at, and_(time_column == at, id_column > position[1]))
+
+def _next_position(rows: List, time_of, horizon: datetime, has_more: bool) -> Position:
+    if has_more:
+        return time_of(rows[-1]), rows[-1].id
+    # Caught up. Paging may have gone past the horizon; go back to it so that
+    # rows committed late with earlier times are picked up by the next poll.
+    return horizon, 0
+
+def changes_since(db: Session, cursor: Optional[str], limit: int = FEED_PAGE_SIZE) -> dict:
+    """Programs changed and removed after cursor, with the cursor for the next call"""
+    limit = max(1, min(limit, FEED_MAX_PAGE_SIZE))
+    program_position, removal_position = decode_cursor(cursor)
+    # The database's clock, which is the one that stamped the rows
+    now = db.scalar(select(func.now()))
+    if removal_position and removal_position[0] < now - timedelta(days=FEED_TOMBSTONE_RETENTION_DAYS):
+        raise CursorExpired("Cursor is older than the retained deletions; sync again without a cursor")
+    horizon = now - timedelta(seconds=FEED_SETTLE_SECONDS)
+
+    programs = db.query(FuneralProgram).options(
+        selectinload(FuneralProgram.program_events),
+        selectinload(FuneralProgram.obituary)
+    ).filter(
+        _after(db, FuneralProgram.updated_at, FuneralProgram.id, program_position)
+    ).order_by(FuneralProgram.updated_at, FuneralProgram.id).limit(limit + 1).all()
+    programs_more = len(programs) > limit
+    programs = programs[:limit]
+
+    tombstones = db.execute(
+        select(tombstones_table)
+        .where(_after(db, tombstones_table.c.removed_at, tombstones_table.c.id, removal_position))
+        .order_by(tombstones_table.c.removed_at, tombstones_table.c.id).limit(limit + 1)
+    ).all()
+    tombstones_more = len(tombstones) > limit
+    tombstones = tombstones[:limit]
+
+    removed = [
+        {"id": program.id, "qr_code_id": program.qr_code_id, "reason": "inactive", "removed_at": program.updated_at}
+        for program in programs if not program.is_active
+    ]
+    if tombstones:
+        # A restored program is back in the list; its program entry supersedes the tombstone
+        live = set(db.execute(
+            select(programs_table.c.id).where(programs_table.c.id.in_({row.program_id for row in tombstones}))
+        ).scalars())
+        removed.extend(
+            {"id": row.program_id, "qr_code_id": row.qr_code_id, "reason": row.reason, "removed_at": row.removed_at}
+            for row in tombstones if row.program_id not in live
+        )
+
+    return {
+        "programs": [program for program in programs if program.is_active],
+        "removed": removed,
+        "cursor": encode_cursor(
+            _next_position(programs, lambda row: row.updated_at, horizon, programs_more),
+            _next_position(tombstones, lambda row: row.removed_at, horizon, tombstones_more),
+        ),
+        "has_more": programs_more or tombstones_more,
+    }
+
+def record_removals(db, programs: Iterable[Tuple[int, Optional[str]]], reason: str) -> None:
+    """Leave tombstones for (id, qr_code_id) of programs leaving the live tables (caller commits)"""
+    values = [{"program_id": program_id, "qr_code_id": qr_code_id, "reason": reason} for program_id, qr_code_id in programs]
+    if values:
+        db.execute(insert(tombstones_table), values)
+
+def prune_tombstones(conn) -> None:
+    cutoff = datetime.utcnow() - timedelta(days=FEED_TOMBSTONE_RETENTION_DAYS)
+    conn.execute(delete(tombstones_table).where(tombstones_table.c.removed_at < cutoff))
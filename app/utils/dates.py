@@ -0,0 +1,157 @@
+"""
+Parsing of the free-form date strings admins type in.
+
+date_of_birth, date_of_death and funeral_date stay exactly as entered for
+display. FuneralProgram keeps typed copies (born_on, died_on, funeral_at)
+next to them, which the database can index and range-query. Strings that
+can't be parsed leave the typed column NULL.
+
+Recognised: ISO dates and datetimes, numeric dates (day first unless
+DATE_DAY_FIRST=false), month names in either order, optional weekday and
+ordinal suffixes, and an optional trailing time such as "at 10:00 AM".
+ISO datetimes with an offset or Z (what API clients and the export send)
+are converted to the server's local time, which funeral_at is compared in.
+"""
+from datetime import date, datetime, time
+from typing import Callable, Optional, Tuple
+import re
+import os
+
+# Parsing settings
+DATE_DAY_FIRST = os.getenv("DATE_DAY_FIRST", "true").lower() in ("1", "true", "yes")
+
+_NUMERIC_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y") if DATE_DAY_FIRST else \
+    ("%m/%d/%Y", "%m-%d-%Y", "%m.%d.%Y", "%m/%d/%y")
+_DATE_FORMATS = ("%Y/%m/%d",) + _NUMERIC_FORMATS + ("%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y")
+
+_WEEKDAY = re.compile(r"^(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?,?\s+", re.I)
+_ORDINAL = re.compile(r"(\d)(?:st|nd|rd|th)\b", re.I)
+_SEPARATORS = re.compile(r"\s*(?:,|\bat\b|@)\s*|\s+", re.I)
+_TIME_12H = re.compile(r"(?:^|\s)(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m\.?$", re.I)
+_TIME_24H = re.compile(r"(?:^|[\sT])(\d{1,2}):(\d{2})(?::\d{2}(?:\.\d+)?)?$")
+
+def _split_time(text: str) -> Tuple[str, Optional[time]]:
+    match = _TIME_12H.search(text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        if not 1 <= hour <= 12 or minute > 59:
+            raise ValueError(text)
+        hour = hour % 12 + (12 if match.group(3).lower() == "p" else 0)
+        return text[:match.start()].strip(), time(hour, minute)
+    match = _TIME_24H.search(text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            raise ValueError(text)
+        return text[:match.start()].strip(), time(hour, minute)
+    return text, None
+
+def _parse_day(text: str) -> date:
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(text)
+
+def _parse_iso(text: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(re.sub(r"[zZ]$", "+00:00", text))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        # Naive local time, like every other value in the column
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    """The date (and time, if given) in a display string; midnight when there's no time, None if unparseable"""
+    if not value:
+        return None
+    parsed = _parse_iso(value.strip())
+    if parsed is None:
+        text = _ORDINAL.sub(r"\1", _WEEKDAY.sub("", value.strip()))
+        text = _SEPARATORS.sub(" ", text).strip()
+        try:
+            day_text, at = _split_time(text)
+            parsed = datetime.combine(_parse_day(day_text), at or time.min)
+        except ValueError:
+            return None
+    if not 1800 <= parsed.year <= 2200:
+        return None
+    return parsed
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """The date in a display string, ignoring any time; None if unparseable"""
+    parsed = parse_datetime(value)
+    return parsed.date() if parsed else None
+
+def typed_dates(values: dict) -> dict:
+    """Typed column values for a mapping of display strings, for Core inserts that bypass the model"""
+    return {
+        "born_on": parse_date(values.get("date_of_birth")),
+        "died_on": parse_date(values.get("date_of_death")),
+        "funeral_at": parse_datetime(values.get("funeral_date")),
+    }
+
+def backfill_typed_dates(
+    batch_size: int = 1000,
+    on_failure: Optional[Callable[[int, str, str], None]] = None
+) -> Tuple[int, int]:
+    """
+    Fill typed date columns that are still NULL from their display strings.
+    Calls on_failure(program_id, column, value) for strings that don't parse
+    and returns (programs updated, values that failed). Safe to re-run.
+    """
+    from sqlalchemy import and_, bindparam, or_, select, update
+
+    from app.database import engine
+    from app.models.funeral import FuneralProgram
+
+    programs = FuneralProgram.__table__
+    pairs = [
+        (programs.c.date_of_birth, programs.c.born_on),
+        (programs.c.date_of_death, programs.c.died_on),
+        (programs.c.funeral_date, programs.c.funeral_at),
+    ]
+    pending = or_(*[and_(typed.is_(None), display.isnot(None), display != "") for display, typed in pairs])
+    statement = (
+        update(programs)
+        .where(programs.c.id == bindparam("program_id"))
+        .values(born_on=bindparam("new_born_on"), died_on=bindparam("new_died_on"), funeral_at=bindparam("new_funeral_at"))
+    )
+
+    updated = failed = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(programs.c.id, *[column for pair in pairs for column in pair])
+                .where(programs.c.id > last_id, pending)
+                .order_by(programs.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            changes = []
+            for row in rows:
+                values = typed_dates(row._mapping)
+                for display, typed in pairs:
+                    text = row._mapping[display.name]
+                    if text and values[typed.name] is None:
+                        failed += 1
+                        if on_failure:
+                            on_failure(row.id, display.name, text)
+                # Rows only pending because of an unparseable value have nothing new to write
+                if any(values[typed.name] is not None and row._mapping[typed.name] is None for _, typed in pairs):
+                    changes.append({"program_id": row.id, **{f"new_{name}": value for name, value in values.items()}})
+            if changes:
+                conn.execute(statement, changes)
+            updated += len(changes)
+    return updated, failed
@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import Dict, Optional
+import multiprocessing
+import threading
+import os
+
+from app.utils.storage import get_storage, key_from_url, public_path
+
+# Derivative settings
+DERIVATIVE_WIDTHS = (160, 400, 800)
+DERIVATIVE_PREFIX = "uploads/derived"
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Format name -> (Pillow format, file extension, save options)
+_FORMATS = {
+    "avif": ("AVIF", "avif", {"quality": 50}),
+    "webp": ("WEBP", "webp", {"quality": 75, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 80, "optimize": True, "progressive": True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def available_formats():
+    """Derivative formats this Pillow build can encode, most compact first"""
+    from PIL import features
+    
+    formats = []
+    if features.check("avif"):
+        formats.append("avif")
+    if features.check("webp"):
+        formats.append("webp")
+    formats.append("jpeg")
+    return formats
+
+def generate_derivatives(photo_url: str) -> Dict[str, Dict[str, str]]:
+    """
+    Create resized copies of an uploaded photo in every available format.
+    Returns {format: {width: url}}. Existing derivatives are reused, which
+    makes this cheap for content-addressed uploads seen before.
+    """
+    storage = get_storage()
+    source_key = key_from_url(photo_url)
+    stem = PurePosixPath(source_key).stem
+    formats = available_formats()
+
+    variants = {}
+    missing = set()
+    for width in DERIVATIVE_WIDTHS:
+        for name in formats:
+            key = f"{DERIVATIVE_PREFIX}/{stem}-{width}.{_FORMATS[name][1]}"
+            variants.setdefault(name, {})[str(width)] = public_path(key)
+            if not storage.exists(key):
+                missing.add((width, name, key))
+    if not missing:
+        return variants
+
+    from PIL import Image as PILImage, ImageOps
+    
+    with PILImage.open(BytesIO(storage.get(source_key))) as original:
+        # Phone photos usually rely on EXIF orientation
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        for width in DERIVATIVE_WIDTHS:
+            resized = None
+            for name in formats:
+                pil_format, extension, options = _FORMATS[name]
+                key = f"{DERIVATIVE_PREFIX}/{stem}-{width}.{extension}"
+                if (width, name, key) not in missing:
+                    continue
+                if resized is None:
+                    resized = image.copy()
+                    resized.thumbnail((width, width * 4), PILImage.Resampling.LANCZOS)
+                output = resized.convert("RGB") if pil_format == "JPEG" else resized
+                buffer = BytesIO()
+                output.save(buffer, pil_format, **options)
+                storage.put(key, buffer.getvalue(), f"image/{name}")
+
+    return variants
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn avoids forking a process that already runs threads
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def generate_derivatives_isolated(photo_url: str) -> Dict[str, Dict[str, str]]:
+    """
+    Run generate_derivatives in the image process pool and wait for it.
+    Decoding untrusted uploads there means a decompression bomb or a crash in
+    Pillow takes down a pool process, not the caller.
+    """
+    executor = _get_executor()
+    try:
+        return executor.submit(generate_derivatives, photo_url).result()
+    except BrokenProcessPool:
+        # A pool process died; start a fresh pool for the next photo
+        _discard_executor(executor)
+        raise
+
+def pick_derivative(variants: Optional[dict], fmt: str, min_width: int) -> Optional[str]:
+    """Smallest derivative of a format at least min_width wide (or the largest available)"""
+    sizes = (variants or {}).get(fmt)
+    if not sizes:
+        return None
+    widths = sorted(int(width) for width in sizes)
+    chosen = next((width for width in widths if width >= min_width), widths[-1])
+    return sizes[str(chosen)]
@@ -0,0 +1,165 @@
+"""
+Cross-worker cache invalidation.
+
+Every flush that touches a program (or its events/obituary) or an admin user
+appends a row to cache_invalidations and bumps FuneralProgram.version in the
+same transaction. Each worker polls that log every INVALIDATION_POLL_INTERVAL
+seconds and hands new entries to the listeners registered for their scope, so
+in-process caches drop stale entries within a bounded delay. The worker that
+made the change dispatches immediately after commit.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Callable, Optional
+from sqlalchemy import event, insert, update, delete, func
+from sqlalchemy.orm import Session
+import threading
+import asyncio
+import os
+
+from app.database import SessionLocal
+from app.models.funeral import FuneralProgram, ProgramEvent, Obituary, AdminUser, CacheInvalidation
+
+# Invalidation settings
+INVALIDATION_POLL_INTERVAL = float(os.getenv("INVALIDATION_POLL_INTERVAL", "1.0"))
+INVALIDATION_RETENTION = float(os.getenv("INVALIDATION_RETENTION", "3600"))
+# Ids can commit out of order, so each poll re-reads this many ids behind the high-water mark
+_LOOKBACK_IDS = 200
+_PRUNE_EVERY = 300  # polls
+
+_listeners = defaultdict(list)
+
+def register_listener(scope: str, callback: Callable[[Optional[str]], None]) -> None:
+    """Call callback(key) whenever an entry of scope is invalidated (key None = whole scope)"""
+    _listeners[scope].append(callback)
+
+def dispatch(scope: str, key: Optional[str]) -> None:
+    """Notify this worker's listeners of an invalidation"""
+    for callback in list(_listeners.get(scope, ())):
+        try:
+            callback(key)
+        except Exception as e:
+            print(f"Cache invalidation listener failed for {scope}:{key}: {e}")
+
+def publish(db: Session, scope: str, key: Optional[str] = None) -> None:
+    """Queue an invalidation for entities the ORM hooks don't cover; sent when db commits"""
+    db.add(CacheInvalidation(scope=scope, key=key))
+    db.info.setdefault("pending_invalidations", set()).add((scope, key))
+
+def _changed_entries(session: Session):
+    programs = set()
+    entries = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, FuneralProgram):
+            # Brand-new programs cannot be cached anywhere yet
+            program_id = None if obj in session.new else obj.id
+        elif isinstance(obj, (ProgramEvent, Obituary)):
+            program_id = obj.funeral_program_id
+        elif isinstance(obj, AdminUser):
+            if obj not in session.new:
+                entries.add(("admin_user", str(obj.id)))
+            continue
+        else:
+            continue
+        if program_id is not None:
+            programs.add(program_id)
+            entries.add(("program", str(program_id)))
+    return programs, entries
+
+@event.listens_for(SessionLocal, "after_flush")
+def _record_invalidations(session, flush_context):
+    programs, entries = _changed_entries(session)
+    if not entries:
+        return
+    connection = session.connection()
+    if programs:
+        connection.execute(
+            update(FuneralProgram.__table__)
+            .where(FuneralProgram.__table__.c.id.in_(programs))
+            .values(version=FuneralProgram.__table__.c.version + 1)
+        )
+    connection.execute(
+        insert(CacheInvalidation.__table__),
+        [{"scope": scope, "key": key} for scope, key in sorted(entries)]
+    )
+    session.info.setdefault("pending_invalidations", set()).update(entries)
+    session.info.setdefault("bumped_programs", set()).update(programs)
+
+@event.listens_for(SessionLocal, "after_flush_postexec")
+def _expire_bumped_versions(session, flush_context):
+    # The version bump bypassed the ORM, so reload it on next access
+    for program_id in session.info.pop("bumped_programs", ()):
+        program = session.identity_map.get(session.identity_key(FuneralProgram, program_id))
+        if program is not None:
+            session.expire(program, ["version", "updated_at"])
+
+@event.listens_for(SessionLocal, "after_commit")
+def _dispatch_committed(session):
+    for scope, key in session.info.pop("pending_invalidations", ()):
+        dispatch(scope, key)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("pending_invalidations", None)
+    session.info.pop("bumped_programs", None)
+
+class InvalidationPoller:
+    """Reads new cache_invalidations rows and dispatches them to local listeners"""
+
+    def __init__(self):
+        self.last_id = None
+        self.polls = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def poll(self) -> int:
+        """Dispatch entries committed since the last poll; returns how many were new"""
+        with self._lock:
+            db = SessionLocal()
+            try:
+                if self.last_id is None:
+                    # Caches start empty, so only later changes matter
+                    self.last_id = db.query(func.max(CacheInvalidation.id)).scalar() or 0
+                    self._seen = {
+                        row.id for row in db.query(CacheInvalidation.id)
+                        .filter(CacheInvalidation.id > self.last_id - _LOOKBACK_IDS)
+                    }
+                    return 0
+
+                rows = (
+                    db.query(CacheInvalidation.id, CacheInvalidation.scope, CacheInvalidation.key)
+                    .filter(CacheInvalidation.id > self.last_id - _LOOKBACK_IDS)
+                    .order_by(CacheInvalidation.id)
+                    .all()
+                )
+                fresh = [row for row in rows if row.id not in self._seen]
+                for row in fresh:
+                    dispatch(row.scope, row.key)
+                    self._seen.add(row.id)
+                if rows:
+                    self.last_id = max(self.last_id, rows[-1].id)
+                self._seen = {seen for seen in self._seen if seen > self.last_id - _LOOKBACK_IDS}
+
+                self.polls += 1
+                if self.polls % _PRUNE_EVERY == 0:
+                    cutoff = datetime.utcnow() - timedelta(seconds=INVALIDATION_RETENTION)
+                    db.execute(delete(CacheInvalidation).where(CacheInvalidation.created_at < cutoff))
+                    db.commit()
+                return len(fresh)
+            finally:
+                db.close()
+
+poller = InvalidationPoller()
+
+async def run_poller(interval: float = INVALIDATION_POLL_INTERVAL) -> None:
+    """Poll the invalidation log forever; started once per worker"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, poller.poll)
+        except Exception as e:
+            print(f"Cache invalidation poll failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,288 @@
+"""
+Live order-of-service updates.
+
+A public program page opens a Server-Sent Events stream at
+/api/funeral/program/{qr_code_id}/live and patches its event list as
+changes arrive, so guests don't refresh the page during the service.
+
+Each worker keeps one channel per program that has viewers. A channel holds
+the current event list and its revision (a digest of the list), and every
+viewer has a small queue. Changes reach a channel through the "program"
+invalidation listener: at once on the worker that made the change, and
+through the invalidation poller on every other worker, so the invalidation
+log doubles as the relay between workers. A change is loaded once per
+channel, diffed against the previous list and encoded once for all its
+viewers. A viewer that falls LIVE_QUEUE_SIZE messages behind skips them and
+gets the whole list instead.
+
+An idle viewer costs a queue and a suspended generator; one task per worker
+sends the keep-alive comments. Pages carry the revision they were rendered
+from, so a viewer that connects (or reconnects) with an older one is sent
+the whole list first. Archived programs can't change, so their pages don't
+open a stream.
+"""
+from functools import partial
+from typing import Dict, List, Optional, Set
+import asyncio
+import hashlib
+import json
+import os
+
+from app.database import SessionLocal
+from app.models.funeral import FuneralProgram, ProgramEvent
+from app.utils.invalidation import register_listener
+from app.utils.metrics import LIVE_CONNECTIONS, LIVE_MESSAGES
+
+# Live update settings
+LIVE_MAX_CONNECTIONS = int(os.getenv("LIVE_MAX_CONNECTIONS", "5000"))  # Per worker; more get 503
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", "25"))  # Seconds between keep-alives, under proxy idle timeouts
+LIVE_QUEUE_SIZE = 8
+LIVE_RETRY_MS = 5000  # Reconnect delay sent to browsers
+
+_EVENT_FIELDS = ("id", "time", "title", "speaker_name", "description")
+_PING = b": ping\n\n"
+# Queue markers, resolved against the channel when the viewer reads them
+_RESYNC = object()
+_GONE = object()
+
+def event_dicts(events) -> List[dict]:
+    """The fields viewers see of each event, in order of service"""
+    ordered = sorted(events, key=lambda event: event.order_index)
+    return [{field: getattr(event, field) for field in _EVENT_FIELDS} for event in ordered]
+
+def revision(events: List[dict]) -> str:
+    """Digest of an event list; the page and the stream compare these to know if a viewer is current"""
+    body = json.dumps(events, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(body, digest_size=6).hexdigest()
+
+def _message(kind: str, data: dict, rev: Optional[str] = None) -> bytes:
+    lines = [f"event: {kind}"]
+    if rev:
+        # Sent back as Last-Event-ID when the browser reconnects
+        lines.append(f"id: {rev}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+def _diff(old: List[dict], new: List[dict]) -> dict:
+    before = {event["id"]: event for event in old}
+    after = {event["id"] for event in new}
+    return {
+        "upsert": [event for event in new if before.get(event["id"]) != event],
+        "remove": [event_id for event_id in before if event_id not in after],
+        "order": [event["id"] for event in new],
+    }
+
+def _load(program_id: Optional[int] = None, qr_code_id: Optional[str] = None) -> Optional[tuple]:
+    """(program id, event dicts) of a live, active program, or None; runs on a worker thread"""
+    db = SessionLocal()
+    try:
+        query = db.query(FuneralProgram.id).filter(FuneralProgram.is_active == True)
+        if program_id is not None:
+            query = query.filter(FuneralProgram.id == program_id)
+        else:
+            query = query.filter(FuneralProgram.qr_code_id == qr_code_id)
+        program_id = query.scalar()
+        if program_id is None:
+            return None
+        events = db.query(ProgramEvent).filter(ProgramEvent.funeral_program_id == program_id).all()
+        return program_id, event_dicts(events)
+    finally:
+        db.close()
+
+class Channel:
+    __slots__ = ("program_id", "qr_code_id", "events", "rev", "viewers", "refreshing", "dirty", "closed")
+
+    def __init__(self, program_id: int, qr_code_id: str, events: List[dict]):
+        self.program_id = program_id
+        self.qr_code_id = qr_code_id
+        self.events = events
+        self.rev = revision(events)
+        self.viewers: Set[asyncio.Queue] = set()
+        self.refreshing = False
+        self.dirty = False
+        self.closed = False
+
+    def snapshot(self) -> bytes:
+        return _message("snapshot", {"rev": self.rev, "events": self.events}, self.rev)
+
+class LiveHub:
+    """This worker's live channels; only touched on the event loop, apart from the listener"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._channels: Dict[int, Channel] = {}
+        self._by_qr: Dict[str, Channel] = {}
+        self._opening: Dict[str, asyncio.Future] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.connections = 0
+
+    def full(self) -> bool:
+        return self.connections >= LIVE_MAX_CONNECTIONS
+
+    # Called from whichever thread dispatched the invalidation
+    def program_changed(self, key: Optional[str]) -> None:
+        loop = self._loop
+        if loop is None or not self._channels or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._changed, key)
+
+    def _changed(self, key: Optional[str]) -> None:
+        if key is None:
+            channels = list(self._channels.values())
+        else:
+            channel = self._channels.get(int(key))
+            channels = [channel] if channel else []
+        for channel in channels:
+            if channel.refreshing:
+                # Reload once more when the current load finishes
+                channel.dirty = True
+            else:
+                asyncio.create_task(self._refresh(channel))
+
+    async def _refresh(self, channel: Channel) -> None:
+        loop = asyncio.get_running_loop()
+        channel.refreshing = True
+        try:
+            while True:
+                channel.dirty = False
+                try:
+                    loaded = await loop.run_in_executor(None, _load, channel.program_id)
+                except Exception as e:
+                    print(f"Live update for program {channel.program_id} failed: {e}")
+                    return
+                if self._channels.get(channel.program_id) is not channel:
+                    return
+                if loaded is None:
+                    # Deleted, archived or unpublished
+                    self._close(channel)
+                    return
+                events = loaded[1]
+                if events != channel.events:
+                    old_rev = channel.rev
+                    diff = _diff(channel.events, events)
+                    channel.events, channel.rev = events, revision(events)
+                    self._send(channel, _message("diff", {"from": old_rev, "rev": channel.rev, **diff}, channel.rev), "diff")
+                if not channel.dirty:
+                    return
+        finally:
+            channel.refreshing = False
+
+    def _send(self, channel: Channel, message, kind: str) -> None:
+        for queue in channel.viewers:
+            if queue.full():
+                # Too far behind for diffs to be worth sending; it gets the whole list next
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_GONE if message is _GONE else _RESYNC)
+            else:
+                queue.put_nowait(message)
+        LIVE_MESSAGES.labels(kind=kind).inc(len(channel.viewers))
+
+    def _close(self, channel: Channel) -> None:
+        channel.closed = True
+        self._send(channel, _GONE, "gone")
+        self._forget(channel)
+
+    def _register(self, channel: Channel) -> None:
+        self._channels[channel.program_id] = channel
+        self._by_qr[channel.qr_code_id] = channel
+
+    def _forget(self, channel: Channel) -> None:
+        if self._channels.get(channel.program_id) is channel:
+            del self._channels[channel.program_id]
+        if self._by_qr.get(channel.qr_code_id) is channel:
+            del self._by_qr[channel.qr_code_id]
+
+    async def _open(self, qr_code_id: str) -> Optional[Channel]:
+        channel = self._by_qr.get(qr_code_id)
+        if channel is not None:
+            return channel
+        # Guests arrive together; load each program once however many connect at the same time
+        opening = self._opening.get(qr_code_id)
+        if opening is not None:
+            return await asyncio.shield(opening)
+        opening = self._opening[qr_code_id] = asyncio.get_running_loop().create_future()
+        try:
+            loaded = await asyncio.get_running_loop().run_in_executor(None, partial(_load, qr_code_id=qr_code_id))
+            channel = None
+            if loaded is not None:
+                channel = Channel(loaded[0], qr_code_id, loaded[1])
+                self._register(channel)
+            opening.set_result(channel)
+            return channel
+        except Exception as e:
+            opening.set_exception(e)
+            opening.exception()  # Retrieved by waiters, if any
+            raise
+        finally:
+            del self._opening[qr_code_id]
+
+    async def subscribe(self, qr_code_id: str, rev: Optional[str]):
+        """
+        A viewer's stream of the program's event list, or None if there is no such active program.
+        A viewer whose page shows a revision other than rev is sent the whole list first.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First viewer on this event loop
+            self._loop = loop
+            self._channels.clear()
+            self._by_qr.clear()
+            self._heartbeat = loop.create_task(self._keep_alive())
+        channel = await self._open(qr_code_id)
+        if channel is None:
+            return None
+        return self._stream(channel, rev)
+
+    async def _stream(self, channel: Channel, rev: Optional[str]):
+        # Registered once the response starts streaming, so the finally below always runs
+        if channel.closed:
+            yield _message("gone", {})
+            return
+        current = self._channels.get(channel.program_id)
+        if current is None:
+            # Its last viewer left while this one was connecting; changes since then never reached it
+            self._register(channel)
+            if channel.refreshing:
+                channel.dirty = True
+            else:
+                asyncio.create_task(self._refresh(channel))
+        elif current is not channel:
+            # Another viewer opened a new channel after this one was forgotten; join that one
+            channel = current
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        if rev != channel.rev:
+            queue.put_nowait(_RESYNC)
+        channel.viewers.add(queue)
+        self.connections += 1
+        LIVE_CONNECTIONS.inc()
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n\n".encode("utf-8")
+            while True:
+                message = await queue.get()
+                if message is _GONE:
+                    yield _message("gone", {})
+                    return
+                if message is _RESYNC:
+                    LIVE_MESSAGES.labels(kind="snapshot").inc()
+                    message = channel.snapshot()
+                yield message
+        finally:
+            channel.viewers.discard(queue)
+            self.connections -= 1
+            LIVE_CONNECTIONS.dec()
+            if not channel.viewers:
+                self._forget(channel)
+
+    async def _keep_alive(self) -> None:
+        # One timer for every viewer instead of one per connection
+        while True:
+            await asyncio.sleep(LIVE_HEARTBEAT)
+            for channel in list(self._channels.values()):
+                for queue in channel.viewers:
+                    if queue.empty():
+                        queue.put_nowait(_PING)
+
+hub = LiveHub()
+
+register_listener("program", hub.program_changed)
@@ -0,0 +1,206 @@
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+from sqlalchemy import event
+import asyncio
+import time
+import os
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+)
+
+# With PROMETHEUS_MULTIPROC_DIR set, every worker writes to shared files and
+# /metrics aggregates them; without it metrics are per process.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being served",
+    multiprocess_mode="livesum"
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Duration of individual SQL statements",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Total SQL time per HTTP request",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+DB_SLOW_QUERIES = Counter(
+    "db_slow_queries_total", "SQL statements slower than SQL_SLOW_QUERY_MS", ["route"]
+)
+DB_N_PLUS_ONE = Counter(
+    "db_n_plus_one_total", "Repeated same-shape SQL statements detected in a request", ["route"]
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out", "Database connections currently checked out of the pool",
+    multiprocess_mode="livesum"
+)
+OPERATION_DURATION = Histogram(
+    "operation_duration_seconds", "Duration of instrumented subsystem operations",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+TEMPLATE_RENDER_DURATION = Histogram(
+    "template_render_duration_seconds", "Jinja2 render time by template",
+    ["template"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "In-process cache lookups", ["cache", "result"]
+)
+PREWARMED_ITEMS = Counter(
+    "prewarmed_items_total", "Pages, QR codes and PDFs prepared ahead of upcoming services", ["item"]
+)
+STALE_RESPONSES = Counter(
+    "stale_responses_total", "Public pages served from the last good copy instead of the database",
+    ["page", "reason"]
+)
+TASKS_PROCESSED = Counter(
+    "tasks_processed_total", "Background task attempts by outcome (done, retry, failed)", ["kind", "outcome"]
+)
+TASK_DURATION = Histogram(
+    "task_duration_seconds", "Run time of background task attempts", ["kind"], buckets=LATENCY_BUCKETS
+)
+LIVE_CONNECTIONS = Gauge(
+    "live_connections", "Open live update streams", multiprocess_mode="livesum"
+)
+LIVE_MESSAGES = Counter(
+    "live_messages_total", "Live update messages sent to viewers (diff, snapshot, gone)", ["kind"]
+)
+DB_CIRCUIT_OPEN = Gauge(
+    "db_circuit_open", "1 while the public read path's database circuit breaker is open",
+    multiprocess_mode="livemax"
+)
+
+class RequestStats:
+    """SQL activity of the request being served"""
+
+    __slots__ = ("queries", "query_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+_in_flight = 0  # This worker's requests in progress; only touched on the event loop
+
+def requests_in_flight() -> int:
+    return _in_flight
+
+def is_stream(scope) -> bool:
+    """Live update streams stay open for a whole service, so they are left out of request metrics"""
+    return scope["path"].endswith("/live")
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+def record_template_render(template: str, seconds: float) -> None:
+    TEMPLATE_RENDER_DURATION.labels(template=template).observe(seconds)
+
+def timed(operation: str):
+    """Decorator recording a function's duration under operation_duration_seconds"""
+    def decorator(func):
+        histogram = OPERATION_DURATION.labels(operation=operation)
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def instrument_engine(engine) -> None:
+    """Time every SQL statement and track pool usage for an engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_DURATION.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_seconds += elapsed
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and SQL usage per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics" or is_stream(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        global _in_flight
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        REQUESTS_IN_PROGRESS.inc()
+        _in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            _in_flight -= 1
+            _request_stats.reset(token)
+            # Label by route template, never the raw path, to keep cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(method=scope["method"], route=route, status=str(status["code"])).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route=route).observe(stats.queries)
+            DB_TIME_PER_REQUEST.labels(route=route).observe(stats.query_seconds)
+
+def render_metrics():
+    """Exposition payload and content type for /metrics"""
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
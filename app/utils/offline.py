@@ -0,0 +1,68 @@
+"""
+Offline support for the public program pages.
+
+Each program's pages register a service worker scoped to the program's URL
+prefix (/api/funeral/program/<qr_code_id>/). The web app manifest doubles as
+the offline bundle: its "offline" member lists the few URLs a guest needs
+at the graveside. These are the program and obituary pages, one optimized
+photo and the PDF. The worker precaches them on install, serves them from
+cache, and revalidates them with ETags when a connection is available.
+"""
+from typing import Optional
+import hashlib
+
+
+SERVICE_WORKER_TEMPLATE = "service_worker.js"
+THEME_COLOR = "#2c3e50"
+
+_service_worker: Optional[bytes] = None
+
+def program_prefix(qr_code_id: str) -> str:
+    return f"/api/funeral/program/{qr_code_id}/"
+
+def offline_photo(program) -> Optional[str]:
+    """The smallest suitable stored photo: the 400px WebP/JPEG derivative, else the original"""
+    variants = program.photo_variants or {}
+    for fmt in ("webp", "jpeg"):
+        sizes = variants.get(fmt) or {}
+        if sizes:
+            width = "400" if "400" in sizes else min(sizes, key=int)
+            return sizes[width]
+    return program.deceased_photo_url
+
+def pdf_path(program) -> Optional[str]:
+    """Public PDF URL, versioned so cached copies are replaced when it is rebuilt"""
+    obituary = program.obituary
+    if obituary is None or not obituary.pdf_url:
+        return None
+    return f"{program_prefix(program.qr_code_id)}obituary/pdf?v={obituary.pdf_version or 0}"
+
+def manifest(program) -> dict:
+    """Web app manifest for a program, with the offline bundle the service worker precaches"""
+    prefix = program_prefix(program.qr_code_id)
+    photo = offline_photo(program)
+    urls = [f"{prefix}view"]
+    if program.obituary is not None:
+        urls.append(f"{prefix}obituary/view")
+    urls.extend(url for url in (photo, pdf_path(program)) if url)
+    return {
+        "name": f"In loving memory of {program.deceased_name}",
+        "short_name": program.deceased_name,
+        "start_url": f"{prefix}view",
+        "scope": prefix,
+        "display": "standalone",
+        "background_color": "#f8f9fa",
+        "theme_color": THEME_COLOR,
+        "offline": {"version": program.version, "photo": photo, "urls": urls},
+    }
+
+def service_worker() -> bytes:
+    """The service worker script, versioned by a hash of its source"""
+    global _service_worker
+    if _service_worker is None:
+        from app.utils.templating import templates
+
+        source, _, _ = templates.env.loader.get_source(templates.env, SERVICE_WORKER_TEMPLATE)
+        version = hashlib.blake2b(source.encode("utf-8"), digest_size=4).hexdigest()
+        _service_worker = templates.get_template(SERVICE_WORKER_TEMPLATE).render(version=version).encode("utf-8")
+    return _service_worker
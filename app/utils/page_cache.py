@@ -0,0 +1,140 @@
+"""
+Per-worker cache of rendered public pages.
+
+The public program page, obituary page and JSON snapshot are rendered once
+per program version and served from memory until the program changes. Each
+cached page remembers its program id; the "program" invalidation listener
+drops every page of a changed program (cross-worker changes arrive through
+the invalidation poller). Renders that started before their program was
+invalidated are not stored, so a slow render can't put an outdated page
+back; changes to other programs don't hold it up.
+
+Every stored page is also kept as the program's last good copy, which
+invalidation leaves alone. The public routes fall back to it when the
+database is failing or too slow (see app.utils.resilience). Each page
+carries an ETag derived from its body, so repeat visits (and the offline
+service worker) revalidate with a 304 and no database work.
+"""
+from typing import Dict, Optional
+import hashlib
+import threading
+import json
+import time
+import os
+
+from app.utils.cache import TTLCache
+from app.utils.invalidation import register_listener
+
+# Page cache settings
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "512"))  # Pages, not programs
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "600"))
+STALE_PAGE_CACHE_SIZE = int(os.getenv("STALE_PAGE_CACHE_SIZE", "2048"))
+STALE_PAGE_TTL = float(os.getenv("STALE_PAGE_TTL", "86400"))  # How long a page may stand in during an outage
+
+PAGES = ("snapshot", "program", "obituary", "manifest")
+
+class CachedPage:
+    __slots__ = ("program_id", "version", "body", "etag")
+
+    def __init__(self, program_id: int, version: int, body: bytes):
+        self.program_id = program_id
+        self.version = version
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+# (qr_code_id, page) -> CachedPage
+_pages = TTLCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL, name="public_page")
+# (qr_code_id, page) -> the most recent CachedPage, kept through invalidations
+_last_good = TTLCache(maxsize=STALE_PAGE_CACHE_SIZE, ttl=STALE_PAGE_TTL, name="stale_page")
+# Ticks once per invalidation; a render may store its page if its program
+# hasn't been invalidated since the tick the render started at
+_generation = 0
+_cleared_at = 0  # Tick of the last invalidation of every program
+_invalidated_at: Dict[int, int] = {}  # program_id -> tick of its last invalidation
+_generation_lock = threading.Lock()
+
+def _program_invalidated(key: Optional[str]) -> None:
+    global _generation, _cleared_at
+    with _generation_lock:
+        _generation += 1
+        if key is None:
+            _cleared_at = _generation
+            _invalidated_at.clear()
+            _pages.clear()
+        else:
+            program_id = int(key)
+            _invalidated_at[program_id] = _generation
+            _pages.invalidate_where(lambda _, page: page.program_id == program_id)
+
+register_listener("program", _program_invalidated)
+
+def generation() -> int:
+    """Token to take before loading a program; pass it to store()"""
+    return _generation
+
+def cached(qr_code_id: str, page: str) -> Optional[CachedPage]:
+    return _pages.get((qr_code_id, page))
+
+def last_good(qr_code_id: str, page: str) -> Optional[CachedPage]:
+    """The most recently rendered copy of a page, even if the program has changed since"""
+    return _last_good.get((qr_code_id, page))
+
+def forget(qr_code_id: str) -> None:
+    """Drop every copy of a program's pages, e.g. once it is gone from the database"""
+    _pages.invalidate_where(lambda key, _: key[0] == qr_code_id)
+    _last_good.invalidate_where(lambda key, _: key[0] == qr_code_id)
+
+def is_cached(qr_code_id: str, page: str) -> bool:
+    """Presence check that doesn't count towards the hit/miss metrics"""
+    return (qr_code_id, page) in _pages
+
+def render(program, page: str) -> bytes:
+    """Render one public page of a program (events and obituary loaded or loadable)"""
+    if page == "snapshot":
+        from app.schemas.funeral import PublicFuneralProgram
+
+        return PublicFuneralProgram.model_validate(program).model_dump_json().encode("utf-8")
+    if page == "manifest":
+        from app.utils.offline import manifest
+
+        return json.dumps(manifest(program), separators=(",", ":")).encode("utf-8")
+
+    from app.utils.templating import record_render_time, templates
+
+    if page == "program":
+        from sqlalchemy import inspect
+
+        from app.utils.live import event_dicts, revision
+
+        name = "funeral_program.html"
+        context = {
+            "program": program,
+            "events": sorted(program.program_events, key=lambda x: x.order_index),
+            "obituary": program.obituary,
+            # The live stream sends the whole list to pages rendered from another revision. Archived
+            # programs are transient copies that can't change until restored, so they get no stream.
+            "live_revision": None if inspect(program).transient else revision(event_dicts(program.program_events)),
+        }
+    elif page == "obituary":
+        name = "obituary.html"
+        context = {"program": program, "obituary": program.obituary}
+    else:
+        raise ValueError(f"Unknown page: {page}")
+
+    start = time.perf_counter()
+    try:
+        return templates.get_template(name).render(context).encode("utf-8")
+    finally:
+        record_render_time(name, time.perf_counter() - start)
+
+def store(token: int, program, page: str, body: bytes) -> CachedPage:
+    """Cache a rendered page unless the program may have changed since token was taken"""
+    entry = CachedPage(program.id, program.version, body)
+    with _generation_lock:
+        if token >= _cleared_at and token >= _invalidated_at.get(program.id, 0):
+            _pages.set((program.qr_code_id, page), entry)
+            _last_good.set((program.qr_code_id, page), entry)
+    return entry
+
+def render_and_store(token: int, program, page: str) -> CachedPage:
+    return store(token, program, page, render(program, page))
@@ -5,30 +5,31 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT
 from io import BytesIO
-import os
 from pathlib import Path
 from typing import Optional
 import requests
 from PIL import Image as PILImage
 
+from app.utils.image_pipeline import pick_derivative
+from app.utils.metrics import timed
+from app.utils.storage import get_storage, key_from_url, public_path
+
+@timed("create_obituary_pdf")
 def create_obituary_pdf(program, obituary, output_path: str = None) -> str:
     """
-    Generate a PDF obituary for a funeral program
-    Returns the file path of the generated PDF
+    Generate a PDF obituary for a funeral program and store it under pdfs/
+    Returns the public path of the generated PDF
     """
     if not output_path:
         # Create PDF filename based on deceased name and program ID
         safe_name = "".join(c for c in program.deceased_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
         safe_name = safe_name.replace(' ', '_')
-        pdf_filename = f"{safe_name}_obituary_{program.id}.pdf"
-        output_path = Path("static/pdfs") / pdf_filename
-    
-    # Ensure directory exists
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path = f"pdfs/{safe_name}_obituary_{program.id}.pdf"
     
     # Create PDF document
+    buffer = BytesIO()
     doc = SimpleDocTemplate(
-        str(output_path),
+        buffer,
         pagesize=A4,
         rightMargin=72,
         leftMargin=72,
@@ -101,10 +102,11 @@ def create_obituary_pdf(program, obituary, output_path: str = None) -> str:
     # Photo (if available)
     if program.deceased_photo_url:
         try:
-            # Download and process image
-            photo_path = _process_image_for_pdf(program.deceased_photo_url)
-            if photo_path:
-                img = Image(photo_path, width=2*inch, height=2*inch)
+            # Prefer a pre-sized JPEG derivative (2in at ~200dpi) over the original upload
+            photo_url = pick_derivative(getattr(program, "photo_variants", None), "jpeg", 400)
+            photo = _process_image_for_pdf(photo_url or program.deceased_photo_url)
+            if photo:
+                img = Image(photo, width=2*inch, height=2*inch)
                 img.hAlign = 'CENTER'
                 story.append(img)
                 story.append(Spacer(1, 20))
@@ -162,46 +164,30 @@ def create_obituary_pdf(program, obituary, output_path: str = None) -> str:
     # Build PDF
     doc.build(story)
     
-    # Return relative path for URL
-    return f"/static/pdfs/{output_path.name}"
+    get_storage().put(str(output_path), buffer.getvalue(), "application/pdf")
+    return public_path(str(output_path))
 
-def _process_image_for_pdf(image_url: str) -> Optional[str]:
+@timed("process_image_for_pdf")
+def _process_image_for_pdf(image_url: str) -> Optional[BytesIO]:
     """
-    Download and process image for PDF inclusion
-    Returns local file path or None if processing fails
+    Load and process image for PDF inclusion
+    Returns an in-memory image or None if processing fails
     """
     try:
-        # If it's a local file path, convert to full path
-        if image_url.startswith('/static/'):
-            local_path = Path(f".{image_url}")
-            if local_path.exists():
-                return str(local_path)
+        # Stored files are read straight from storage
+        key = key_from_url(image_url)
+        if key is not None:
+            storage = get_storage()
+            if storage.exists(key):
+                return BytesIO(storage.get(key))
         
         # If it's a URL, download it
         if image_url.startswith('http'):
             response = requests.get(image_url, timeout=10)
             response.raise_for_status()
             
-            # Save temporary image
-            temp_dir = Path("static/temp")
-            temp_dir.mkdir(exist_ok=True)
-            
-            # Determine file extension
-            content_type = response.headers.get('content-type', '')
-            if 'jpeg' in content_type or 'jpg' in content_type:
-                ext = '.jpg'
-            elif 'png' in content_type:
-                ext = '.png'
-            else:
-                ext = '.jpg'  # Default
-            
-            temp_path = temp_dir / f"temp_image_{hash(image_url)}{ext}"
-            
-            with open(temp_path, 'wb') as f:
-                f.write(response.content)
-            
             # Process image to ensure it's in correct format
-            with PILImage.open(temp_path) as img:
+            with PILImage.open(BytesIO(response.content)) as img:
                 # Convert to RGB if necessary
                 if img.mode in ('RGBA', 'LA', 'P'):
                     img = img.convert('RGB')
@@ -211,17 +197,18 @@ def _process_image_for_pdf(image_url: str) -> Optional[str]:
                 img.thumbnail(max_size, PILImage.Resampling.LANCZOS)
                 
                 # Save processed image
-                processed_path = temp_dir / f"processed_{temp_path.name}"
-                img.save(processed_path, 'JPEG', quality=85)
+                processed = BytesIO()
+                img.save(processed, 'JPEG', quality=85)
+                processed.seek(0)
                 
-                return str(processed_path)
+                return processed
     
     except Exception as e:
         print(f"Error processing image {image_url}: {e}")
         return None
 
 def cleanup_temp_images():
-    """Clean up temporary images"""
+    """Clean up temporary images left by older versions that staged downloads on disk"""
     temp_dir = Path("static/temp")
     if temp_dir.exists():
         for file in temp_dir.glob("temp_*"):
@@ -0,0 +1,164 @@
+"""
+Predictive prewarming ahead of services.
+
+Scan traffic follows funeral_at: nearly every guest scans the QR code in the
+hours around the service. Every PREWARM_INTERVAL seconds each worker looks
+for active programs whose service starts within PREWARM_LEAD_MINUTES (or
+started less than PREWARM_TRAIL_MINUTES ago) and makes sure that
+
+- the JSON snapshot and rendered program/obituary pages are in this
+  worker's page cache,
+- the QR code PNG and SVG exist in storage,
+- the obituary PDF exists and was built from the current program version.
+
+Programs are prepared one at a time, at most PREWARM_RATE per second, and
+the worker waits while it has more than PREWARM_MAX_IN_FLIGHT requests in
+progress, so prewarming never competes with live traffic. funeral_at is
+venue-local time compared against the server clock, so run workers in the
+venues' time zone (TZ).
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session, selectinload
+import asyncio
+import os
+
+from app.database import SessionLocal
+from app.models.funeral import FuneralProgram, Obituary
+from app.utils import page_cache, short_codes
+from app.utils.cache import TTLCache
+from app.utils.invalidation import publish
+from app.utils.metrics import PREWARMED_ITEMS, requests_in_flight
+from app.utils.qr_generator import create_qr_code, create_qr_code_svg
+from app.utils.storage import get_storage, key_from_url
+
+# Prewarm settings
+PREWARM_LEAD_MINUTES = float(os.getenv("PREWARM_LEAD_MINUTES", "120"))  # 0 disables prewarming
+PREWARM_TRAIL_MINUTES = float(os.getenv("PREWARM_TRAIL_MINUTES", "180"))  # Guests keep scanning after it starts
+PREWARM_INTERVAL = float(os.getenv("PREWARM_INTERVAL", "60"))
+PREWARM_RATE = float(os.getenv("PREWARM_RATE", "2"))  # Programs per second per worker
+PREWARM_MAX_IN_FLIGHT = int(os.getenv("PREWARM_MAX_IN_FLIGHT", "4"))
+PREWARM_PDFS = os.getenv("PREWARM_PDFS", "true").lower() in ("1", "true", "yes")
+
+obituaries_table = Obituary.__table__
+
+# (program_id, version) -> pages that apply, once QR codes and PDF are in place
+_prepared = TTLCache(maxsize=4096, ttl=3600)
+
+def due_programs(now: datetime = None) -> List:
+    """(id, qr_code_id, version) of active programs whose service is inside the prewarm window"""
+    now = now or datetime.now()
+    db = SessionLocal()
+    try:
+        return db.query(FuneralProgram.id, FuneralProgram.qr_code_id, FuneralProgram.version).filter(
+            FuneralProgram.is_active == True,
+            FuneralProgram.funeral_at >= now - timedelta(minutes=PREWARM_TRAIL_MINUTES),
+            FuneralProgram.funeral_at <= now + timedelta(minutes=PREWARM_LEAD_MINUTES)
+        ).order_by(FuneralProgram.funeral_at).all()
+    finally:
+        db.close()
+
+def _is_warm(row) -> bool:
+    pages = _prepared.get((row.id, row.version))
+    return pages is not None and all(page_cache.is_cached(row.qr_code_id, page) for page in pages)
+
+def _ensure_qr_codes(qr_code_id: str, short_code: str) -> int:
+    storage = get_storage()
+    made = 0
+    for key, create in ((f"qr_codes/{qr_code_id}.png", create_qr_code), (f"qr_codes/{qr_code_id}.svg", create_qr_code_svg)):
+        if not storage.exists(key):
+            create(qr_code_id, short_code)
+            PREWARMED_ITEMS.labels(item="qr_code").inc()
+            made += 1
+    return made
+
+def record_pdf(db: Session, program: FuneralProgram, pdf_url: str) -> None:
+    """Store a freshly built obituary PDF against the program version it was built from (caller commits)"""
+    # Core update: recording the PDF must not bump the version it was built from
+    db.execute(
+        update(obituaries_table)
+        .where(obituaries_table.c.funeral_program_id == program.id)
+        .values(pdf_url=pdf_url, pdf_version=program.version)
+    )
+    # The obituary page links to the PDF once it exists
+    publish(db, "program", str(program.id))
+
+def current_pdf(program: FuneralProgram) -> Optional[str]:
+    """URL of the obituary PDF if it was built from the program's current version and is still stored"""
+    obituary = program.obituary
+    if obituary is None or not obituary.pdf_url or obituary.pdf_version != program.version:
+        return None
+    key = key_from_url(obituary.pdf_url)
+    return obituary.pdf_url if key and get_storage().exists(key) else None
+
+def build_pdf(db: Session, program: FuneralProgram) -> str:
+    """Build and record the obituary PDF for the program's current version; returns its URL"""
+    from app.utils.pdf_generator import create_obituary_pdf, cleanup_temp_images
+
+    pdf_url = create_obituary_pdf(program, program.obituary)
+    cleanup_temp_images()
+    record_pdf(db, program, pdf_url)
+    db.commit()
+    return pdf_url
+
+def _ensure_pdf(db: Session, program: FuneralProgram) -> int:
+    if program.obituary is None or current_pdf(program):
+        return 0
+    build_pdf(db, program)
+    PREWARMED_ITEMS.labels(item="pdf").inc()
+    return 1
+
+def prepare_program(program_id: int) -> int:
+    """Bring one program's pages, QR codes and PDF up to date; returns how many items were made"""
+    db = SessionLocal()
+    try:
+        program = db.query(FuneralProgram).options(
+            selectinload(FuneralProgram.program_events),
+            selectinload(FuneralProgram.obituary)
+        ).filter(FuneralProgram.id == program_id).first()
+        if program is None or not program.is_active:
+            return 0
+
+        made = _ensure_qr_codes(program.qr_code_id, program.short_code)
+        short_codes.remember(program.short_code, program.qr_code_id)
+        if PREWARM_PDFS:
+            made += _ensure_pdf(db, program)
+
+        # Reload after taking the token so an edit made meanwhile isn't cached as current
+        token = page_cache.generation()
+        db.expire_all()
+        if not program.is_active:
+            return made
+        pages = ["snapshot", "program", "manifest"] + (["obituary"] if program.obituary else [])
+        for page in pages:
+            if not page_cache.is_cached(program.qr_code_id, page):
+                page_cache.render_and_store(token, program, page)
+                PREWARMED_ITEMS.labels(item="page").inc()
+                made += 1
+        _prepared.set((program.id, program.version), tuple(pages))
+        return made
+    finally:
+        db.close()
+
+async def prewarm_due() -> int:
+    """Prepare every program in the window that isn't warm yet, paced behind live traffic"""
+    loop = asyncio.get_running_loop()
+    made = 0
+    for row in await loop.run_in_executor(None, due_programs):
+        if _is_warm(row):
+            continue
+        while requests_in_flight() > PREWARM_MAX_IN_FLIGHT:
+            await asyncio.sleep(0.5)
+        made += await loop.run_in_executor(None, prepare_program, row.id)
+        await asyncio.sleep(1 / PREWARM_RATE)
+    return made
+
+async def run_prewarmer(interval: float = PREWARM_INTERVAL) -> None:
+    """Prewarm upcoming services forever; started once per worker"""
+    while True:
+        try:
+            await prewarm_due()
+        except Exception as e:
+            print(f"Prewarming failed: {e}")
+        await asyncio.sleep(interval)
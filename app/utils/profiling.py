@@ -0,0 +1,204 @@
+"""
+On-demand request profiling with a statistical stack sampler.
+
+An authenticated admin profiles a single request by sending `X-Profile: 1`
+or adding `?_profile=1`. With PROFILE_SLOW_REQUEST_MS set, the sampler runs
+continuously and any request slower than the threshold is captured too.
+Profiles are kept in a per-worker ring buffer as folded stacks, the input
+format of flamegraph.pl, speedscope and inferno. When neither is in use no
+sampler thread runs and requests only pay for a header/query lookup.
+
+Profiles are process-wide: a profile holds every thread's stacks while the
+request ran, so requests served at the same time show up in it too (each
+stack starts with its thread's name). Each profile records how many other
+requests were in progress; profile on a quiet worker for a clean picture.
+"""
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+import threading
+import time
+import uuid
+import sys
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.metrics import is_stream, requests_in_flight
+
+# Profiling settings
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+_MAX_SAMPLES = 200_000
+
+# Leaf functions of threads that are parked rather than working
+_IDLE_FUNCTIONS = {"wait", "select", "poll", "_worker", "accept", "_wait_for_tstate_lock"}
+
+@dataclass
+class Profile:
+    id: str
+    method: str
+    path: str
+    trigger: str  # "requested" or "slow"
+    started_at: datetime
+    duration_ms: float
+    stacks: Dict[str, int] = field(default_factory=dict)
+    concurrent_requests: int = 0  # Other requests in progress, whose stacks are mixed in
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def folded(self) -> str:
+        """Folded-stack text: one 'frame;frame;frame count' line per unique stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+def _frame_label(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """Background thread recording (timestamp, thread, stack) samples of every other thread"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._samples = deque(maxlen=_MAX_SAMPLES)
+        self._users = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = None
+
+    def acquire(self) -> None:
+        with self._lock:
+            self._users += 1
+            if self._thread is None:
+                # Each thread gets its own stop event, so a quick release/acquire can't leave one running
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            if self._users == 0 and self._thread is not None:
+                self._stop.set()
+                self._thread = None
+                self._stop = None
+                self._samples.clear()
+
+    def _run(self, stop: threading.Event) -> None:
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                self._samples.append((now, names.get(thread_id, str(thread_id)), tuple(reversed(codes))))
+
+    def collect(self, start: float, end: float) -> Dict[str, int]:
+        """Folded stacks sampled between two perf_counter() readings"""
+        counts = Counter()
+        for timestamp, thread_name, codes in list(self._samples):
+            if start <= timestamp <= end:
+                counts[";".join([thread_name] + [_frame_label(code) for code in codes])] += 1
+        return dict(counts)
+
+sampler = StackSampler()
+_profiles = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profiles_lock = threading.Lock()
+
+def list_profiles() -> List[Profile]:
+    with _profiles_lock:
+        return list(reversed(_profiles))
+
+def get_profile(profile_id: str) -> Optional[Profile]:
+    with _profiles_lock:
+        return next((profile for profile in _profiles if profile.id == profile_id), None)
+
+def _store(profile: Profile) -> None:
+    with _profiles_lock:
+        _profiles.append(profile)
+
+def _profile_requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == b"x-profile" and value in (b"1", b"true"):
+            return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return any(value in ("1", "true") for value in query.get("_profile", ()))
+
+def _is_admin(scope) -> bool:
+    from starlette.requests import Request
+    from app.database import SessionLocal
+    from app.utils.auth import get_current_user
+
+    request = Request(scope)
+    token = request.cookies.get("session_token")
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        return False
+    db = SessionLocal()
+    try:
+        user = get_current_user(db, token)
+        return bool(user and user.is_active)
+    finally:
+        db.close()
+
+class ProfilingMiddleware:
+    """ASGI middleware capturing requested or slow requests into the profile ring buffer"""
+
+    def __init__(self, app):
+        self.app = app
+        if PROFILE_SLOW_REQUEST_MS > 0:
+            sampler.acquire()  # Slow requests are only known afterwards, so keep sampling
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # The token lookup may hit the database, so keep it off the event loop
+        requested = _profile_requested(scope) and await run_in_threadpool(_is_admin, scope)
+        if not requested and (PROFILE_SLOW_REQUEST_MS <= 0 or is_stream(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:12]
+
+        async def send_wrapper(message):
+            if requested and message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        if requested:
+            sampler.acquire()
+        started_at = datetime.utcnow()
+        concurrent = requests_in_flight()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            duration_ms = (end - start) * 1000
+            if requested or duration_ms >= PROFILE_SLOW_REQUEST_MS:
+                _store(Profile(
+                    id=profile_id,
+                    method=scope["method"],
+                    path=scope["path"],
+                    trigger="requested" if requested else "slow",
+                    started_at=started_at,
+                    duration_ms=duration_ms,
+                    stacks=sampler.collect(start, end),
+                    concurrent_requests=max(concurrent, requests_in_flight()),
+                ))
+            if requested:
+                sampler.release()
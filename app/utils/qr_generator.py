@@ -1,86 +1,85 @@
-import qrcode
-import qrcode.image.svg
 from io import BytesIO
 import uuid
 import os
-from pathlib import Path
+
+from app.utils.metrics import timed
+from app.utils.storage import get_storage, public_path
 
 def generate_qr_code_id() -> str:
     """Generate a unique QR code ID"""
     return str(uuid.uuid4())
 
-def create_qr_code(qr_code_id: str, base_url: str = None) -> str:
-    """
-    Create a QR code image and save it to static/qr_codes/
-    Returns the file path of the generated QR code
-    """
+def access_url(qr_code_id: str, short_code: str = None, base_url: str = None) -> str:
+    """URL a QR code encodes: the short /p/<code> URL when the program has one"""
     # Get base URL from environment or use default
     if base_url is None:
         base_url = os.getenv("BASE_URL", "http://localhost:8000")
-    
+    if short_code:
+        return f"{base_url}/p/{short_code}"
+    return f"{base_url}/api/funeral/program/{qr_code_id}/view"
+
+@timed("create_qr_code")
+def create_qr_code(qr_code_id: str, short_code: str = None, base_url: str = None) -> str:
+    """
+    Create a QR code image and store it under qr_codes/
+    Returns the public path of the generated QR code
+    """
     # Create the access URL
-    access_url = f"{base_url}/api/funeral/program/{qr_code_id}/view"
+    url = access_url(qr_code_id, short_code, base_url)
+    
+    # Generate QR code (qrcode/PIL are only imported once a QR code is needed)
+    import qrcode
     
-    # Generate QR code
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
         box_size=10,
         border=4,
     )
-    qr.add_data(access_url)
+    qr.add_data(url)
     qr.make(fit=True)
     
     # Create QR code image
     img = qr.make_image(fill_color="black", back_color="white")
     
-    # Save the image
-    qr_code_filename = f"{qr_code_id}.png"
-    qr_code_path = Path("static/qr_codes") / qr_code_filename
+    # Store the image
+    buffer = BytesIO()
+    img.save(buffer)
+    key = f"qr_codes/{qr_code_id}.png"
+    get_storage().put(key, buffer.getvalue(), "image/png")
     
-    # Ensure directory exists
-    qr_code_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Save the image
-    img.save(qr_code_path)
-    
-    return f"/static/qr_codes/{qr_code_filename}"
+    return public_path(key)
 
-def create_qr_code_svg(qr_code_id: str, base_url: str = None) -> str:
+@timed("create_qr_code_svg")
+def create_qr_code_svg(qr_code_id: str, short_code: str = None, base_url: str = None) -> str:
     """
-    Create a QR code SVG and save it to static/qr_codes/
-    Returns the file path of the generated QR code SVG
+    Create a QR code SVG and store it under qr_codes/
+    Returns the public path of the generated QR code SVG
     """
-    # Get base URL from environment or use default
-    if base_url is None:
-        base_url = os.getenv("BASE_URL", "http://localhost:8000")
-    
     # Create the access URL
-    access_url = f"{base_url}/api/funeral/program/{qr_code_id}/view"
+    url = access_url(qr_code_id, short_code, base_url)
     
     # Generate QR code
+    import qrcode
+    import qrcode.image.svg
+    
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
         box_size=10,
         border=4,
     )
-    qr.add_data(access_url)
+    qr.add_data(url)
     qr.make(fit=True)
     
     # Create QR code SVG
     factory = qrcode.image.svg.SvgPathImage
     img = qr.make_image(image_factory=factory)
     
-    # Save the SVG
-    qr_code_filename = f"{qr_code_id}.svg"
-    qr_code_path = Path("static/qr_codes") / qr_code_filename
-    
-    # Ensure directory exists
-    qr_code_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Save the SVG
-    with open(qr_code_path, 'wb') as f:
-        img.save(f)
+    # Store the SVG
+    buffer = BytesIO()
+    img.save(buffer)
+    key = f"qr_codes/{qr_code_id}.svg"
+    get_storage().put(key, buffer.getvalue(), "image/svg+xml")
     
-    return f"/static/qr_codes/{qr_code_filename}"
\ No newline at end of file
+    return public_path(key)
\ No newline at end of file
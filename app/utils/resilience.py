@@ -0,0 +1,145 @@
+"""
+Stale-while-revalidate serving for the public read path.
+
+Public pages are loaded from the database on a worker thread. When that
+load fails, or takes longer than STALE_LATENCY_BUDGET_MS, the caller's last
+good copy is served instead and the load carries on in the background; its
+result refreshes the cache for the next request. Concurrent requests for
+the same page share one load.
+
+Consecutive failures (slow loads count as failures) open a circuit
+breaker. While it is open, public pages are served from their last good
+copy without touching the database, and after BREAKER_COOLDOWN seconds a
+single request is let through to probe whether the database has recovered.
+Pages without a stale copy get a 503 with Retry-After instead of a 500.
+"""
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import threading
+import time
+import os
+
+from app.utils.metrics import DB_CIRCUIT_OPEN, STALE_RESPONSES
+
+# Degradation settings
+STALE_LATENCY_BUDGET_MS = float(os.getenv("STALE_LATENCY_BUDGET_MS", "1500"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # Consecutive failures that open the breaker
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+STALE_HEADER = "X-Stale"  # Set to the reason whenever a stale copy is served
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures. While open, allow() refuses
+    calls until `cooldown` seconds have passed, then admits one probe whose
+    outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+        DB_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            opened = self._probing or self._consecutive >= self.failures
+            if opened:
+                self._opened_at = time.monotonic()
+            self._probing = False
+        if opened:
+            DB_CIRCUIT_OPEN.set(1)
+
+database_breaker = CircuitBreaker()
+
+# key -> load in progress, shared by concurrent requests and left running after a timeout
+_loads: Dict[Hashable, asyncio.Future] = {}
+
+def _guarded(load: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    try:
+        body = load()
+    except HTTPException:
+        # The database answered (e.g. 404), so it's healthy
+        database_breaker.record_success()
+        raise
+    except Exception:
+        database_breaker.record_failure()
+        raise
+    if (time.perf_counter() - start) * 1000 > STALE_LATENCY_BUDGET_MS:
+        database_breaker.record_failure()
+    else:
+        database_breaker.record_success()
+    return body
+
+def _load_done(key: Hashable, future: asyncio.Future) -> None:
+    _loads.pop(key, None)
+    if not future.cancelled() and future.exception() is not None and not isinstance(future.exception(), HTTPException):
+        print(f"Loading {key} failed: {future.exception()}")
+
+def _unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=503, detail="Temporarily unavailable",
+        headers={"Retry-After": str(int(BREAKER_COOLDOWN))}
+    )
+
+async def serve(key: Hashable, load: Callable[[], Any], stale: Optional[Any]) -> Tuple[Any, Optional[str]]:
+    """
+    Run load() (blocking; it must cache what it renders) and return (page, None),
+    or (stale, reason) when the database is failing or slow and a stale copy exists.
+    HTTPExceptions raised by load() pass through.
+    """
+    future = _loads.get(key)
+    if future is None:
+        if not database_breaker.allow():
+            if stale is None:
+                raise _unavailable()
+            return stale, "circuit-open"
+        future = asyncio.ensure_future(run_in_threadpool(_guarded, load))
+        future.add_done_callback(lambda done: _load_done(key, done))
+        _loads[key] = future
+
+    if stale is None:
+        # Nothing to fall back to, so wait however long the database takes
+        try:
+            return await asyncio.shield(future), None
+        except HTTPException:
+            raise
+        except Exception:
+            raise _unavailable()
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), STALE_LATENCY_BUDGET_MS / 1000), None
+    except asyncio.TimeoutError:
+        return stale, "slow"
+    except HTTPException:
+        raise
+    except Exception:
+        return stale, "error"
+
+def record_stale(page: str, reason: str) -> None:
+    STALE_RESPONSES.labels(page=page, reason=reason).inc()
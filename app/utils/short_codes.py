@@ -0,0 +1,114 @@
+"""
+Short codes for QR URLs.
+
+Every program gets a random base62 code (SHORT_CODE_LENGTH characters,
+62^7 ~ 3.5 trillion values by default), and its QR code encodes
+{BASE_URL}/p/<code> instead of the ~90 character UUID URL. The shorter
+payload drops the QR version from 5 to 3 (37 to 29 modules a side; see
+benchmarks/qr_density.py), so each module prints larger at the same size.
+Codes are random rather than derived from the id, so they can't be
+enumerated.
+
+Codes are unique across live and archived programs. Candidates are checked
+against both tables before use and the unique index backs that up. The
+UUID URLs keep working; /p/<code> redirects to them. The redirect keeps
+guests inside the program's service worker scope, and browsers cache it for
+SHORT_LINK_MAX_AGE seconds, so a repeat scan needs no network to reach the
+page.
+"""
+from typing import List, Optional
+from sqlalchemy import bindparam, select, update
+import secrets
+import os
+
+from app.models.funeral import FuneralProgram, ArchivedProgram
+from app.utils.cache import TTLCache
+
+# Short code settings
+SHORT_CODE_LENGTH = int(os.getenv("SHORT_CODE_LENGTH", "7"))
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+SHORT_LINK_MAX_AGE = int(os.getenv("SHORT_LINK_MAX_AGE", "86400"))  # Browser cache lifetime of the /p/ redirect
+
+programs_table = FuneralProgram.__table__
+archive_table = ArchivedProgram.__table__
+
+# short_code -> qr_code_id; codes never change, so entries only expire to bound memory
+_resolved = TTLCache(maxsize=8192, ttl=86400, name="short_code")
+
+def generate_short_code(length: int = SHORT_CODE_LENGTH) -> str:
+    return "".join(secrets.choice(ALPHABET) for _ in range(length))
+
+def is_short_code(value: str) -> bool:
+    return 0 < len(value) <= 16 and all(char in ALPHABET for char in value)
+
+def taken_short_codes(conn, codes: List[str]) -> set:
+    """Which of codes already belong to a live or archived program"""
+    if not codes:
+        return set()
+    return set(conn.execute(
+        select(programs_table.c.short_code).where(programs_table.c.short_code.in_(codes))
+        .union(select(archive_table.c.short_code).where(archive_table.c.short_code.in_(codes)))
+    ).scalars())
+
+def new_short_codes(conn, count: int, reserved: Optional[set] = None) -> List[str]:
+    """count codes not used by any program, live or archived (conn is a Session or Connection)"""
+    reserved = set(reserved or ())
+    codes: List[str] = []
+    while len(codes) < count:
+        candidates = {generate_short_code() for _ in range(count - len(codes))} - reserved
+        fresh = candidates - taken_short_codes(conn, list(candidates)) if candidates else set()
+        codes.extend(fresh)
+        reserved |= candidates
+    return codes
+
+def remember(short_code: Optional[str], qr_code_id: str) -> None:
+    if short_code:
+        _resolved.set(short_code, qr_code_id)
+
+def cached(short_code: str) -> Optional[str]:
+    return _resolved.get(short_code)
+
+def resolve(db, short_code: str) -> Optional[str]:
+    """qr_code_id of the program (live or archived) with a short code, cached per worker"""
+    qr_code_id = _resolved.get(short_code)
+    if qr_code_id is None:
+        qr_code_id = db.execute(
+            select(programs_table.c.qr_code_id).where(programs_table.c.short_code == short_code)
+            .union_all(select(archive_table.c.qr_code_id).where(archive_table.c.short_code == short_code))
+        ).scalars().first()
+        if qr_code_id is not None:
+            _resolved.set(short_code, qr_code_id)
+    return qr_code_id
+
+def assign_short_codes(batch_size: int = 1000, refresh_qr: bool = False) -> int:
+    """
+    Give every live program without a short code one; returns how many were
+    assigned. With refresh_qr, a task is queued per program to re-render its
+    stored QR images against the short URL. Safe to re-run.
+    """
+    from app.database import engine
+    from app.utils.tasks import queue_qr_codes
+
+    statement = (
+        update(programs_table)
+        .where(programs_table.c.id == bindparam("program_id"), programs_table.c.short_code.is_(None))
+        .values(short_code=bindparam("new_short_code"))
+    )
+    assigned = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(programs_table.c.id, programs_table.c.qr_code_id).where(programs_table.c.short_code.is_(None))
+                .order_by(programs_table.c.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            codes = new_short_codes(conn, len(rows))
+            conn.execute(statement, [
+                {"program_id": row.id, "new_short_code": code} for row, code in zip(rows, codes)
+            ])
+            if refresh_qr:
+                for row, code in zip(rows, codes):
+                    queue_qr_codes(conn, row.qr_code_id, code)
+        assigned += len(rows)
+    return assigned
@@ -0,0 +1,178 @@
+"""
+Per-request SQL tracing.
+
+Every statement a request executes is recorded with its duration. At the end
+of the request, statements sharing one shape (same SQL text once IN-lists are
+collapsed) that ran SQL_N_PLUS_ONE_THRESHOLD times or more are reported as a
+likely N+1, statements slower than SQL_SLOW_QUERY_MS are logged with their
+bound parameters redacted, and routes that exceed their query budget are
+reported (or fail outright with SQL_STRICT_QUERY_BUDGET, meant for tests).
+With DEBUG set, responses carry a Server-Timing header with the SQL totals.
+"""
+from collections import Counter
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Optional, Tuple
+from sqlalchemy import event
+import logging
+import re
+import time
+import os
+
+from app.utils.metrics import DB_N_PLUS_ONE, DB_SLOW_QUERIES
+
+# Tracing settings
+SQL_TRACE = os.getenv("SQL_TRACE", "true").lower() in ("1", "true", "yes")
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "0"))  # Default per-route budget, 0 = none
+SQL_STRICT_QUERY_BUDGET = os.getenv("SQL_STRICT_QUERY_BUDGET", "false").lower() in ("1", "true", "yes")
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger("app.sql")
+
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a route runs more statements than its budget"""
+
+def query_budget(limit: int):
+    """Route decorator declaring how many SQL statements a request may run"""
+    def decorator(func):
+        func.__query_budget__ = limit
+        return func
+    return decorator
+
+def statement_shape(statement: str) -> str:
+    """Statement text with whitespace and IN-list lengths normalised"""
+    return _IN_LIST.sub("(?...)", _WHITESPACE.sub(" ", statement).strip())
+
+def _redact_value(value):
+    if value is None or isinstance(value, (bool, int, float, Decimal)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return f"<{type(value).__name__}>"
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__} len={len(value)}>"
+    return f"<{type(value).__name__}>"
+
+def redact_parameters(parameters):
+    """Bound parameters with strings, bytes and objects replaced by type placeholders"""
+    if isinstance(parameters, dict):
+        return {name: _redact_value(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: show the first row and how many there were
+            return [redact_parameters(parameters[0]), f"... {len(parameters)} rows"]
+        return [_redact_value(value) for value in parameters]
+    return _redact_value(parameters)
+
+class RequestTrace:
+    """Statements executed while serving one request"""
+
+    __slots__ = ("statements", "scope")
+
+    def __init__(self, scope=None):
+        self.statements: List[Tuple[str, float]] = []
+        self.scope = scope
+
+    @property
+    def query_count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def query_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated_shapes(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statement shapes executed at least threshold times, most frequent first"""
+        counts = Counter(statement_shape(statement) for statement, _ in self.statements)
+        # Repeated statements over parameter lists are chunked batch work, not per-row lazy loads
+        return [
+            (shape, count) for shape, count in counts.most_common()
+            if count >= threshold and "(?...)" not in shape
+        ]
+
+_request_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+def current_request_trace() -> Optional[RequestTrace]:
+    return _request_trace.get()
+
+def _route_label(scope) -> str:
+    return getattr(scope.get("route"), "path", "unmatched") if scope else "unmatched"
+
+def _route_budget(scope) -> int:
+    endpoint = getattr(scope.get("route"), "endpoint", None) if scope else None
+    return getattr(endpoint, "__query_budget__", SQL_QUERY_BUDGET)
+
+def instrument_sql_tracing(engine) -> None:
+    """Record statements into the current request's trace and log slow ones"""
+    if not SQL_TRACE:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["trace_start"].pop()
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.statements.append((statement, elapsed))
+        if elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+            route = _route_label(trace.scope if trace else None)
+            DB_SLOW_QUERIES.labels(route=route).inc()
+            logger.warning(
+                "Slow query (%.1f ms) on %s: %s params=%r",
+                elapsed * 1000, route, statement_shape(statement), redact_parameters(parameters)
+            )
+
+def _server_timing(trace: RequestTrace, total_seconds: float) -> bytes:
+    return (
+        f'db;dur={trace.query_seconds * 1000:.1f};desc="{trace.query_count} queries", '
+        f"total;dur={total_seconds * 1000:.1f}"
+    ).encode()
+
+class SQLTraceMiddleware:
+    """ASGI middleware that traces each request's SQL and reports fan-out problems"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not SQL_TRACE or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if DEBUG and message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", _server_timing(trace, time.perf_counter() - start))
+                ]
+            await send(message)
+
+        token = _request_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper if DEBUG else send)
+        finally:
+            _request_trace.reset(token)
+        self._report(scope, trace)
+
+    def _report(self, scope, trace: RequestTrace) -> None:
+        route = _route_label(scope)
+        for shape, count in trace.repeated_shapes():
+            DB_N_PLUS_ONE.labels(route=route).inc()
+            logger.warning("Possible N+1 on %s %s: %d x %s", scope["method"], route, count, shape)
+
+        budget = _route_budget(scope)
+        if budget and trace.query_count > budget:
+            message = f"{scope['method']} {route} ran {trace.query_count} queries (budget {budget})"
+            if SQL_STRICT_QUERY_BUDGET:
+                raise QueryBudgetExceeded(message)
+            logger.warning("Query budget exceeded: %s", message)
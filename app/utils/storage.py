@@ -0,0 +1,281 @@
+from abc import ABC, abstractmethod
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from pathlib import Path
+from typing import Iterator, Optional
+import mimetypes
+import shutil
+import uuid
+import os
+
+from app.utils.cache import TTLCache
+
+# Storage settings
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "static")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+S3_REGION = os.getenv("S3_REGION")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_URL_EXPIRES = int(os.getenv("S3_URL_EXPIRES", "3600"))
+
+# Stored files keep a public path of the form /static/<key> in the database
+PUBLIC_PREFIX = "/static/"
+
+class StorageError(Exception):
+    """Raised when a stored object is missing or the backend fails"""
+
+def key_from_url(url: Optional[str]) -> Optional[str]:
+    """Storage key for a /static/... path, or None for external URLs"""
+    if url and url.startswith(PUBLIC_PREFIX):
+        return url[len(PUBLIC_PREFIX):]
+    return None
+
+def public_path(key: str) -> str:
+    """Canonical path stored in the database for a key"""
+    return f"{PUBLIC_PREFIX}{key}"
+
+def _guess_type(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+class Storage(ABC):
+    """Blob storage for uploads, QR codes and PDFs, addressed by relative keys"""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        """Store bytes under key, replacing any existing object"""
+
+    @abstractmethod
+    def put_file(self, key: str, path: Path, content_type: Optional[str] = None) -> None:
+        """Store a local file under key; the source file may be moved"""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Return an object's bytes"""
+
+    @abstractmethod
+    def stream(self, key: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Yield an object's bytes in chunks"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether an object exists"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Delete an object; missing objects are ignored"""
+
+    @abstractmethod
+    def touch(self, key: str) -> bool:
+        """Mark an existing object as just written; False if there is no such object"""
+
+    @abstractmethod
+    def modified_at(self, key: str) -> Optional[float]:
+        """When an object was last written or touched (Unix time), None if it doesn't exist"""
+
+    @abstractmethod
+    def url(self, key: str, download_name: Optional[str] = None) -> str:
+        """URL a browser can fetch the object from"""
+
+    def file_response(self, key: str, media_type: str, filename: str) -> Response:
+        """Response delivering an object as a download"""
+        return RedirectResponse(self.url(key, download_name=filename), status_code=307)
+
+class LocalStorage(Storage):
+    """Files under a local directory, served by the /static mount"""
+
+    def __init__(self, root: str = LOCAL_STORAGE_ROOT):
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise StorageError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A temp file per writer; the prewarmer and a task worker may write the same key at once
+        temp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        try:
+            temp.write_bytes(data)
+            os.replace(temp, path)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+
+    def put_file(self, key: str, path: Path, content_type: Optional[str] = None) -> None:
+        target = self.path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # The source may be on another filesystem, where a move is a copy; the key only names a whole file
+        temp = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+        try:
+            shutil.move(str(path), str(temp))
+            os.replace(temp, target)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self.path(key).read_bytes()
+        except FileNotFoundError:
+            raise StorageError(f"Object not found: {key}")
+
+    def stream(self, key: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        try:
+            with open(self.path(key), "rb") as f:
+                while chunk := f.read(chunk_size):
+                    yield chunk
+        except FileNotFoundError:
+            raise StorageError(f"Object not found: {key}")
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def touch(self, key: str) -> bool:
+        try:
+            os.utime(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def modified_at(self, key: str) -> Optional[float]:
+        try:
+            return self.path(key).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def url(self, key: str, download_name: Optional[str] = None) -> str:
+        return public_path(key)
+
+    def file_response(self, key: str, media_type: str, filename: str) -> Response:
+        if not self.exists(key):
+            raise StorageError(f"Object not found: {key}")
+        return FileResponse(path=self.path(key), media_type=media_type, filename=filename)
+
+class S3Storage(Storage):
+    """
+    S3-compatible object store (AWS, MinIO, R2, ...).
+    Browsers fetch objects through presigned URLs so the app never proxies bytes.
+    """
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: str = S3_ENDPOINT_URL,
+                 region: str = S3_REGION, prefix: str = S3_PREFIX, url_expires: int = S3_URL_EXPIRES,
+                 client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise StorageError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        if not bucket:
+            raise StorageError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.url_expires = url_expires
+        # Reuse presigned URLs for half their lifetime so browsers can cache them
+        self._urls = TTLCache(maxsize=4096, ttl=url_expires / 2, name="presigned_url")
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _is_missing(self, error) -> bool:
+        code = getattr(error, "response", {}).get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=self._key(key), Body=data,
+            ContentType=content_type or _guess_type(key)
+        )
+
+    def put_file(self, key: str, path: Path, content_type: Optional[str] = None) -> None:
+        self.client.upload_file(
+            str(path), self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type or _guess_type(key)}
+        )
+        Path(path).unlink(missing_ok=True)
+
+    def _get_object(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                raise StorageError(f"Object not found: {key}")
+            raise
+
+    def get(self, key: str) -> bytes:
+        return self._get_object(key)["Body"].read()
+
+    def stream(self, key: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        body = self._get_object(key)["Body"]
+        try:
+            while chunk := body.read(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        self._urls.invalidate_where(lambda cached, _: cached[0] == key)
+
+    def touch(self, key: str) -> bool:
+        # Objects can't be modified in place; copying one onto itself resets its LastModified
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket, Key=self._key(key),
+                CopySource={"Bucket": self.bucket, "Key": self._key(key)},
+                MetadataDirective="REPLACE", ContentType=_guess_type(key)
+            )
+            return True
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def modified_at(self, key: str) -> Optional[float]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))["LastModified"].timestamp()
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def url(self, key: str, download_name: Optional[str] = None) -> str:
+        cache_key = (key, download_name)
+        url = self._urls.get(cache_key)
+        if url is None:
+            params = {"Bucket": self.bucket, "Key": self._key(key)}
+            if download_name:
+                params["ResponseContentDisposition"] = f'attachment; filename="{download_name}"'
+            url = self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.url_expires)
+            self._urls.set(cache_key, url)
+        return url
+
+_storage = None
+
+def get_storage() -> Storage:
+    """Configured storage backend (process-wide singleton)"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "s3":
+            _storage = S3Storage()
+        elif STORAGE_BACKEND == "local":
+            _storage = LocalStorage()
+        else:
+            raise StorageError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
@@ -0,0 +1,436 @@
+"""
+Durable background tasks.
+
+Work that doesn't have to finish before a response (QR code rendering,
+photo derivatives, obituary PDFs, deleting a removed program's files) is
+queued as a row in the tasks table. enqueue() adds the row in the caller's
+transaction, so a task exists exactly when the change that needs it was
+committed. An idempotency key makes enqueueing the same work twice a
+no-op.
+
+Workers claim due tasks one at a time. A claim is a conditional UPDATE, so
+two workers never run the same task, and it is taken with SKIP LOCKED where
+the database supports it. Failed attempts are retried with exponential
+backoff and jitter until max_attempts, then the task is marked failed and
+kept for inspection (manage.py tasks, GET /api/admin/tasks) and retry
+(manage.py retry-tasks, POST /api/admin/tasks/{id}/retry). A task whose
+worker died is taken over once its lease (TASK_LEASE seconds) expires, so
+handlers must be safe to run more than once.
+
+Each web worker runs TASK_WORKERS worker threads (default 1). Set it to 0
+and run `python manage.py run-tasks --processes N` to keep this work out of
+the web processes entirely.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import event, func, insert, or_, select, update, delete
+from sqlalchemy.orm import Session
+import multiprocessing
+import threading
+import random
+import signal
+import socket
+import time
+import uuid
+import os
+
+from app.database import engine, SessionLocal
+from app.models.funeral import ArchivedProgram, FuneralProgram, Task
+from app.utils.metrics import TASK_DURATION, TASKS_PROCESSED
+
+# Task queue settings
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "1"))  # Worker threads per web worker; 0 leaves tasks to manage.py run-tasks
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "1.0"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "5"))
+TASK_RETRY_BASE = float(os.getenv("TASK_RETRY_BASE", "5"))  # Seconds before the first retry; doubles per attempt
+TASK_RETRY_MAX = float(os.getenv("TASK_RETRY_MAX", "3600"))
+TASK_LEASE = float(os.getenv("TASK_LEASE", "600"))  # Seconds before a running task is presumed lost
+TASK_RETENTION = float(os.getenv("TASK_RETENTION", str(7 * 86400)))  # Seconds finished tasks are kept
+TASK_PDF_DELAY = float(os.getenv("TASK_PDF_DELAY", "30"))  # Lets a burst of edits settle into one rebuild
+UPLOAD_REUSE_GRACE = float(os.getenv("UPLOAD_REUSE_GRACE", "3600"))  # Seconds a re-uploaded photo is safe from cleanup
+_HOUSEKEEPING_EVERY = 60.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+tasks_table = Task.__table__
+programs_table = FuneralProgram.__table__
+archive_table = ArchivedProgram.__table__
+
+class TaskFailed(Exception):
+    """Raised by handlers for errors that retrying won't fix; the task fails without further attempts"""
+
+_handlers: Dict[str, Callable[[dict], None]] = {}
+
+def handler(kind: str):
+    """Register the function that runs tasks of kind"""
+    def register(func: Callable[[dict], None]) -> Callable[[dict], None]:
+        _handlers[kind] = func
+        return func
+    return register
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+# Enqueueing
+
+# Set once an enqueueing transaction commits, so idle workers in this process start at once
+_wake = threading.Event()
+
+def _insert_statement(dialect_name: str):
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        # A duplicate key raises IntegrityError here instead of being skipped
+        return insert(tasks_table)
+    return dialect_insert(tasks_table).on_conflict_do_nothing(index_elements=["idempotency_key"])
+
+def enqueue(
+    db, kind: str, payload: dict, *, key: Optional[str] = None,
+    delay: float = 0, max_attempts: int = TASK_MAX_ATTEMPTS
+) -> Optional[int]:
+    """
+    Queue a task in db's transaction (a Session or Connection; the caller commits).
+    Returns the new task's id, or None if a task with the same key already exists.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown task kind: {kind}")
+    dialect = db.dialect if hasattr(db, "dialect") else db.get_bind().dialect
+    result = db.execute(_insert_statement(dialect.name).values(
+        kind=kind, payload=payload, idempotency_key=key, status=QUEUED,
+        attempts=0, max_attempts=max_attempts, run_at=_now() + timedelta(seconds=delay)
+    ))
+    if result.rowcount == 0:
+        return None
+    if isinstance(db, Session):
+        db.info["tasks_enqueued"] = True
+    return result.inserted_primary_key[0]
+
+@event.listens_for(SessionLocal, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("tasks_enqueued", False):
+        _wake.set()
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_wake(session):
+    session.info.pop("tasks_enqueued", None)
+
+def queue_qr_codes(db, qr_code_id: str, short_code: Optional[str]) -> Optional[int]:
+    """Render a program's PNG and SVG QR codes"""
+    return enqueue(
+        db, "qr_codes", {"qr_code_id": qr_code_id, "short_code": short_code},
+        key=f"qr_codes:{qr_code_id}:{short_code or ''}"
+    )
+
+def queue_photo_variants(db, program_id: int, photo_url: str) -> Optional[int]:
+    """Build responsive copies of a program's photo and record them on the program"""
+    return enqueue(
+        db, "photo_variants", {"program_id": program_id, "photo_url": photo_url},
+        key=f"photo_variants:{program_id}:{photo_url}"
+    )
+
+def queue_obituary_pdf(db, program_id: int, version: int) -> Optional[int]:
+    """Rebuild the obituary PDF once edits up to version have settled"""
+    return enqueue(
+        db, "obituary_pdf", {"program_id": program_id},
+        key=f"obituary_pdf:{program_id}:{version}", delay=TASK_PDF_DELAY
+    )
+
+def queue_program_cleanup(db, program) -> Optional[int]:
+    """Delete the stored files of a program that is being deleted"""
+    from app.utils.storage import key_from_url
+
+    obituary = program.obituary
+    keys = [f"qr_codes/{program.qr_code_id}.png", f"qr_codes/{program.qr_code_id}.svg"]
+    if obituary is not None and obituary.pdf_url:
+        keys.append(key_from_url(obituary.pdf_url))
+    variant_urls = [url for sizes in (program.photo_variants or {}).values() for url in sizes.values()]
+    return enqueue(
+        db, "delete_files",
+        {"keys": [key for key in keys if key], "photo_url": program.deceased_photo_url, "variant_urls": variant_urls},
+        key=f"delete_files:{program.qr_code_id}"
+    )
+
+# Running
+
+def _backoff(attempts: int) -> float:
+    delay = min(TASK_RETRY_MAX, TASK_RETRY_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class TaskWorker:
+    """Claims and runs due tasks; one per thread or process"""
+
+    def __init__(self, name: Optional[str] = None):
+        # Unique per worker; start_workers builds every worker on the calling thread
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._housekept_at = 0.0
+
+    def claim(self):
+        """Mark the next due task as running for this worker and return it, or None"""
+        now = _now()
+        claimable = or_(
+            (tasks_table.c.status == QUEUED) & (tasks_table.c.run_at <= now),
+            # Taken over from a worker that died mid-task
+            (tasks_table.c.status == RUNNING) & (tasks_table.c.locked_at < now - timedelta(seconds=TASK_LEASE))
+            & (tasks_table.c.attempts < tasks_table.c.max_attempts),
+        )
+        with engine.begin() as conn:
+            candidates = conn.execute(
+                select(tasks_table.c.id).where(claimable)
+                .order_by(tasks_table.c.run_at, tasks_table.c.id)
+                .limit(5).with_for_update(skip_locked=True)
+            ).scalars().all()
+            for task_id in candidates:
+                # Re-checking the condition makes the claim safe without row locks (SQLite)
+                task = conn.execute(
+                    update(tasks_table)
+                    .where(tasks_table.c.id == task_id, claimable)
+                    .values(status=RUNNING, locked_by=self.name, locked_at=now, attempts=tasks_table.c.attempts + 1)
+                    .returning(tasks_table.c.id, tasks_table.c.kind, tasks_table.c.payload,
+                               tasks_table.c.attempts, tasks_table.c.max_attempts)
+                ).first()
+                if task is not None:
+                    return task
+        return None
+
+    def _finish(self, task, values: dict) -> None:
+        with engine.begin() as conn:
+            conn.execute(
+                update(tasks_table)
+                .where(tasks_table.c.id == task.id, tasks_table.c.locked_by == self.name)
+                .values(locked_by=None, locked_at=None, **values)
+            )
+
+    def run_next(self) -> bool:
+        """Run one due task; returns False when there was none"""
+        task = self.claim()
+        if task is None:
+            return False
+        start = time.perf_counter()
+        try:
+            run = _handlers.get(task.kind)
+            if run is None:
+                raise TaskFailed(f"No handler for task kind {task.kind!r}")
+            run(task.payload or {})
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if isinstance(e, TaskFailed) or task.attempts >= task.max_attempts:
+                outcome = FAILED
+                self._finish(task, {"status": FAILED, "last_error": error, "finished_at": _now()})
+            else:
+                outcome = "retry"
+                self._finish(task, {
+                    "status": QUEUED, "last_error": error,
+                    "run_at": _now() + timedelta(seconds=_backoff(task.attempts))
+                })
+            print(f"Task {task.id} ({task.kind}) attempt {task.attempts} failed: {error}")
+        else:
+            outcome = DONE
+            self._finish(task, {"status": DONE, "last_error": None, "finished_at": _now()})
+        TASK_DURATION.labels(kind=task.kind).observe(time.perf_counter() - start)
+        TASKS_PROCESSED.labels(kind=task.kind, outcome=outcome).inc()
+        return True
+
+    def housekeeping(self) -> None:
+        """Fail lost tasks that have used up their attempts and drop old finished tasks and tombstones"""
+        from app.utils.changes import prune_tombstones
+
+        now = _now()
+        with engine.begin() as conn:
+            conn.execute(
+                update(tasks_table)
+                .where(
+                    tasks_table.c.status == RUNNING,
+                    tasks_table.c.locked_at < now - timedelta(seconds=TASK_LEASE),
+                    tasks_table.c.attempts >= tasks_table.c.max_attempts,
+                )
+                .values(status=FAILED, locked_by=None, locked_at=None, finished_at=now,
+                        last_error="Worker lost while running the task")
+            )
+            conn.execute(
+                delete(tasks_table)
+                .where(tasks_table.c.status == DONE, tasks_table.c.finished_at < now - timedelta(seconds=TASK_RETENTION))
+            )
+            prune_tombstones(conn)
+
+    def run(self, stop: threading.Event) -> None:
+        """Run tasks until stop is set"""
+        while not stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+                if time.monotonic() - self._housekept_at > _HOUSEKEEPING_EVERY:
+                    self._housekept_at = time.monotonic()
+                    self.housekeeping()
+            except Exception as e:
+                print(f"Task worker {self.name} failed: {e}")
+            _wake.wait(TASK_POLL_INTERVAL)
+            _wake.clear()
+
+def start_workers(count: int = TASK_WORKERS) -> Callable[[], None]:
+    """Start count worker threads in this process; returns a function that stops them"""
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=TaskWorker().run, args=(stop,), name=f"task-worker-{n}", daemon=True)
+        for n in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+
+    def stop_workers(timeout: float = 5.0) -> None:
+        # A task still running after timeout is taken over by another worker when its lease expires
+        stop.set()
+        _wake.set()
+        for thread in threads:
+            thread.join(timeout)
+    return stop_workers
+
+def _work_until_signalled() -> None:
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+        _wake.set()
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    TaskWorker().run(stop)
+
+def run_worker_processes(processes: int = 1) -> None:
+    """Run workers in the foreground until interrupted; each finishes its current task first"""
+    if processes <= 1:
+        _work_until_signalled()
+        return
+    context = multiprocessing.get_context("spawn")
+    children = [context.Process(target=_work_until_signalled, name=f"task-worker-{n}") for n in range(processes)]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        # Ctrl-C reached the children too; wait for them to finish their current task
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.join()
+
+# Inspection and retries
+
+def task_counts(db) -> Dict[str, int]:
+    """Number of tasks per status"""
+    counts = dict(db.execute(select(tasks_table.c.status, func.count()).group_by(tasks_table.c.status)).all())
+    return {status: counts.get(status, 0) for status in STATUSES}
+
+def list_tasks(db, status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50) -> List:
+    """Most recently created tasks first"""
+    query = select(tasks_table).order_by(tasks_table.c.id.desc()).limit(limit)
+    if status:
+        query = query.where(tasks_table.c.status == status)
+    if kind:
+        query = query.where(tasks_table.c.kind == kind)
+    return db.execute(query).all()
+
+def retry_tasks(db, task_ids: Optional[List[int]] = None, kind: Optional[str] = None) -> int:
+    """
+    Run failed tasks again with a fresh set of attempts; returns how many were queued.
+    Listed task ids that are still waiting out a backoff are made due at once.
+    """
+    retryable = [FAILED, QUEUED] if task_ids else [FAILED]
+    query = update(tasks_table).where(tasks_table.c.status.in_(retryable)).values(
+        status=QUEUED, attempts=0, run_at=_now(), finished_at=None
+    )
+    if task_ids:
+        query = query.where(tasks_table.c.id.in_(task_ids))
+    if kind:
+        query = query.where(tasks_table.c.kind == kind)
+    retried = db.execute(query).rowcount
+    db.commit()
+    if retried:
+        _wake.set()
+    return retried
+
+# Task handlers
+
+@handler("qr_codes")
+def _make_qr_codes(payload: dict) -> None:
+    from app.utils.qr_generator import create_qr_code, create_qr_code_svg
+
+    create_qr_code(payload["qr_code_id"], payload.get("short_code"))
+    create_qr_code_svg(payload["qr_code_id"], payload.get("short_code"))
+
+@handler("photo_variants")
+def _make_photo_variants(payload: dict) -> None:
+    from app.utils.image_pipeline import generate_derivatives_isolated
+    from app.utils.storage import get_storage, key_from_url
+
+    photo_url = payload["photo_url"]
+    key = key_from_url(photo_url)
+    if not key or not get_storage().exists(key):
+        raise TaskFailed(f"Photo {photo_url} is not in storage")
+    variants = generate_derivatives_isolated(photo_url)
+
+    db = SessionLocal()
+    try:
+        program = db.get(FuneralProgram, payload["program_id"])
+        # The photo may have been replaced (or the program deleted) meanwhile
+        if program and program.deceased_photo_url == photo_url and program.photo_variants != variants:
+            program.photo_variants = variants
+            db.commit()
+    finally:
+        db.close()
+
+@handler("obituary_pdf")
+def _make_obituary_pdf(payload: dict) -> None:
+    from sqlalchemy.orm import selectinload
+    from app.utils.prewarm import build_pdf, current_pdf
+
+    db = SessionLocal()
+    try:
+        program = db.query(FuneralProgram).options(
+            selectinload(FuneralProgram.program_events),
+            selectinload(FuneralProgram.obituary)
+        ).filter(FuneralProgram.id == payload["program_id"]).first()
+        # Later edits queue their own rebuild; this one covers whatever version is current
+        if program is not None and program.obituary is not None and not current_pdf(program):
+            build_pdf(db, program)
+    finally:
+        db.close()
+
+@handler("delete_files")
+def _delete_files(payload: dict) -> None:
+    from app.utils.storage import get_storage, key_from_url
+
+    storage = get_storage()
+    keys = list(payload.get("keys") or [])
+    photo_url = payload.get("photo_url")
+    photo_key = key_from_url(photo_url)
+    if photo_key:
+        # Uploads are content-addressed, so another program, live or archived, may use the same
+        # photo; its variants are named after the photo, so they are shared along with it
+        with engine.connect() as conn:
+            shared = conn.execute(
+                select(programs_table.c.id).where(programs_table.c.deceased_photo_url == photo_url)
+                .union_all(select(archive_table.c.id).where(archive_table.c.deceased_photo_url == photo_url))
+                .limit(1)
+            ).first()
+        variant_urls = list(payload.get("variant_urls") or [])
+        modified_at = storage.modified_at(photo_key) if shared is None else None
+        if shared is not None:
+            pass
+        elif modified_at is not None and time.time() - modified_at < UPLOAD_REUSE_GRACE:
+            # Uploading the same photo touches it before the new program is saved, so a program
+            # that isn't visible above yet may be about to use it; look again once that's settled
+            with engine.begin() as conn:
+                enqueue(
+                    conn, "delete_files", {"photo_url": photo_url, "variant_urls": variant_urls},
+                    key=f"delete_files:{photo_url}:{modified_at}",
+                    delay=modified_at + UPLOAD_REUSE_GRACE - time.time()
+                )
+        else:
+            keys.extend(key_from_url(url) for url in [photo_url] + variant_urls)
+    for key in keys:
+        if key:
+            storage.delete(key)
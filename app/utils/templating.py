@@ -0,0 +1,89 @@
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional
+import stat
+import time
+import os
+
+from app.utils.metrics import record_template_render
+
+# Template settings
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", "templates")
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "false").lower() in ("1", "true", "yes")
+# Compiled templates are shared by every worker on the host. Unset uses Jinja's per-user
+# directory under the temp dir; a configured one must be private to this user (mode 0700).
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")
+
+class RenderStats:
+    """Accumulated render timings for one template"""
+
+    __slots__ = ("count", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+_render_stats: Dict[str, RenderStats] = {}
+_render_stats_lock = Lock()
+
+def record_render_time(name: str, seconds: float) -> None:
+    record_template_render(name, seconds)
+    with _render_stats_lock:
+        stats = _render_stats.setdefault(name, RenderStats())
+        stats.count += 1
+        stats.total_seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+
+def render_stats() -> Dict[str, dict]:
+    """Snapshot of per-template render timings"""
+    with _render_stats_lock:
+        return {
+            name: {"count": s.count, "total_seconds": s.total_seconds, "max_seconds": s.max_seconds}
+            for name, s in _render_stats.items()
+        }
+
+class TimedJinja2Templates(Jinja2Templates):
+    """Jinja2Templates that records how long each template takes to render"""
+
+    def TemplateResponse(self, *args, **kwargs):
+        # Supports both the (name, context) and (request, name, context) call styles
+        name = kwargs.get("name") or next((arg for arg in args if isinstance(arg, str)), "unknown")
+        start = time.perf_counter()
+        try:
+            return super().TemplateResponse(*args, **kwargs)
+        finally:
+            record_render_time(name, time.perf_counter() - start)
+
+def _private_dir(directory: str) -> Optional[str]:
+    """directory, created 0700 if missing, or None unless only this user can write to it"""
+    # Cached bytecode is executed when loaded, so nobody else may be able to plant files there
+    Path(directory).mkdir(mode=0o700, parents=True, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        print(f"Ignoring TEMPLATE_CACHE_DIR {directory}: it must be a directory owned by this user with mode 0700")
+        return None
+    return directory
+
+def _bytecode_cache() -> FileSystemBytecodeCache:
+    directory = _private_dir(TEMPLATE_CACHE_DIR) if TEMPLATE_CACHE_DIR else None
+    # Without a directory Jinja uses _jinja2-cache-<uid>, which it creates 0700 and checks
+    return FileSystemBytecodeCache(directory) if directory else FileSystemBytecodeCache()
+
+def _build_templates() -> TimedJinja2Templates:
+    shared = TimedJinja2Templates(directory=TEMPLATE_DIR)
+    shared.env.auto_reload = TEMPLATE_AUTO_RELOAD
+    shared.env.bytecode_cache = _bytecode_cache()
+    return shared
+
+# Single template environment shared by every router
+templates = _build_templates()
+
+def warm_templates() -> int:
+    """Compile every template up front so the first request doesn't pay for it"""
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.get_template(name)
+    return len(names)
@@ -0,0 +1,108 @@
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from pathlib import Path
+from typing import Iterable, Optional
+import tempfile
+import hashlib
+import uuid
+import os
+
+import aiofiles
+import aiofiles.os
+from starlette.concurrency import run_in_threadpool
+
+from app.utils.storage import get_storage, public_path
+
+# Upload settings
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(15 * 1024 * 1024)))
+# Room for the multipart framing and the form fields sent with the photo
+_FORM_OVERHEAD = 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Uploads are staged locally while they are streamed and hashed. Keep this outside the /static
+# mount, or unvalidated and half-written uploads could be fetched by URL.
+UPLOAD_STAGING_DIR = Path(os.getenv("UPLOAD_STAGING_DIR") or Path(tempfile.gettempdir()) / "funeral-uploads")
+
+class UploadRejected(ValueError):
+    """Raised when an upload is too large or not a supported image"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware answering 413 to uploads whose Content-Length is over the
+    limit, before the multipart body is read and spooled to disk. Bodies sent
+    without a length are still checked per file by save_photo_upload.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_size: int = MAX_UPLOAD_SIZE + _FORM_OVERHEAD):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            length = dict(scope["headers"]).get(b"content-length")
+            if length is not None and length.isdigit() and int(length) > self.max_size:
+                response = JSONResponse({"detail": "Photo is too large"}, status_code=413, headers={"Connection": "close"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+def sniff_image_extension(head: bytes) -> Optional[str]:
+    """Identify an image format from its leading bytes; returns a file extension or None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+async def save_photo_upload(upload: UploadFile, max_size: int = MAX_UPLOAD_SIZE) -> str:
+    """
+    Stream an uploaded photo into storage under uploads/<sha256>.<ext>.
+    Identical photos are stored once. Returns the public path of the stored file.
+    """
+    # Backstop for bodies the middleware couldn't check; the stream below is checked too
+    if upload.size is not None and upload.size > max_size:
+        raise UploadRejected("Photo is too large", status_code=413)
+
+    UPLOAD_STAGING_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    temp_path = UPLOAD_STAGING_DIR / f"incoming-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if extension is None:
+                    extension = sniff_image_extension(chunk)
+                    if extension is None:
+                        raise UploadRejected("Photo must be a JPEG, PNG, GIF or WebP image")
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadRejected("Photo is too large", status_code=413)
+                digest.update(chunk)
+                await buffer.write(chunk)
+
+        if extension is None:
+            raise UploadRejected("Photo is empty")
+
+        key = f"uploads/{digest.hexdigest()}.{extension}"
+        storage = get_storage()
+        # A reused photo is touched rather than rewritten: cleanup of a deleted program that shared
+        # it leaves recently touched photos alone until this upload's program has been saved
+        if not await run_in_threadpool(storage.touch, key):
+            await run_in_threadpool(storage.put_file, key, temp_path)
+        return public_path(key)
+    finally:
+        if await aiofiles.os.path.exists(temp_path):
+            await aiofiles.os.remove(temp_path)
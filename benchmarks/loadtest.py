@@ -0,0 +1,250 @@
+"""
+HTTP load test for a running instance, driven by a seeded dataset.
+
+Scenarios (closed-loop virtual users, each issuing requests back to back):
+    scan-surge   every user opens the same program page, as after a QR code is
+                 shown at a service
+    browse       users page through /api/funeral/programs
+    pdf-mixed    public program/obituary views with admins generating PDFs
+                 alongside them
+    qr-bulk      admins downloading QR codes for many programs
+    all          every scenario above, one after another
+
+Latency percentiles (p50/p95/p99) and throughput are reported per request
+type. Results are saved as JSON together with the git commit, so runs on
+different commits can be compared with --compare.
+
+Usage:
+    python benchmarks/seed.py --programs 100000
+    uvicorn main:app --workers 4 &
+    python benchmarks/loadtest.py all --users 50 --duration 30 --json results/abc123.json
+    python benchmarks/loadtest.py all --compare results/abc123.json --json results/def456.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import httpx
+except ImportError:
+    raise SystemExit("The load test needs httpx (pip install httpx)")
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MANIFEST = ROOT / "benchmarks" / "results" / "dataset.json"
+
+class Recorder:
+    """Latencies and errors per request label"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+        except httpx.HTTPError as e:
+            self.errors[label] += 1
+            self.statuses[label][type(e).__name__] += 1
+            return None
+        self.latencies[label].append(time.perf_counter() - start)
+        self.statuses[label][str(response.status_code)] += 1
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        return response
+
+def percentile(sorted_values, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    summary = {}
+    for label in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies[label])
+        summary[label] = {
+            "requests": len(values),
+            "errors": recorder.errors[label],
+            "statuses": dict(recorder.statuses[label]),
+            "throughput_rps": len(values) / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                "mean": statistics.fmean(values) * 1000 if values else 0.0,
+                "p50": percentile(values, 0.50) * 1000,
+                "p95": percentile(values, 0.95) * 1000,
+                "p99": percentile(values, 0.99) * 1000,
+                "max": values[-1] * 1000 if values else 0.0,
+            },
+        }
+    return summary
+
+async def login(client: httpx.AsyncClient, admin: dict) -> None:
+    response = await client.post(
+        "/api/admin/login", data={"username": admin["username"], "password": admin["password"]}
+    )
+    if "session_token" not in client.cookies:
+        raise SystemExit(f"Admin login failed ({response.status_code}); was the dataset seeded?")
+
+async def run_users(users: int, duration: float, user_loop) -> float:
+    """Run `users` copies of user_loop(deadline) concurrently; returns elapsed seconds"""
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(user_loop(index, deadline) for index in range(users)))
+    return time.perf_counter() - start
+
+def make_client(args, **kwargs) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    return httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits, **kwargs)
+
+# Scenarios
+
+async def scan_surge(args, manifest, recorder: Recorder) -> float:
+    qr_code_id = manifest["hot_program"]["qr_code_id"]
+    async with make_client(args) as client:
+        async def user(index, deadline):
+            while time.perf_counter() < deadline:
+                await recorder.request(client, "program_view", "GET", f"/api/funeral/program/{qr_code_id}/view")
+        return await run_users(args.users, args.duration, user)
+
+async def browse(args, manifest, recorder: Recorder) -> float:
+    pages = max(1, manifest["programs"] // args.page_size)
+    async with make_client(args) as client:
+        async def user(index, deadline):
+            rng = random.Random(args.seed + index)
+            page = rng.randrange(pages)
+            while time.perf_counter() < deadline:
+                # Mostly next-page navigation with the occasional jump
+                page = rng.randrange(pages) if rng.random() < 0.2 else (page + 1) % pages
+                await recorder.request(
+                    client, "programs_page", "GET", "/api/funeral/programs",
+                    params={"skip": page * args.page_size, "limit": args.page_size}
+                )
+        return await run_users(args.users, args.duration, user)
+
+async def pdf_mixed(args, manifest, recorder: Recorder) -> float:
+    sample = manifest["sample"]
+    admins = max(1, args.users // 10)
+    async with make_client(args) as public, make_client(args) as admin:
+        await login(admin, manifest["admin"])
+
+        async def user(index, deadline):
+            rng = random.Random(args.seed + index)
+            while time.perf_counter() < deadline:
+                program = rng.choice(sample)
+                if index < admins:
+                    await recorder.request(admin, "obituary_pdf", "GET", f"/api/admin/program/{program['id']}/obituary/pdf")
+                elif rng.random() < 0.7:
+                    await recorder.request(public, "program_view", "GET", f"/api/funeral/program/{program['qr_code_id']}/view")
+                else:
+                    await recorder.request(public, "obituary_view", "GET", f"/api/funeral/program/{program['qr_code_id']}/obituary/view")
+        return await run_users(args.users, args.duration, user)
+
+async def qr_bulk(args, manifest, recorder: Recorder) -> float:
+    sample = manifest["sample"]
+    async with make_client(args) as client:
+        await login(client, manifest["admin"])
+        cursor = iter(range(len(sample) * 1000))
+
+        async def user(index, deadline):
+            rng = random.Random(args.seed + index)
+            while time.perf_counter() < deadline:
+                program = sample[next(cursor) % len(sample)]
+                fmt = "svg" if rng.random() < 0.3 else "png"
+                await recorder.request(
+                    client, f"qr_download_{fmt}", "GET", f"/api/qr/download/{program['qr_code_id']}",
+                    params={"format": fmt}
+                )
+        return await run_users(args.users, args.duration, user)
+
+SCENARIOS = {
+    "scan-surge": scan_surge,
+    "browse": browse,
+    "pdf-mixed": pdf_mixed,
+    "qr-bulk": qr_bulk,
+}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_summary(name: str, summary: dict, baseline: dict = None) -> None:
+    print(f"\n{name}")
+    print(f"  {'request':<22}{'count':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, stats in summary.items():
+        latency = stats["latency_ms"]
+        line = (f"  {label:<22}{stats['requests']:>8}{stats['errors']:>6}{stats['throughput_rps']:>9.1f}"
+                f"{latency['p50']:>9.1f}{latency['p95']:>9.1f}{latency['p99']:>9.1f}")
+        previous = (baseline or {}).get(label)
+        if previous and previous["latency_ms"]["p95"]:
+            change = latency["p95"] / previous["latency_ms"]["p95"] - 1
+            line += f"   p95 {change:+.0%} vs baseline"
+        print(line)
+
+async def run(args) -> dict:
+    manifest = json.loads(Path(args.manifest).read_text())
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    baseline = json.loads(Path(args.compare).read_text())["scenarios"] if args.compare else {}
+
+    results = {}
+    for name in names:
+        if args.warmup:
+            await SCENARIOS[name](
+                argparse.Namespace(**{**vars(args), "duration": args.warmup}), manifest, Recorder()
+            )
+        recorder = Recorder()
+        elapsed = await SCENARIOS[name](args, manifest, recorder)
+        results[name] = summarize(recorder, elapsed)
+        print_summary(name, results[name], baseline.get(name))
+
+    return {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "base_url": args.base_url,
+        "python": platform.python_version(),
+        "settings": {
+            "users": args.users, "duration": args.duration, "warmup": args.warmup,
+            "page_size": args.page_size, "seed": args.seed,
+        },
+        "dataset": {"programs": manifest["programs"], "seed": manifest["seed"]},
+        "scenarios": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=[*SCENARIOS, "all"])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--manifest", default=str(DEFAULT_MANIFEST), help="Written by benchmarks/seed.py")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unrecorded seconds before each scenario")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare p95 latency against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        path = Path(args.json)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
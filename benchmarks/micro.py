@@ -0,0 +1,306 @@
+"""
+Component micro-benchmarks with regression thresholds.
+
+Times QR generation, PDF generation, image preparation for PDFs, password
+and token verification and Pydantic serialization in isolation. Each
+benchmark is calibrated to run for at least --min-time per repeat; the
+median per-call time over --repeats repeats and the peak memory allocated
+by one call (tracemalloc) are recorded.
+
+    python benchmarks/micro.py --save                  # record a baseline
+    python benchmarks/micro.py                         # compare against it
+    python benchmarks/micro.py -k pdf --tolerance 0.3  # only PDF benchmarks
+
+Comparing exits with status 1 when any benchmark is slower than the
+baseline by more than --tolerance or allocates more than --memory-tolerance
+above it. Baselines are machine specific: record them on the machine that
+runs the comparison (e.g. the CI runner).
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Keep generated files out of the working tree and off the real database
+os.environ["LOCAL_STORAGE_ROOT"] = tempfile.mkdtemp(prefix="funeral-bench-")
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ.setdefault("DB_URL", "sqlite:///:memory:")
+
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baselines" / "micro.json"
+
+BENCHMARKS = {}
+
+def benchmark(name: str, tolerance: float = 0.0):
+    """
+    Register a benchmark. The decorated function does its setup and returns
+    the zero-argument callable to time. tolerance loosens the time threshold
+    for benchmarks known to be noisier than the default allows.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = (setup, tolerance)
+        return setup
+    return decorator
+
+# Fixtures
+
+BIOGRAPHY_SENTENCE = (
+    "She was a devoted mother, a respected teacher and a pillar of her community, "
+    "remembered for her patience, her laughter and her unwavering faith. "
+)
+
+def _make_photo() -> str:
+    """Store a portrait with derivatives like a real upload; returns its public path"""
+    from PIL import Image, ImageDraw
+
+    from app.utils.storage import get_storage, public_path
+
+    image = Image.new("RGB", (1200, 1500), (120, 100, 90))
+    draw = ImageDraw.Draw(image)
+    for step in range(0, 1200, 40):
+        draw.ellipse((step, step, step + 300, step + 300), fill=(step % 256, 80, 200 - step % 200))
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    get_storage().put("uploads/bench-portrait.jpg", buffer.getvalue(), "image/jpeg")
+    return public_path("uploads/bench-portrait.jpg")
+
+_photo = None
+
+def photo():
+    global _photo
+    if _photo is None:
+        from app.utils.image_pipeline import generate_derivatives
+
+        url = _make_photo()
+        _photo = (url, generate_derivatives(url))
+    return _photo
+
+def make_program(events: int = 10, biography_paragraphs: int = 4, tributes: int = 3, with_photo: bool = False):
+    """Transient FuneralProgram with events and an obituary (never added to a session)"""
+    from datetime import datetime
+
+    from app.models.funeral import FuneralProgram, Obituary, ProgramEvent
+
+    photo_url, variants = photo() if with_photo else (None, None)
+    program = FuneralProgram(
+        id=1, deceased_name="Akosua Grace Mensah", date_of_birth="1941-03-02", date_of_death="2026-09-30",
+        funeral_date="2026-10-24", funeral_location="Wesley Methodist Church, Cape Coast",
+        deceased_photo_url=photo_url, photo_variants=variants,
+        qr_code_id="7b0f3e0c-52a4-4f55-9f41-1b9cf5d3c0aa", is_active=True, version=1,
+        created_at=datetime(2026, 10, 1), updated_at=None,
+    )
+    program.program_events = [
+        ProgramEvent(id=index + 1, funeral_program_id=1, time=f"{9 + index // 4:02d}:{index % 4 * 15:02d}",
+                     title=f"Order of service item {index}", description="Led by the choir",
+                     speaker_name="Rev. Owusu", order_index=index)
+        for index in range(events)
+    ]
+    program.obituary = Obituary(
+        id=1, funeral_program_id=1,
+        biography="\n".join(BIOGRAPHY_SENTENCE * 6 for _ in range(biography_paragraphs)),
+        family_details="Survived by four children and eleven grandchildren.",
+        special_message="Forever in our hearts.", photos=[],
+        tributes=[{"author": f"Friend {index}", "message": BIOGRAPHY_SENTENCE * 2} for index in range(tributes)],
+        pdf_url=None, created_at=datetime(2026, 10, 1), updated_at=None,
+    )
+    return program
+
+# Benchmarks
+
+@benchmark("qr.create_qr_code")
+def bench_qr_png():
+    from app.utils.qr_generator import create_qr_code
+    return lambda: create_qr_code("7b0f3e0c-52a4-4f55-9f41-1b9cf5d3c0aa", base_url="https://example.org")
+
+@benchmark("qr.create_qr_code_svg")
+def bench_qr_svg():
+    from app.utils.qr_generator import create_qr_code_svg
+    return lambda: create_qr_code_svg("7b0f3e0c-52a4-4f55-9f41-1b9cf5d3c0aa", base_url="https://example.org")
+
+def _pdf(**program_options):
+    from app.utils.pdf_generator import create_obituary_pdf
+
+    program = make_program(**program_options)
+    return lambda: create_obituary_pdf(program, program.obituary)
+
+@benchmark("pdf.short_bio", tolerance=0.25)
+def bench_pdf_short():
+    return _pdf(biography_paragraphs=1, tributes=0)
+
+@benchmark("pdf.long_bio", tolerance=0.25)
+def bench_pdf_long():
+    return _pdf(biography_paragraphs=60, tributes=0)
+
+@benchmark("pdf.with_photo", tolerance=0.25)
+def bench_pdf_photo():
+    return _pdf(biography_paragraphs=4, tributes=3, with_photo=True)
+
+@benchmark("pdf.many_tributes", tolerance=0.25)
+def bench_pdf_tributes():
+    return _pdf(biography_paragraphs=4, tributes=200)
+
+@benchmark("pdf.process_image_original")
+def bench_process_original():
+    from app.utils.pdf_generator import _process_image_for_pdf
+
+    url, _ = photo()
+    return lambda: _process_image_for_pdf(url)
+
+@benchmark("pdf.process_image_derivative")
+def bench_process_derivative():
+    from app.utils.image_pipeline import pick_derivative
+    from app.utils.pdf_generator import _process_image_for_pdf
+
+    _, variants = photo()
+    url = pick_derivative(variants, "jpeg", 400)
+    return lambda: _process_image_for_pdf(url)
+
+@benchmark("auth.verify_password")
+def bench_verify_password():
+    from app.utils.auth import get_password_hash, verify_password
+
+    hashed = get_password_hash("correct horse battery staple")
+    return lambda: verify_password("correct horse battery staple", hashed)
+
+@benchmark("auth.verify_token")
+def bench_verify_token():
+    from datetime import timedelta
+
+    from app.utils.auth import create_access_token, verify_token
+
+    token = create_access_token({"sub": "admin", "ver": 0}, expires_delta=timedelta(hours=1))
+    return lambda: verify_token(token)
+
+@benchmark("schema.funeral_program_list_100")
+def bench_schema_list():
+    from app.schemas.funeral import FuneralProgram as FuneralProgramSchema
+
+    programs = [make_program(events=10, tributes=5) for _ in range(100)]
+    return lambda: [FuneralProgramSchema.model_validate(program).model_dump_json() for program in programs]
+
+@benchmark("schema.public_funeral_program")
+def bench_schema_public():
+    from app.schemas.funeral import PublicFuneralProgram
+
+    program = make_program(events=12, tributes=20, biography_paragraphs=10)
+    return lambda: PublicFuneralProgram.model_validate(program).model_dump_json()
+
+# Runner
+
+def measure(func, repeats: int, min_time: float) -> dict:
+    func()  # Warm caches, lazy imports and compiled styles
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    per_call = [elapsed / number]
+    for _ in range(repeats - 1):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        per_call.append((time.perf_counter() - start) / number)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_s": statistics.median(per_call),
+        "min_s": min(per_call),
+        "iterations": number,
+        "peak_kb": peak / 1024,
+    }
+
+def compare(name: str, result: dict, baseline: dict, tolerance: float, memory_tolerance: float) -> list:
+    """Regression messages for one benchmark (empty when within thresholds)"""
+    problems = []
+    if result["median_s"] > baseline["median_s"] * (1 + tolerance):
+        problems.append(
+            f"{name}: {result['median_s'] * 1000:.3f} ms vs baseline {baseline['median_s'] * 1000:.3f} ms "
+            f"(+{result['median_s'] / baseline['median_s'] - 1:.0%}, tolerance {tolerance:.0%})"
+        )
+    # Ignore memory noise below a few KB
+    if result["peak_kb"] > baseline["peak_kb"] * (1 + memory_tolerance) + 4:
+        problems.append(
+            f"{name}: peak {result['peak_kb']:.0f} KB vs baseline {baseline['peak_kb']:.0f} KB "
+            f"(tolerance {memory_tolerance:.0%})"
+        )
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per repeat")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save", action="store_true", help="Record results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown (0.15 = 15%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10, help="Allowed peak memory growth")
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if not args.save and baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())["benchmarks"]
+
+    results, problems = {}, []
+    print(f"{'benchmark':<36}{'median ms':>12}{'peak KB':>10}{'vs base':>10}")
+    for name, (setup, extra_tolerance) in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        result = measure(setup(), args.repeats, args.min_time)
+        results[name] = result
+        change = ""
+        if name in baseline:
+            change = f"{result['median_s'] / baseline[name]['median_s'] - 1:+.0%}"
+            problems += compare(name, result, baseline[name], max(args.tolerance, extra_tolerance),
+                                args.memory_tolerance)
+        print(f"{name:<36}{result['median_s'] * 1000:>12.3f}{result['peak_kb']:>10.0f}{change:>10}")
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "bcrypt_rounds": int(os.getenv("BCRYPT_ROUNDS", "12")),
+        "benchmarks": results,
+    }
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    if args.save:
+        if baseline_path.exists():
+            # Keep entries for benchmarks that were filtered out of this run
+            report["benchmarks"] = {**json.loads(baseline_path.read_text())["benchmarks"], **results}
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"\nBaseline written to {baseline_path}")
+    elif not baseline:
+        print(f"\nNo baseline at {baseline_path}; run with --save to record one")
+
+    if problems:
+        print("\nRegressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+QR density benchmark: UUID URLs versus short /p/<code> URLs.
+
+For each URL style, reports the encoded length, the QR version the encoder
+picks (and the module count per side), the PNG and SVG sizes, and the median
+time create_qr_code / create_qr_code_svg take (render plus store).
+
+Usage:
+    python benchmarks/qr_density.py [--base-url https://memorials.example.org] [--repeats 50] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Keep generated files out of the working tree and off the real database
+os.environ["LOCAL_STORAGE_ROOT"] = tempfile.mkdtemp(prefix="funeral-bench-")
+os.environ["STORAGE_BACKEND"] = "local"
+os.environ.setdefault("DB_URL", "sqlite:///:memory:")
+
+QR_CODE_ID = "7b0f3e0c-52a4-4f55-9f41-1b9cf5d3c0aa"
+
+def measure(short_code, base_url: str, repeats: int) -> dict:
+    import qrcode
+
+    from app.utils.qr_generator import access_url, create_qr_code, create_qr_code_svg
+    from app.utils.storage import get_storage, key_from_url
+
+    url = access_url(QR_CODE_ID, short_code, base_url)
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L)
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    result = {"url": url, "url_length": len(url), "qr_version": qr.version, "modules_per_side": qr.modules_count}
+    storage = get_storage()
+    for fmt, create in (("png", create_qr_code), ("svg", create_qr_code_svg)):
+        create(QR_CODE_ID, short_code, base_url)  # Warm imports
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            path = create(QR_CODE_ID, short_code, base_url)
+            times.append(time.perf_counter() - start)
+        result[f"{fmt}_bytes"] = len(storage.get(key_from_url(path)))
+        result[f"{fmt}_median_ms"] = statistics.median(times) * 1000
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="https://memorials.example.org")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    from app.utils.short_codes import generate_short_code
+
+    results = {
+        "uuid_url": measure(None, args.base_url, args.repeats),
+        "short_url": measure(generate_short_code(), args.base_url, args.repeats),
+    }
+    before, after = results["uuid_url"], results["short_url"]
+    results["change"] = {
+        key: f"{(after[key] - before[key]) / before[key]:+.0%}"
+        for key in ("url_length", "modules_per_side", "png_bytes", "svg_bytes", "png_median_ms", "svg_median_ms")
+    }
+    print(json.dumps(results, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
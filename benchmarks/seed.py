@@ -0,0 +1,263 @@
+"""
+Seed the database with a reproducible synthetic dataset for load tests.
+
+Creates N funeral programs with 4-12 order-of-service events, an obituary
+with tributes, and a photo drawn from a small pool of generated images
+(stored content-addressed, with derivatives, exactly like real uploads).
+Rows are written with batched Core inserts so a million programs take
+minutes rather than hours. The same --seed always yields the same data.
+
+A manifest describing the dataset (admin credentials, a sample of program
+ids / QR ids and a designated "hot" program for scan surges) is written for
+benchmarks/loadtest.py.
+
+Usage:
+    python benchmarks/seed.py --programs 100000 [--seed 42] [--manifest benchmarks/results/dataset.json]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Relative paths (SQLite file, local storage) resolve as they do for the app
+os.chdir(ROOT)
+
+from dotenv import load_dotenv
+
+load_dotenv(ROOT / ".env")
+
+from sqlalchemy import func, insert, select, text
+
+from app.database import SessionLocal, engine, init_db
+from app.models.funeral import AdminUser, FuneralProgram, Obituary, ProgramEvent
+from app.utils.dates import typed_dates
+from app.utils.short_codes import ALPHABET, SHORT_CODE_LENGTH
+
+FIRST_NAMES = [
+    "Kwame", "Ama", "Kofi", "Akosua", "Yaw", "Abena", "Kojo", "Efua", "Kwabena", "Adwoa",
+    "Mary", "John", "Grace", "Samuel", "Elizabeth", "Joseph", "Comfort", "Emmanuel", "Patience", "Daniel",
+]
+LAST_NAMES = [
+    "Mensah", "Owusu", "Boateng", "Asante", "Osei", "Agyeman", "Appiah", "Darko", "Addo", "Yeboah",
+    "Smith", "Johnson", "Williams", "Brown", "Taylor", "Anderson", "Thomas", "Moore", "Martin", "Clark",
+]
+LOCATIONS = [
+    "Holy Trinity Cathedral, Accra", "St. Peter's Basilica, Kumasi", "Wesley Methodist Church, Cape Coast",
+    "Christ the King Parish, Takoradi", "Calvary Baptist Church, Tema", "Family House, Ho",
+]
+EVENT_TITLES = [
+    ("Processional Hymn", None), ("Opening Prayer", "Rev."), ("Scripture Reading", "Deacon"),
+    ("Hymn", None), ("Biography", "Family"), ("Tributes", "Children"), ("Sermon", "Rev."),
+    ("Special Song", "Choir"), ("Offertory", None), ("Vote of Thanks", "Family Head"),
+    ("Final Commendation", "Rev."), ("Recessional", None),
+]
+SENTENCES = [
+    "A devoted parent and grandparent who loved unconditionally.",
+    "Served the community for over three decades as a teacher.",
+    "Known for an infectious laugh and a generous spirit.",
+    "Never missed a Sunday service and sang in the choir for forty years.",
+    "Built a thriving family business from nothing.",
+    "Loved gardening, football and long conversations over tea.",
+    "Will be remembered for kindness to strangers and friends alike.",
+    "Travelled widely but always called home the best place on earth.",
+]
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(rng.choice(SENTENCES) for _ in range(sentences))
+
+def make_photo_pool(rng: random.Random, count: int) -> list:
+    """Generate and store `count` distinct JPEG portraits; returns [(photo_url, variants)]"""
+    from PIL import Image, ImageDraw
+
+    from app.utils.image_pipeline import generate_derivatives
+    from app.utils.storage import get_storage, public_path
+
+    storage = get_storage()
+    pool = []
+    for index in range(count):
+        image = Image.new("RGB", (1200, 1500), tuple(rng.randrange(40, 220) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randrange(1200), rng.randrange(1500)
+            radius = rng.randrange(60, 300)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        data = buffer.getvalue()
+        key = f"uploads/{hashlib.sha256(data).hexdigest()}.jpg"
+        if not storage.exists(key):
+            storage.put(key, data, "image/jpeg")
+        photo_url = public_path(key)
+        pool.append((photo_url, generate_derivatives(photo_url)))
+        print(f"  photo {index + 1}/{count}", end="\r", flush=True)
+    print()
+    return pool
+
+def ensure_admin(username: str, password: str) -> None:
+    from app.utils.auth import get_password_hash
+
+    db = SessionLocal()
+    try:
+        if not db.query(AdminUser).filter(AdminUser.username == username).first():
+            db.add(AdminUser(
+                username=username, email=f"{username}@loadtest.invalid",
+                hashed_password=get_password_hash(password), is_active=True
+            ))
+            db.commit()
+    finally:
+        db.close()
+
+def program_rows(rng: random.Random, first_id: int, count: int, photo_pool: list):
+    """Yield (program, events, obituary) row dicts"""
+    today = date.today()
+    for program_id in range(first_id, first_id + count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        born = date(1925, 1, 1) + timedelta(days=rng.randrange(365 * 80))
+        died = min(today, born + timedelta(days=rng.randrange(365 * 20, 365 * 98)))
+        funeral = died + timedelta(days=rng.randrange(7, 60))
+        photo_url, variants = rng.choice(photo_pool) if photo_pool and rng.random() < 0.85 else (None, None)
+
+        program = {
+            "id": program_id,
+            "deceased_name": name,
+            "date_of_birth": born.isoformat(),
+            "date_of_death": died.isoformat(),
+            "funeral_date": funeral.isoformat(),
+            "funeral_location": rng.choice(LOCATIONS),
+            "deceased_photo_url": photo_url,
+            "photo_variants": variants,
+            "qr_code_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "short_code": "".join(rng.choice(ALPHABET) for _ in range(SHORT_CODE_LENGTH)),
+            "is_active": rng.random() < 0.97,
+            "version": 1,
+        }
+        program.update(typed_dates(program))
+
+        events = []
+        hour, minute = 9, 0
+        for order_index, (title, speaker) in enumerate(rng.sample(EVENT_TITLES, rng.randint(4, 12))):
+            events.append({
+                "funeral_program_id": program_id,
+                "time": f"{hour:02d}:{minute:02d}",
+                "title": title,
+                "description": _paragraph(rng, 1) if rng.random() < 0.3 else None,
+                "speaker_name": f"{speaker} {rng.choice(LAST_NAMES)}" if speaker else None,
+                "order_index": order_index,
+            })
+            minute += rng.choice((10, 15, 20, 30))
+            hour, minute = hour + minute // 60, minute % 60
+
+        obituary = {
+            "funeral_program_id": program_id,
+            "biography": "\n\n".join(_paragraph(rng, rng.randint(3, 6)) for _ in range(rng.randint(2, 5))),
+            "family_details": _paragraph(rng, 2),
+            "special_message": "Forever in our hearts." if rng.random() < 0.5 else None,
+            "photos": [],
+            "tributes": [
+                {"author": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", "message": _paragraph(rng, 2)}
+                for _ in range(rng.randint(0, 8))
+            ],
+        }
+        yield program, events, obituary
+
+def seed(args) -> dict:
+    rng = random.Random(args.seed)
+    init_db()
+    ensure_admin(args.admin_username, args.admin_password)
+
+    with engine.connect() as conn:
+        first_id = (conn.execute(select(func.max(FuneralProgram.id))).scalar() or 0) + 1
+
+    print(f"Generating {args.photos} photos")
+    photo_pool = make_photo_pool(random.Random(args.seed), args.photos)
+
+    print(f"Inserting {args.programs} programs from id {first_id}")
+    start = time.perf_counter()
+    sample = []
+    programs, events, obituaries = [], [], []
+
+    def flush():
+        with engine.begin() as conn:
+            conn.execute(insert(FuneralProgram.__table__), programs)
+            conn.execute(insert(ProgramEvent.__table__), events)
+            conn.execute(insert(Obituary.__table__), obituaries)
+        programs.clear()
+        events.clear()
+        obituaries.clear()
+
+    # Reservoir sample of active programs for the load test to draw from
+    seen = 0
+    for index, (program, program_events, obituary) in enumerate(
+        program_rows(rng, first_id, args.programs, photo_pool)
+    ):
+        programs.append(program)
+        events.extend(program_events)
+        obituaries.append(obituary)
+        if program["is_active"]:
+            seen += 1
+            entry = {"id": program["id"], "qr_code_id": program["qr_code_id"]}
+            if len(sample) < args.sample_size:
+                sample.append(entry)
+            else:
+                slot = rng.randrange(seen)
+                if slot < args.sample_size:
+                    sample[slot] = entry
+        if len(programs) >= args.batch:
+            flush()
+            rate = (index + 1) / (time.perf_counter() - start)
+            print(f"  {index + 1}/{args.programs} ({rate:.0f}/s)", end="\r", flush=True)
+    if programs:
+        flush()
+    elapsed = time.perf_counter() - start
+    print(f"\nInserted {args.programs} programs in {elapsed:.1f}s")
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # Ids were assigned explicitly, so move the sequence past them
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('funeral_programs', 'id'), "
+                "(SELECT max(id) FROM funeral_programs))"
+            ))
+        total = conn.execute(select(func.count()).select_from(FuneralProgram)).scalar()
+
+    return {
+        "seed": args.seed,
+        "programs": total,
+        "seeded_programs": args.programs,
+        "admin": {"username": args.admin_username, "password": args.admin_password},
+        "hot_program": sample[0] if sample else None,
+        "sample": sample,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--programs", type=int, default=10_000, help="Programs to insert (up to 1,000,000)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch", type=int, default=2_000, help="Programs per insert transaction")
+    parser.add_argument("--photos", type=int, default=24, help="Distinct photos shared by the programs")
+    parser.add_argument("--sample-size", type=int, default=5_000, help="Programs listed in the manifest")
+    parser.add_argument("--admin-username", default="loadtest")
+    parser.add_argument("--admin-password", default="loadtest-password")
+    parser.add_argument("--manifest", default=str(ROOT / "benchmarks" / "results" / "dataset.json"))
+    args = parser.parse_args()
+    if not 0 < args.programs <= 1_000_000:
+        parser.error("--programs must be between 1 and 1,000,000")
+
+    manifest = seed(args)
+    path = Path(args.manifest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(manifest, indent=2))
+    print(f"Manifest written to {path}")
+
+if __name__ == "__main__":
+    main()
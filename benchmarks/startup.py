@@ -0,0 +1,72 @@
+"""
+Cold-start benchmark: import time and memory of a fresh worker.
+
+Each run starts a new interpreter, imports main (as uvicorn would) and
+reports wall-clock import time, peak RSS and which heavy dependencies were
+loaded eagerly.
+
+Usage:
+    python benchmarks/startup.py [--runs 10] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that should only load on first use
+HEAVY_MODULES = ["reportlab", "PIL", "qrcode", "requests", "passlib", "bcrypt", "jose", "boto3"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "import_seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+def run_once() -> dict:
+    env = dict(os.environ)
+    env.setdefault("DB_URL", "sqlite:///:memory:")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    # The first run warms the OS page cache and .pyc files
+    run_once()
+    samples = [run_once() for _ in range(args.runs)]
+    import_times = [sample["import_seconds"] for sample in samples]
+    rss = [sample["max_rss_kb"] for sample in samples]
+
+    summary = {
+        "runs": args.runs,
+        "import_seconds": {
+            "min": min(import_times),
+            "median": statistics.median(import_times),
+            "max": max(import_times),
+        },
+        "max_rss_kb": {"median": statistics.median(rss), "max": max(rss)},
+        "eagerly_loaded": samples[-1]["loaded"],
+    }
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import os
 from pathlib import Path
@@ -12,20 +13,68 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import our modules
-from app.database import engine, Base
+from app.database import init_db, engine
 from app.routers import funeral, admin, qr_codes
 from app.models import funeral as funeral_models
+from app.utils.storage import get_storage, LocalStorage
+from app.utils.templating import warm_templates
+from app.utils.invalidation import run_poller
+from app.utils.archive import ARCHIVE_INTERVAL, run_archiver
+from app.utils.prewarm import PREWARM_LEAD_MINUTES, run_prewarmer
+from app.utils.tasks import TASK_WORKERS, start_workers
+from app.utils.metrics import MetricsMiddleware, instrument_engine, render_metrics
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.sqltrace import SQLTraceMiddleware, instrument_sql_tracing
+from app.utils.uploads import UploadSizeLimitMiddleware
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Migrations run at startup unless deployments migrate explicitly (python manage.py init-db)
+INIT_DB_ON_STARTUP = os.getenv("INIT_DB_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if INIT_DB_ON_STARTUP:
+        init_db()
+    # Compile templates before the first request arrives
+    warm_templates()
+    # Drop cache entries made stale by writes on other workers
+    invalidation_task = asyncio.create_task(run_poller())
+    # Move past programs out of the hot tables (off by default; cron can run manage.py archive-programs instead)
+    archive_task = asyncio.create_task(run_archiver()) if ARCHIVE_INTERVAL > 0 else None
+    # Cache pages, QR codes and PDFs of services about to start
+    prewarm_task = asyncio.create_task(run_prewarmer()) if PREWARM_LEAD_MINUTES > 0 else None
+    # Run queued QR code, photo, PDF and cleanup tasks (TASK_WORKERS=0 leaves them to manage.py run-tasks)
+    stop_task_workers = start_workers(TASK_WORKERS) if TASK_WORKERS > 0 else None
+    yield
+    invalidation_task.cancel()
+    if archive_task:
+        archive_task.cancel()
+    if prewarm_task:
+        prewarm_task.cancel()
+    if stop_task_workers:
+        await asyncio.get_running_loop().run_in_executor(None, stop_task_workers)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Funeral Program System",
     description="A digital funeral program system with QR code access",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Request, SQL and pool metrics
+instrument_engine(engine)
+app.add_middleware(MetricsMiddleware)
+
+# Per-request SQL tracing (N+1 detection, slow queries, query budgets)
+instrument_sql_tracing(engine)
+app.add_middleware(SQLTraceMiddleware)
+
+# On-demand request profiling (X-Profile: 1 from an admin, or PROFILE_SLOW_REQUEST_MS)
+app.add_middleware(ProfilingMiddleware)
+
+# Turn away oversized photo uploads before their bodies are read
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/api/admin/create"])
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,21 +84,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create directories if they don't exist
-os.makedirs("static/uploads", exist_ok=True)
-os.makedirs("static/qr_codes", exist_ok=True)
-os.makedirs("templates", exist_ok=True)
-
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-# Templates
-templates = Jinja2Templates(directory="templates")
+storage = get_storage()
+if isinstance(storage, LocalStorage):
+    # Subdirectories are created by the storage backend on first write
+    app.mount("/static", StaticFiles(directory=str(storage.root), check_dir=False), name="static")
+else:
+    # Stored paths stay /static/<key> and pages link there: a presigned URL baked into a cached,
+    # last good or offline copy of a page would expire long before the copy does
+    @app.get("/static/{key:path}", include_in_schema=False)
+    async def static_redirect(key: str):
+        # Cached presigned URLs are handed out for half their lifetime, so this keeps the target valid
+        return RedirectResponse(
+            storage.url(key), status_code=307,
+            headers={"Cache-Control": f"private, max-age={storage.url_expires // 4}"}
+        )
 
 # Include routers
 app.include_router(funeral.router, prefix="/api/funeral", tags=["funeral"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(qr_codes.router, prefix="/api/qr", tags=["qr_codes"])
+app.include_router(funeral.short_links, tags=["funeral"])
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -90,5 +145,11 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "Funeral Program System is running"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics (aggregated across workers when PROMETHEUS_MULTIPROC_DIR is set)"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,292 @@
+"""
+Management commands for the Funeral Program System.
+
+Usage:
+    python manage.py init-db
+    python manage.py revoke-tokens admin [--deactivate]
+    python manage.py migrate-dates [--report unparsed-dates.csv]
+    python manage.py assign-short-codes [--refresh-qr]
+    python manage.py import-programs programs.csv [--pdfs] [--errors errors.csv]
+    python manage.py export-programs backup.ndjson.gz [--media-dir media/]
+    python manage.py archive-programs [--older-than-days 90] [--dry-run]
+    python manage.py restore-program 42
+    python manage.py run-tasks [--processes 2]
+    python manage.py tasks [--status failed] [--kind obituary_pdf]
+    python manage.py retry-tasks [42 43 | --all-failed] [--kind obituary_pdf]
+"""
+from pathlib import Path
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+def init_db_command(args):
+    """Run pending schema migrations"""
+    from app.database import init_db
+
+    init_db()
+    print("Database schema is up to date")
+
+def revoke_tokens_command(args):
+    """Sign an admin out everywhere, e.g. after a leaked password or when they leave"""
+    from app.database import SessionLocal
+    from app.models.funeral import AdminUser
+    from app.utils.auth import revoke_user_tokens
+
+    db = SessionLocal()
+    try:
+        user = db.query(AdminUser).filter(AdminUser.username == args.username).first()
+        if user is None:
+            raise SystemExit(f"No admin user named {args.username}")
+        revoke_user_tokens(db, user, deactivate=args.deactivate)
+    finally:
+        db.close()
+    print(f"Revoked every token of {args.username}" + (" and deactivated the account" if args.deactivate else ""))
+
+def migrate_dates_command(args):
+    """Parse the display date strings into the typed date columns"""
+    import csv
+
+    from app.database import init_db
+    from app.utils.dates import backfill_typed_dates
+
+    init_db()
+    report = open(args.report, "w", newline="", encoding="utf-8") if args.report else None
+    writer = csv.writer(report) if report else None
+    if writer:
+        writer.writerow(["program_id", "column", "value"])
+    shown = []
+
+    def on_failure(program_id, column, value):
+        if writer:
+            writer.writerow([program_id, column, value])
+        elif len(shown) < 20:
+            shown.append(f"  program {program_id} {column}: {value!r}")
+
+    try:
+        updated, failed = backfill_typed_dates(args.batch_size, on_failure=on_failure)
+    finally:
+        if report:
+            report.close()
+
+    print(f"Parsed dates for {updated} programs; {failed} values could not be parsed")
+    if report:
+        print(f"Unparsed values written to {args.report}")
+    elif shown:
+        print("\n".join(shown))
+        if failed > len(shown):
+            print("  ... use --report FILE for the full list")
+
+def import_programs_command(args):
+    """Bulk import programs from a CSV or NDJSON file"""
+    from app.utils.bulk_import import detect_format, import_programs, open_text, write_error_report
+
+    fmt, compression = detect_format(args.file)
+    fmt = args.format or fmt
+    if args.media_dir:
+        from app.utils.bulk_export import restore_media
+
+        print(f"Restored {restore_media(Path(args.media_dir))} media files")
+    on_error, close_report = write_error_report(args.errors) if args.errors else (None, None)
+
+    def progress(result):
+        print(f"  {result.rows} rows read, {result.imported} imported, {result.failed} failed", end="\r", flush=True)
+
+    try:
+        with open(args.file, "rb") as binary:
+            result = import_programs(
+                open_text(binary, compression), fmt,
+                generate_assets=not args.no_assets, generate_pdfs=args.pdfs,
+                batch_size=args.batch_size, workers=args.workers,
+                on_error=on_error, on_progress=progress
+            )
+    finally:
+        if close_report:
+            close_report()
+
+    print(f"\nImported {result.imported} of {result.rows} rows in {result.seconds:.1f}s "
+          f"({result.failed} rejected, {result.asset_failures} asset failures)")
+    if result.failed and not args.errors:
+        for error in result.errors[:20]:
+            print(f"  row {error.row}: {'; '.join(error.errors)}")
+        if result.failed > 20:
+            print("  ... use --errors FILE for the full report")
+
+def export_programs_command(args):
+    """Write every program as NDJSON, optionally compressed and with its media"""
+    from app.utils.bulk_export import COMPRESSIONS, compress_chunks, copy_media, iter_ndjson, iter_program_records, media_keys
+
+    compression = args.compression
+    if compression is None:
+        compression = next((name for name, suffix in COMPRESSIONS.items() if suffix and args.file.endswith(suffix)), "none")
+    media_dir = Path(args.media_dir) if args.media_dir else None
+    counts = {"programs": 0, "media": 0}
+
+    def records():
+        for record in iter_program_records(args.partition_size):
+            if media_dir:
+                counts["media"] += copy_media(media_keys(record), media_dir)
+            counts["programs"] += 1
+            yield record
+
+    temp = Path(f"{args.file}.partial")
+    with open(temp, "wb") as f:
+        for chunk in compress_chunks(iter_ndjson(records()), compression):
+            f.write(chunk)
+    temp.replace(args.file)
+
+    print(f"Exported {counts['programs']} programs to {args.file}"
+          + (f" and {counts['media']} media files to {media_dir}" if media_dir else ""))
+
+def archive_programs_command(args):
+    """Move programs past their funeral out of the hot tables"""
+    from app.utils.archive import archive_programs
+
+    moved = archive_programs(args.older_than_days, args.batch_size, limit=args.limit, dry_run=args.dry_run)
+    print(f"{'Would archive' if args.dry_run else 'Archived'} {moved} programs older than {args.older_than_days} days")
+
+def restore_program_command(args):
+    """Move an archived program back into the hot tables"""
+    from app.database import SessionLocal
+    from app.utils.archive import restore_program
+
+    db = SessionLocal()
+    try:
+        restored_id = restore_program(db, args.program_id)
+    finally:
+        db.close()
+    if restored_id is None:
+        raise SystemExit(f"Program {args.program_id} is not archived")
+    print(f"Restored program {args.program_id}" + (f" as {restored_id}" if restored_id != args.program_id else ""))
+
+def assign_short_codes_command(args):
+    """Give programs created before short codes one"""
+    from app.database import init_db
+    from app.utils.short_codes import assign_short_codes
+
+    init_db()
+    assigned = assign_short_codes(args.batch_size, refresh_qr=args.refresh_qr)
+    print(f"Assigned short codes to {assigned} programs")
+    if assigned and args.refresh_qr:
+        print("Their QR images are queued to be re-rendered with the short URL (see manage.py tasks)")
+
+def run_tasks_command(args):
+    """Run background task workers in the foreground"""
+    from app.database import init_db
+    from app.utils.tasks import run_worker_processes
+
+    init_db()
+    print(f"Running {args.processes} task worker process(es); Ctrl-C stops after the current tasks")
+    run_worker_processes(args.processes)
+
+def tasks_command(args):
+    """Show task counts and recent tasks"""
+    from app.database import SessionLocal
+    from app.utils.tasks import list_tasks, task_counts
+
+    db = SessionLocal()
+    try:
+        counts = task_counts(db)
+        tasks = list_tasks(db, args.status, args.kind, args.limit)
+    finally:
+        db.close()
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    for task in tasks:
+        line = f"  {task.id:>6} {task.kind:<15} {task.status:<8} attempt {task.attempts}/{task.max_attempts}"
+        if task.status == "queued" and task.attempts:
+            line += f", next at {task.run_at:%Y-%m-%d %H:%M:%S} UTC"
+        print(line + (f"  {task.idempotency_key}" if task.idempotency_key else ""))
+        if task.last_error:
+            print(f"         {task.last_error}")
+
+def retry_tasks_command(args):
+    """Queue failed tasks again"""
+    from app.database import SessionLocal
+    from app.utils.tasks import retry_tasks
+
+    if not args.task_ids and not args.all_failed:
+        raise SystemExit("Give task ids or --all-failed")
+    db = SessionLocal()
+    try:
+        retried = retry_tasks(db, args.task_ids or None, args.kind)
+    finally:
+        db.close()
+    print(f"Queued {retried} tasks again")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Funeral Program System management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    init_db_parser = subparsers.add_parser("init-db", help="Create or upgrade the database schema")
+    init_db_parser.set_defaults(func=init_db_command)
+
+    revoke_parser = subparsers.add_parser("revoke-tokens", help="Sign an admin user out on every device")
+    revoke_parser.add_argument("username")
+    revoke_parser.add_argument("--deactivate", action="store_true", help="Also stop the user from logging in again")
+    revoke_parser.set_defaults(func=revoke_tokens_command)
+
+    dates_parser = subparsers.add_parser("migrate-dates", help="Fill typed date columns from the date strings")
+    dates_parser.add_argument("--batch-size", type=int, default=1000, help="Programs updated per transaction")
+    dates_parser.add_argument("--report", help="Write a CSV of values that could not be parsed to this file")
+    dates_parser.set_defaults(func=migrate_dates_command)
+
+    codes_parser = subparsers.add_parser("assign-short-codes", help="Give existing programs short QR URLs")
+    codes_parser.add_argument("--batch-size", type=int, default=1000, help="Programs updated per transaction")
+    codes_parser.add_argument("--refresh-qr", action="store_true",
+                              help="Queue tasks re-rendering stored QR images against the short URL")
+    codes_parser.set_defaults(func=assign_short_codes_command)
+
+    import_parser = subparsers.add_parser("import-programs", help="Bulk import programs from CSV or NDJSON")
+    import_parser.add_argument("file", help=".csv, .ndjson or .jsonl, optionally .gz/.zst compressed")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"], help="Override the format implied by the filename")
+    import_parser.add_argument("--batch-size", type=int, default=500, help="Rows per insert transaction")
+    import_parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Asset generation processes")
+    import_parser.add_argument("--no-assets", action="store_true", help="Skip QR codes and photo derivatives")
+    import_parser.add_argument("--pdfs", action="store_true", help="Also generate obituary PDFs")
+    import_parser.add_argument("--errors", help="Write a CSV report of rejected rows to this file")
+    import_parser.add_argument("--media-dir", help="Upload files from an export's media directory first")
+    import_parser.set_defaults(func=import_programs_command)
+
+    export_parser = subparsers.add_parser("export-programs", help="Export every program as NDJSON")
+    export_parser.add_argument("file", help="Output file; a .gz or .zst suffix selects compression")
+    export_parser.add_argument("--compression", choices=["none", "gzip", "zstd"])
+    export_parser.add_argument("--partition-size", type=int, default=1000, help="Programs read per batch")
+    export_parser.add_argument("--media-dir", help="Also copy referenced photos into this directory")
+    export_parser.set_defaults(func=export_programs_command)
+
+    archive_parser = subparsers.add_parser("archive-programs", help="Move old programs into the archive tables")
+    archive_parser.add_argument("--older-than-days", type=int, default=int(os.getenv("ARCHIVE_AFTER_DAYS", "90")),
+                                help="Archive programs unchanged (and buried) for this many days")
+    archive_parser.add_argument("--batch-size", type=int, default=200, help="Programs moved per transaction")
+    archive_parser.add_argument("--limit", type=int, help="Stop after this many programs")
+    archive_parser.add_argument("--dry-run", action="store_true", help="Only count what would be archived")
+    archive_parser.set_defaults(func=archive_programs_command)
+
+    restore_parser = subparsers.add_parser("restore-program", help="Move an archived program back")
+    restore_parser.add_argument("program_id", type=int)
+    restore_parser.set_defaults(func=restore_program_command)
+
+    run_tasks_parser = subparsers.add_parser("run-tasks", help="Run background task workers")
+    run_tasks_parser.add_argument("--processes", type=int, default=1, help="Worker processes to run")
+    run_tasks_parser.set_defaults(func=run_tasks_command)
+
+    tasks_parser = subparsers.add_parser("tasks", help="Show background task counts and recent tasks")
+    tasks_parser.add_argument("--status", choices=["queued", "running", "done", "failed"])
+    tasks_parser.add_argument("--kind", help="e.g. qr_codes, photo_variants, obituary_pdf, delete_files")
+    tasks_parser.add_argument("--limit", type=int, default=20, help="Tasks to list")
+    tasks_parser.set_defaults(func=tasks_command)
+
+    retry_parser = subparsers.add_parser("retry-tasks", help="Queue failed background tasks again")
+    retry_parser.add_argument("task_ids", type=int, nargs="*")
+    retry_parser.add_argument("--all-failed", action="store_true", help="Retry every failed task")
+    retry_parser.add_argument("--kind", help="Only retry tasks of this kind")
+    retry_parser.set_defaults(func=retry_tasks_command)
+
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.func(args)
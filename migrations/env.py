@@ -0,0 +1,28 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.database import Base, engine
+import app.models  # noqa: F401 - registers models on Base.metadata
+
+config = context.config
+
+def run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=Base.metadata,
+        # SQLite can't alter columns or constraints in place; batch operations copy the table
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+connection = config.attributes.get("connection")
+if connection is not None:
+    # Called from init_db, which brings its own connection and transaction
+    run_migrations(connection)
+else:
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    with engine.begin() as connection:
+        run_migrations(connection)
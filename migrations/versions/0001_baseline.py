@@ -0,0 +1,85 @@
+"""Tables of the original release
+
+Databases created before migrations existed already have these and are
+stamped with this revision instead of running it (see app.database.init_db).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        "funeral_programs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("deceased_name", sa.String(255), nullable=False),
+        sa.Column("date_of_birth", sa.String(50)),
+        sa.Column("date_of_death", sa.String(50)),
+        sa.Column("funeral_date", sa.String(50), nullable=False),
+        sa.Column("funeral_location", sa.String(500), nullable=False),
+        sa.Column("deceased_photo_url", sa.String(500)),
+        sa.Column("qr_code_id", sa.String(100)),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_funeral_programs_id", "funeral_programs", ["id"])
+    op.create_index("ix_funeral_programs_qr_code_id", "funeral_programs", ["qr_code_id"], unique=True)
+
+    op.create_table(
+        "program_events",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("funeral_program_id", sa.Integer(), sa.ForeignKey("funeral_programs.id"), nullable=False),
+        sa.Column("time", sa.String(20), nullable=False),
+        sa.Column("title", sa.String(255), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("speaker_name", sa.String(255)),
+        sa.Column("order_index", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_program_events_id", "program_events", ["id"])
+
+    op.create_table(
+        "obituaries",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("funeral_program_id", sa.Integer(), sa.ForeignKey("funeral_programs.id"), nullable=False),
+        sa.Column("biography", sa.Text(), nullable=False),
+        sa.Column("family_details", sa.Text()),
+        sa.Column("special_message", sa.Text()),
+        sa.Column("photos", sa.JSON()),
+        sa.Column("tributes", sa.JSON()),
+        sa.Column("pdf_url", sa.String(500)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_obituaries_id", "obituaries", ["id"])
+
+    op.create_table(
+        "admin_users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(100), nullable=False),
+        sa.Column("email", sa.String(255), nullable=False),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("is_superuser", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_admin_users_id", "admin_users", ["id"])
+    op.create_index("ix_admin_users_username", "admin_users", ["username"], unique=True)
+    op.create_index("ix_admin_users_email", "admin_users", ["email"], unique=True)
+
+def downgrade() -> None:
+    op.drop_table("admin_users")
+    op.drop_table("obituaries")
+    op.drop_table("program_events")
+    op.drop_table("funeral_programs")
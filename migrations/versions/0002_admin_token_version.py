@@ -0,0 +1,22 @@
+"""Token versions for revoking admin sessions
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column("admin_users", sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("admin_users", sa.Column("updated_at", sa.DateTime(timezone=True)))
+
+def downgrade() -> None:
+    with op.batch_alter_table("admin_users") as batch:
+        batch.drop_column("updated_at")
+        batch.drop_column("token_version")
@@ -0,0 +1,20 @@
+"""Resized copies of program photos
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column("funeral_programs", sa.Column("photo_variants", sa.JSON()))
+
+def downgrade() -> None:
+    with op.batch_alter_table("funeral_programs") as batch:
+        batch.drop_column("photo_variants")
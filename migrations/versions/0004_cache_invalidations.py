@@ -0,0 +1,31 @@
+"""Program versions and the cross-worker invalidation log
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column("funeral_programs", sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+    op.create_table(
+        "cache_invalidations",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("scope", sa.String(50), nullable=False),
+        sa.Column("key", sa.String(100)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_cache_invalidations_id", "cache_invalidations", ["id"])
+    op.create_index("ix_cache_invalidations_created_at", "cache_invalidations", ["created_at"])
+
+def downgrade() -> None:
+    op.drop_table("cache_invalidations")
+    with op.batch_alter_table("funeral_programs") as batch:
+        batch.drop_column("version")
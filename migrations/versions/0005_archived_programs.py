@@ -0,0 +1,30 @@
+"""Archive of past programs
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        "archived_programs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("qr_code_id", sa.String(100)),
+        sa.Column("deceased_name", sa.String(255), nullable=False),
+        sa.Column("funeral_date", sa.String(50)),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_archived_programs_qr_code_id", "archived_programs", ["qr_code_id"], unique=True)
+    op.create_index("ix_archived_programs_archived_at", "archived_programs", ["archived_at"])
+
+def downgrade() -> None:
+    op.drop_table("archived_programs")
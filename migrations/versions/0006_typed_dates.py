@@ -0,0 +1,54 @@
+"""Typed copies of the display dates, filled from the existing strings
+
+python manage.py migrate-dates lists the values that couldn't be parsed.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.dates import typed_dates
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column("funeral_programs", sa.Column("born_on", sa.Date()))
+    op.add_column("funeral_programs", sa.Column("died_on", sa.Date()))
+    op.add_column("funeral_programs", sa.Column("funeral_at", sa.DateTime()))
+    op.create_index("ix_funeral_programs_funeral_at", "funeral_programs", ["funeral_at"])
+
+    programs = sa.table(
+        "funeral_programs",
+        sa.column("id", sa.Integer), sa.column("date_of_birth", sa.String), sa.column("date_of_death", sa.String),
+        sa.column("funeral_date", sa.String), sa.column("born_on", sa.Date), sa.column("died_on", sa.Date),
+        sa.column("funeral_at", sa.DateTime),
+    )
+    statement = programs.update().where(programs.c.id == sa.bindparam("program_id")).values(
+        born_on=sa.bindparam("new_born_on"), died_on=sa.bindparam("new_died_on"), funeral_at=sa.bindparam("new_funeral_at")
+    )
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(programs.c.id, programs.c.date_of_birth, programs.c.date_of_death, programs.c.funeral_date)
+            .where(programs.c.id > last_id).order_by(programs.c.id).limit(1000)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        conn.execute(statement, [
+            {"program_id": row.id, **{f"new_{name}": value for name, value in typed_dates(row._mapping).items()}}
+            for row in rows
+        ])
+
+def downgrade() -> None:
+    op.drop_index("ix_funeral_programs_funeral_at", "funeral_programs")
+    with op.batch_alter_table("funeral_programs") as batch:
+        batch.drop_column("funeral_at")
+        batch.drop_column("died_on")
+        batch.drop_column("born_on")
@@ -0,0 +1,20 @@
+"""Program version each obituary PDF was built from
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column("obituaries", sa.Column("pdf_version", sa.Integer()))
+
+def downgrade() -> None:
+    with op.batch_alter_table("obituaries") as batch:
+        batch.drop_column("pdf_version")
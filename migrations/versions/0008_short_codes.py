@@ -0,0 +1,24 @@
+"""Short codes behind the /p/<code> QR URLs
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    for table in ("funeral_programs", "archived_programs"):
+        op.add_column(table, sa.Column("short_code", sa.String(16)))
+        op.create_index(f"ix_{table}_short_code", table, ["short_code"], unique=True)
+
+def downgrade() -> None:
+    for table in ("funeral_programs", "archived_programs"):
+        op.drop_index(f"ix_{table}_short_code", table)
+        with op.batch_alter_table(table) as batch:
+            batch.drop_column("short_code")
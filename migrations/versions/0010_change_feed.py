@@ -0,0 +1,32 @@
+"""Change feed: updated_at on every program, and tombstones for removed ones
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Programs created before updated_at was set on insert get their creation time
+    op.execute("UPDATE funeral_programs SET updated_at = created_at WHERE updated_at IS NULL")
+    op.create_index("ix_funeral_programs_updated_at_id", "funeral_programs", ["updated_at", "id"])
+    op.create_table(
+        "tombstones",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("program_id", sa.Integer(), nullable=False),
+        sa.Column("qr_code_id", sa.String(100)),
+        sa.Column("reason", sa.String(20), nullable=False),
+        sa.Column("removed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tombstones_removed_at_id", "tombstones", ["removed_at", "id"])
+
+def downgrade() -> None:
+    op.drop_table("tombstones")
+    op.drop_index("ix_funeral_programs_updated_at_id", "funeral_programs")
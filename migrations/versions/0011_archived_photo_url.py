@@ -0,0 +1,45 @@
+"""Photo of each archived program, so shared uploads aren't deleted under it
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+import zlib
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column("archived_programs", sa.Column("deceased_photo_url", sa.String(500)))
+    op.create_index("ix_archived_programs_deceased_photo_url", "archived_programs", ["deceased_photo_url"])
+
+    archive = sa.table(
+        "archived_programs",
+        sa.column("id", sa.Integer), sa.column("payload", sa.LargeBinary), sa.column("deceased_photo_url", sa.String),
+    )
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(archive.c.id, archive.c.payload).where(archive.c.id > last_id).order_by(archive.c.id).limit(500)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        for row in rows:
+            # Payloads are zlib-compressed JSON documents (see app.utils.archive.pack)
+            program = json.loads(zlib.decompress(row.payload))["program"]
+            conn.execute(
+                archive.update().where(archive.c.id == row.id)
+                .values(deceased_photo_url=program.get("deceased_photo_url") or "")
+            )
+
+def downgrade() -> None:
+    op.drop_index("ix_archived_programs_deceased_photo_url", "archived_programs")
+    with op.batch_alter_table("archived_programs") as batch:
+        batch.drop_column("deceased_photo_url")
@@ -0,0 +1,40 @@
+"""Never reuse program ids, which archived rows, tombstones and the change feed refer to
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if conn.dialect.name != "sqlite":
+        # Serial/identity columns never hand out an id twice
+        return
+
+    # SQLite reuses the highest id once that row is deleted unless the table is AUTOINCREMENT,
+    # which can only be set by rebuilding it
+    with op.batch_alter_table("funeral_programs", recreate="always", table_kwargs={"sqlite_autoincrement": True}):
+        pass
+
+    # Start past every id already handed out, including programs that have since left the table
+    last_id = conn.execute(sa.text(
+        "SELECT MAX(id) FROM ("
+        " SELECT MAX(id) AS id FROM funeral_programs"
+        " UNION ALL SELECT MAX(id) FROM archived_programs"
+        " UNION ALL SELECT MAX(program_id) FROM tombstones)"
+    )).scalar() or 0
+    conn.execute(sa.text("DELETE FROM sqlite_sequence WHERE name = 'funeral_programs'"))
+    conn.execute(sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES ('funeral_programs', :seq)"), {"seq": last_id})
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table("funeral_programs", recreate="always", table_kwargs={"sqlite_autoincrement": False}):
+        pass
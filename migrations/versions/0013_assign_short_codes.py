@@ -0,0 +1,67 @@
+"""Short codes for programs created before them, with their QR images queued for re-rendering
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+import secrets
+
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+# As in app.utils.short_codes, frozen here so later changes there don't alter this migration
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+LENGTH = 7
+
+def upgrade() -> None:
+    programs = sa.table(
+        "funeral_programs",
+        sa.column("id", sa.Integer), sa.column("qr_code_id", sa.String), sa.column("short_code", sa.String),
+    )
+    archive = sa.table("archived_programs", sa.column("short_code", sa.String))
+    tasks = sa.table(
+        "tasks",
+        sa.column("kind", sa.String), sa.column("payload", sa.JSON), sa.column("idempotency_key", sa.String),
+        sa.column("status", sa.String), sa.column("attempts", sa.Integer), sa.column("max_attempts", sa.Integer),
+        sa.column("run_at", sa.DateTime),
+    )
+    conn = op.get_bind()
+    while True:
+        rows = conn.execute(
+            sa.select(programs.c.id, programs.c.qr_code_id).where(programs.c.short_code.is_(None))
+            .order_by(programs.c.id).limit(500)
+        ).all()
+        if not rows:
+            break
+
+        codes = set()
+        while len(codes) < len(rows):
+            candidates = {"".join(secrets.choice(ALPHABET) for _ in range(LENGTH)) for _ in range(len(rows) - len(codes))}
+            taken = conn.execute(
+                sa.select(programs.c.short_code).where(programs.c.short_code.in_(candidates))
+                .union(sa.select(archive.c.short_code).where(archive.c.short_code.in_(candidates)))
+            ).scalars()
+            codes |= candidates - set(taken)
+        codes = list(codes)
+
+        for row, code in zip(rows, codes):
+            conn.execute(programs.update().where(programs.c.id == row.id).values(short_code=code))
+        # Stored QR images still encode the UUID URL, which keeps working; the task workers
+        # re-render them against the short URL (see app.utils.tasks.queue_qr_codes)
+        conn.execute(tasks.insert(), [
+            {
+                "kind": "qr_codes", "payload": {"qr_code_id": row.qr_code_id, "short_code": code},
+                "idempotency_key": f"qr_codes:{row.qr_code_id}:{code}", "status": "queued",
+                "attempts": 0, "max_attempts": 5, "run_at": datetime.utcnow(),
+            }
+            for row, code in zip(rows, codes)
+        ])
+
+def downgrade() -> None:
+    # Codes may be printed on cards by now; leave them in place
+    pass
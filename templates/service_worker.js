@@ -0,0 +1,123 @@
+// Offline support for one program's public pages (see app/utils/offline.py).
+// Registered with the program's URL prefix as its scope; the offline bundle
+// is listed in the program's manifest.webmanifest.
+const CACHE = "funeral-programs-{{ version }}";
+const MANIFEST = new URL("manifest.webmanifest", self.registration.scope).href;
+const FRESH_FOR = 60 * 1000;       // Serve cached pages without asking the server for this long
+const NETWORK_TIMEOUT = 3000;      // Then give the network this long before falling back to the cache
+
+self.addEventListener("install", (event) => {
+    event.waitUntil(precache().catch(() => {}).then(() => self.skipWaiting()));
+});
+
+self.addEventListener("activate", (event) => {
+    event.waitUntil(
+        caches.keys()
+            .then((keys) => Promise.all(
+                keys.filter((key) => key.startsWith("funeral-programs-") && key !== CACHE).map((key) => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener("fetch", (event) => {
+    const request = event.request;
+    if (request.method !== "GET") {
+        return;
+    }
+    const url = new URL(request.url);
+    if (url.searchParams.has("v") || request.destination === "image") {
+        // Versioned URLs (the PDF) and photos never change in place
+        event.respondWith(serveAsset(request));
+    // The live update stream goes straight to the network
+    } else if (request.url.startsWith(self.registration.scope) && !/\/(sw\.js|live)$/.test(url.pathname)) {
+        event.respondWith(servePage(event));
+    }
+});
+
+// Copy of a response that remembers when it was fetched
+async function stamped(response) {
+    const headers = new Headers(response.headers);
+    headers.set("X-Fetched-At", String(Date.now()));
+    return new Response(await response.blob(), {status: response.status, statusText: response.statusText, headers});
+}
+
+// Fetch url, revalidating the cached copy by ETag; resolves to true if the cache changed
+async function refresh(cache, url) {
+    const cached = await cache.match(url);
+    const headers = new Headers();
+    const etag = cached && cached.headers.get("ETag");
+    if (etag) {
+        headers.set("If-None-Match", etag);
+    }
+    const sameOrigin = new URL(url).origin === self.location.origin;
+    const response = await fetch(url, {headers, cache: "no-store", mode: sameOrigin ? "same-origin" : "no-cors"});
+    if (response.status === 304 && cached) {
+        await cache.put(url, await stamped(cached));
+        return false;
+    }
+    if (response.type === "opaque") {
+        await cache.put(url, response);
+        return true;
+    }
+    if (!response.ok) {
+        throw new Error(`${url}: ${response.status}`);
+    }
+    await cache.put(url, await stamped(response));
+    return true;
+}
+
+// Cache the manifest and every URL in its offline bundle; one failure doesn't stop the rest
+async function precache() {
+    const cache = await caches.open(CACHE);
+    await refresh(cache, MANIFEST);
+    const manifest = await (await cache.match(MANIFEST)).json();
+    const urls = manifest.offline.urls.map((url) => new URL(url, self.location).href);
+    await Promise.allSettled(urls.map((url) => refresh(cache, url)));
+}
+
+function timeout(ms) {
+    return new Promise((_, reject) => setTimeout(() => reject(new Error("timeout")), ms));
+}
+
+// Program pages and manifest: cache first while fresh, then revalidate with a timeout
+async function servePage(event) {
+    const url = event.request.url;
+    const cache = await caches.open(CACHE);
+    const cached = await cache.match(url);
+    if (cached && Date.now() - Number(cached.headers.get("X-Fetched-At") || 0) < FRESH_FOR) {
+        return cached;
+    }
+    if (!cached) {
+        return fetch(event.request);
+    }
+    // A changed page may come with a new photo or PDF, so refresh the bundle too
+    const revalidation = refresh(cache, url);
+    event.waitUntil(revalidation.then((changed) => changed && url !== MANIFEST ? precache() : null).catch(() => {}));
+    try {
+        await Promise.race([revalidation, timeout(NETWORK_TIMEOUT)]);
+    } catch (error) {
+        return cached;
+    }
+    return (await cache.match(url)) || cached;
+}
+
+// Photos and the PDF: cache first; offline, any photo that isn't cached falls back to the bundle's photo
+async function serveAsset(request) {
+    const cache = await caches.open(CACHE);
+    const cached = await cache.match(request.url);
+    if (cached) {
+        return cached;
+    }
+    try {
+        return await fetch(request);
+    } catch (error) {
+        const manifest = await cache.match(MANIFEST);
+        const photo = manifest && (await manifest.json()).offline.photo;
+        const fallback = photo && await cache.match(new URL(photo, self.location).href);
+        if (fallback) {
+            return fallback;
+        }
+        throw error;
+    }
+}
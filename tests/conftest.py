@@ -0,0 +1,36 @@
+import os
+import tempfile
+
+# app.database binds its engine on import, so point it (and stored files) at a throwaway directory first
+_scratch = tempfile.mkdtemp(prefix="funeral-tests-")
+os.environ.setdefault("DB_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("LOCAL_STORAGE_ROOT", f"{_scratch}/static")
+
+import pytest
+
+@pytest.fixture
+def db():
+    from app.database import SessionLocal, init_db
+
+    init_db()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def admin_client(db):
+    """Test client signed in as a fresh admin; the app's lifespan (poller, task workers) isn't run"""
+    from fastapi.testclient import TestClient
+
+    import main
+    from app.models.funeral import AdminUser
+    from app.utils.auth import create_access_token
+
+    username = f"admin-{os.urandom(4).hex()}"
+    db.add(AdminUser(username=username, email=f"{username}@example.com", hashed_password="-", is_active=True))
+    db.commit()
+    client = TestClient(main.app)
+    client.cookies.set("session_token", create_access_token(data={"sub": username, "ver": 0}))
+    return client
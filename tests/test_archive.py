@@ -0,0 +1,41 @@
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from app.models.funeral import ArchivedProgram, FuneralProgram, Tombstone
+from app.utils.archive import archive_programs
+
+def _new_program(db):
+    program = FuneralProgram(
+        deceased_name="Jane Doe", funeral_date="2020-01-01", funeral_location="Chapel",
+        qr_code_id=f"test-{os.urandom(6).hex()}"
+    )
+    db.add(program)
+    db.commit()
+    return program.id
+
+def _age(db, program_id):
+    long_ago = datetime.utcnow() - timedelta(days=365)
+    db.execute(
+        update(FuneralProgram.__table__)
+        .where(FuneralProgram.__table__.c.id == program_id)
+        .values(created_at=long_ago, updated_at=long_ago, funeral_at=long_ago)
+    )
+    db.commit()
+
+def test_archived_program_ids_are_not_reused(db):
+    first = _new_program(db)
+    _age(db, first)
+    assert archive_programs() == 1
+
+    # The newest program just left the table; its id must not be handed out again
+    second = _new_program(db)
+    assert second > first
+    _age(db, second)
+    assert archive_programs() == 1
+
+    archived = db.execute(select(ArchivedProgram.id).where(ArchivedProgram.id.in_([first, second]))).scalars().all()
+    assert sorted(archived) == [first, second]
+    tombstones = db.execute(select(Tombstone.program_id).where(Tombstone.program_id.in_([first, second]))).scalars().all()
+    assert sorted(tombstones) == [first, second]
@@ -0,0 +1,110 @@
+import os
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text, update
+
+import main
+from app.models.funeral import FuneralProgram
+from app.utils import changes
+from app.utils.archive import archive_programs, restore_program
+from app.utils.changes import changes_since, decode_cursor, encode_cursor
+
+def _new_program(db, name="Jane Doe"):
+    program = FuneralProgram(
+        deceased_name=name, funeral_date="2099-01-01", funeral_location="Chapel",
+        qr_code_id=f"test-{os.urandom(6).hex()}"
+    )
+    db.add(program)
+    db.commit()
+    return program.id
+
+def _stamp(db, program_id, at: str):
+    # Written in the database's own CURRENT_TIMESTAMP format, as the app's writes are
+    db.execute(text("UPDATE funeral_programs SET updated_at = :at WHERE id = :id"), {"at": at, "id": program_id})
+    db.commit()
+
+def _poll_to_end(db, cursor=None):
+    """Programs and removals sent until caught up, and the cursor for the next poll"""
+    seen, removed = [], []
+    while True:
+        page = changes_since(db, cursor, limit=50)
+        seen.extend(page["programs"])
+        removed.extend(page["removed"])
+        cursor = page["cursor"]
+        if not page["has_more"]:
+            return seen, removed, cursor
+
+def _removal_cursor(since: timedelta):
+    # Programs from the beginning; removals from a moment ago
+    return encode_cursor(None, (datetime.utcnow() - since, 0))
+
+def test_pages_in_updated_at_then_id_order(db):
+    first, second, third = (_new_program(db, name) for name in ("First", "Second", "Third"))
+    _stamp(db, third, "2001-01-01 00:00:01")
+    _stamp(db, first, "2001-01-01 00:00:02")
+    _stamp(db, second, "2001-01-01 00:00:02")  # Same time: ordered by id
+    cursor = encode_cursor((datetime(2001, 1, 1), 0), None)
+
+    page = changes_since(db, cursor, limit=2)
+    assert [program.id for program in page["programs"]] == [third, first]
+    assert page["has_more"]
+    assert decode_cursor(page["cursor"])[0] == (datetime(2001, 1, 1, 0, 0, 2), first)
+
+    page = changes_since(db, page["cursor"], limit=2)
+    assert page["programs"][0].id == second
+    assert third not in [program.id for program in page["programs"]]
+
+def test_changes_within_the_settle_horizon_are_sent_again(db):
+    program_id = _new_program(db)
+    seen, _, cursor = _poll_to_end(db)
+    assert program_id in [program.id for program in seen]
+    # Caught up: the cursor stays at the horizon rather than the newest row sent
+    horizon = decode_cursor(cursor)[0][0]
+    assert horizon <= datetime.utcnow() - timedelta(seconds=changes.FEED_SETTLE_SECONDS - 1)
+
+    # A transaction that stamped its row before the last poll but committed after it
+    late = _new_program(db, "Committed late")
+    db.execute(text("UPDATE funeral_programs SET updated_at = datetime('now', '-5 seconds') WHERE id = :id"), {"id": late})
+    db.commit()
+
+    seen, _, _ = _poll_to_end(db, cursor)
+    assert {program_id, late} <= {program.id for program in seen}
+
+def test_deleted_and_archived_programs_are_removals(db, admin_client):
+    cursor = _removal_cursor(timedelta(minutes=1))
+    deleted = _new_program(db, "Deleted")
+    archived = _new_program(db, "Archived")
+    inactive = _new_program(db, "Unpublished")
+    db.execute(update(FuneralProgram.__table__).where(FuneralProgram.__table__.c.id == inactive).values(is_active=False))
+    db.commit()
+
+    assert admin_client.post(f"/api/admin/program/{deleted}/delete", follow_redirects=False).status_code == 303
+    long_ago = datetime.utcnow() - timedelta(days=365)
+    db.execute(
+        update(FuneralProgram.__table__).where(FuneralProgram.__table__.c.id == archived)
+        .values(created_at=long_ago, updated_at=long_ago, funeral_at=long_ago)
+    )
+    db.commit()
+    assert archive_programs() >= 1
+
+    _, removed, _ = _poll_to_end(db, cursor)
+    removed = {entry["id"]: entry["reason"] for entry in removed}
+    assert removed[deleted] == "deleted"
+    assert removed[archived] == "archived"
+    assert removed[inactive] == "inactive"
+
+    # Restored programs are back in the list rather than removed
+    assert restore_program(db, archived) == archived
+    seen, removed, _ = _poll_to_end(db, cursor)
+    assert archived not in {entry["id"] for entry in removed}
+    assert archived in {program.id for program in seen}
+
+def test_expired_and_invalid_cursors(db):
+    client = TestClient(main.app)
+    expired = _removal_cursor(timedelta(days=changes.FEED_TOMBSTONE_RETENTION_DAYS + 1))
+    response = client.get("/api/funeral/programs/changes", params={"cursor": expired})
+    assert response.status_code == 410
+
+    assert client.get("/api/funeral/programs/changes", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/funeral/programs/changes").status_code == 200
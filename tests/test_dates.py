@@ -0,0 +1,28 @@
+from datetime import date, datetime, timezone
+
+from app.utils.dates import parse_date, parse_datetime
+
+def _local(year, month, day, hour, minute):
+    return datetime(year, month, day, hour, minute, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def test_iso_with_offset_or_z_becomes_local_time():
+    assert parse_datetime("2026-10-20T10:00:00Z") == _local(2026, 10, 20, 10, 0)
+    assert parse_datetime("2026-10-20T10:00:00+00:00") == _local(2026, 10, 20, 10, 0)
+    assert parse_datetime("2026-10-20T12:30:00+02:00") == _local(2026, 10, 20, 10, 30)
+    assert parse_datetime("2026-10-20T10:00:00.123456z") == _local(2026, 10, 20, 10, 0).replace(microsecond=123456)
+
+def test_naive_iso_is_kept_as_is():
+    assert parse_datetime("2026-10-20T10:00:00") == datetime(2026, 10, 20, 10, 0)
+    assert parse_datetime("2026-10-20 10:00") == datetime(2026, 10, 20, 10, 0)
+    assert parse_datetime("2026-10-20") == datetime(2026, 10, 20)
+
+def test_free_form_dates():
+    assert parse_datetime("Saturday, 24th October 2026 at 10:00 AM") == datetime(2026, 10, 24, 10, 0)
+    assert parse_datetime("October 24, 2026 2pm") == datetime(2026, 10, 24, 14, 0)
+    assert parse_date("24/10/2026") == date(2026, 10, 24)
+
+def test_unparseable_and_out_of_range():
+    assert parse_datetime("next Tuesday") is None
+    assert parse_datetime("") is None
+    assert parse_datetime(None) is None
+    assert parse_datetime("0999-01-01T00:00:00Z") is None
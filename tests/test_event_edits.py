@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from app.models.funeral import FuneralProgram, ProgramEvent
+
+@pytest.fixture
+def program(db):
+    program = FuneralProgram(
+        deceased_name="Jane Doe", funeral_date="2026-11-01", funeral_location="Chapel",
+        qr_code_id=f"test-{os.urandom(6).hex()}",
+        program_events=[
+            ProgramEvent(time="10:00", title="Welcome", order_index=1),
+            ProgramEvent(time="10:15", title="Hymn", order_index=2),
+            ProgramEvent(time="10:30", title="Eulogy", speaker_name="John", order_index=3),
+        ]
+    )
+    db.add(program)
+    db.commit()
+    return program
+
+def _events(client, program_id):
+    response = client.get(f"/api/admin/program/{program_id}/events")
+    assert response.status_code == 200
+    return response.json()
+
+def test_mixed_create_update_delete_and_reorder(admin_client, program):
+    state = _events(admin_client, program.id)
+    welcome, hymn, eulogy = state["events"]
+
+    response = admin_client.put(f"/api/admin/program/{program.id}/events", json={
+        "version": state["version"],
+        "events": [
+            {"id": eulogy["id"], "title": "Eulogy by John"},
+            {"time": "10:40", "title": "Closing prayer"},
+            {"id": welcome["id"]},
+        ],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["version"] == state["version"] + 1
+    assert [(e["title"], e["order_index"]) for e in body["events"]] == [
+        ("Eulogy by John", 1), ("Closing prayer", 2), ("Welcome", 3)
+    ]
+    # Fields left out keep their values; the event left out is deleted
+    assert body["events"][0]["speaker_name"] == "John"
+    assert hymn["id"] not in [e["id"] for e in body["events"]]
+    assert _events(admin_client, program.id) == body
+
+def test_stale_version_is_rejected(admin_client, program):
+    state = _events(admin_client, program.id)
+    first = admin_client.put(f"/api/admin/program/{program.id}/events", json={"version": state["version"], "events": []})
+    assert first.status_code == 200
+
+    stale = admin_client.put(f"/api/admin/program/{program.id}/events", json={
+        "version": state["version"], "events": [{"time": "11:00", "title": "Too late"}]
+    })
+    assert stale.status_code == 409
+    assert stale.json()["detail"]["current_version"] == first.json()["version"]
+    assert _events(admin_client, program.id)["events"] == []
+
+def test_foreign_event_ids_change_nothing(admin_client, program, db):
+    other = FuneralProgram(
+        deceased_name="Someone Else", funeral_date="2026-11-02", funeral_location="Hall",
+        qr_code_id=f"test-{os.urandom(6).hex()}",
+        program_events=[ProgramEvent(time="09:00", title="Theirs", order_index=1)]
+    )
+    db.add(other)
+    db.commit()
+    state = _events(admin_client, program.id)
+
+    for foreign_id in (other.program_events[0].id, 10 ** 9):
+        response = admin_client.put(f"/api/admin/program/{program.id}/events", json={
+            "version": state["version"],
+            "events": [{"time": "10:00", "title": "New"}, {"id": foreign_id, "title": "Taken"}],
+        })
+        assert response.status_code == 422
+
+    # Neither the version nor any event moved, so the original version still applies
+    assert _events(admin_client, program.id) == state
+    assert _events(admin_client, other.id)["events"][0]["title"] == "Theirs"
+
+def test_unknown_program(admin_client):
+    response = admin_client.put("/api/admin/program/999999/events", json={"version": 1, "events": [{"id": 1}]})
+    assert response.status_code == 404
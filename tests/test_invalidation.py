@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.database import SessionLocal, init_db
+from app.models.funeral import FuneralProgram
+from app.utils import page_cache
+from app.utils.invalidation import InvalidationPoller, register_listener
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Runs in a separate process, like a write handled by another worker
+RENAME = """
+import sys
+from app.database import SessionLocal
+from app.models.funeral import FuneralProgram
+import app.utils.invalidation  # Registers the write hooks, as the app does on startup
+
+db = SessionLocal()
+db.get(FuneralProgram, int(sys.argv[1])).deceased_name = "Renamed elsewhere"
+db.commit()
+"""
+
+_invalidated = []
+register_listener("program", _invalidated.append)
+
+@pytest.fixture
+def program():
+    init_db()
+    db = SessionLocal()
+    program = FuneralProgram(
+        deceased_name="Jane Doe", funeral_date="2026-11-01", funeral_location="Chapel",
+        qr_code_id=f"test-{os.urandom(6).hex()}"
+    )
+    db.add(program)
+    db.commit()
+    db.refresh(program)
+    db.expunge(program)
+    db.close()
+    _invalidated.clear()
+    return program
+
+def _write_in_other_process(program_id: int) -> None:
+    subprocess.run(
+        [sys.executable, "-c", RENAME, str(program_id)],
+        cwd=ROOT, env={**os.environ, "PYTHONPATH": str(ROOT)}, check=True
+    )
+
+def test_write_in_other_process_reaches_listeners(program):
+    poller = InvalidationPoller()
+    poller.poll()  # Starts from the current end of the log
+
+    _write_in_other_process(program.id)
+
+    # Nothing reaches this process until it polls
+    assert _invalidated == []
+    assert poller.poll() >= 1
+    assert str(program.id) in _invalidated
+
+    db = SessionLocal()
+    try:
+        assert db.get(FuneralProgram, program.id).version > program.version
+    finally:
+        db.close()
+
+def test_write_in_other_process_drops_cached_page(program):
+    poller = InvalidationPoller()
+    poller.poll()
+    page_cache.store(page_cache.generation(), program, "program", b"<html>Jane Doe</html>")
+    assert page_cache.cached(program.qr_code_id, "program") is not None
+
+    _write_in_other_process(program.id)
+
+    assert page_cache.cached(program.qr_code_id, "program") is not None
+    assert poller.poll() >= 1
+    assert page_cache.cached(program.qr_code_id, "program") is None
+    # The last good copy is kept for outages
+    assert page_cache.last_good(program.qr_code_id, "program") is not None
+
+def test_each_poller_sees_the_write_once(program):
+    first, second = InvalidationPoller(), InvalidationPoller()
+    first.poll()
+    second.poll()
+
+    _write_in_other_process(program.id)
+
+    assert first.poll() >= 1
+    assert second.poll() >= 1
+    assert first.poll() == 0
+    assert second.poll() == 0
+
+def test_render_outdated_by_its_own_program_only(program):
+    token = page_cache.generation()
+    # Another program changing mid-render doesn't stop this page being cached
+    page_cache._program_invalidated(str(program.id + 1000))
+    page_cache.store(token, program, "snapshot", b"{}")
+    assert page_cache.cached(program.qr_code_id, "snapshot") is not None
+
+    token = page_cache.generation()
+    page_cache._program_invalidated(str(program.id))
+    page_cache.store(token, program, "program", b"<html>Jane Doe</html>")
+    assert page_cache.cached(program.qr_code_id, "program") is None
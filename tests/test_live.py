@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+
+import pytest
+from sqlalchemy import update
+
+from app.models.funeral import FuneralProgram, ProgramEvent
+from app.utils.live import LIVE_QUEUE_SIZE, LiveHub, event_dicts, revision
+
+@pytest.fixture
+def program(db):
+    program = FuneralProgram(
+        deceased_name="Jane Doe", funeral_date="2026-11-01", funeral_location="Chapel",
+        qr_code_id=f"test-{os.urandom(6).hex()}",
+        program_events=[
+            ProgramEvent(time="10:00", title="Welcome", order_index=1),
+            ProgramEvent(time="10:15", title="Hymn", order_index=2),
+        ]
+    )
+    db.add(program)
+    db.commit()
+    return program
+
+def _current_rev(program):
+    return revision(event_dicts(program.program_events))
+
+async def _next(stream):
+    """The next message as (event, data), skipping the retry line"""
+    while True:
+        chunk = (await asyncio.wait_for(stream.__anext__(), 5)).decode("utf-8")
+        if not chunk.startswith("retry:"):
+            fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+            return fields["event"], json.loads(fields["data"])
+
+async def _changed(hub, program_id):
+    # What the invalidation listener does once the change commits
+    hub._changed(str(program_id))
+    await asyncio.sleep(0)
+
+def test_change_is_sent_as_a_diff(db, program):
+    async def scenario():
+        hub = LiveHub()
+        stream = await hub.subscribe(program.qr_code_id, _current_rev(program))
+        # Up to date: only the retry line until something changes
+        assert (await stream.__anext__()).startswith(b"retry:")
+
+        welcome, hymn = sorted(program.program_events, key=lambda event: event.order_index)
+        hymn.title = "Amazing Grace"
+        db.delete(welcome)
+        db.add(ProgramEvent(funeral_program_id=program.id, time="10:30", title="Eulogy", order_index=3))
+        db.commit()
+        await _changed(hub, program.id)
+
+        kind, data = await _next(stream)
+        assert kind == "diff"
+        assert data["remove"] == [welcome.id]
+        assert [event["title"] for event in data["upsert"]] == ["Amazing Grace", "Eulogy"]
+        assert data["order"][0] == hymn.id
+        await stream.aclose()
+        assert hub.connections == 0 and not hub._channels
+
+    asyncio.run(scenario())
+
+def test_outdated_or_lagging_viewers_get_the_whole_list(db, program):
+    async def scenario():
+        hub = LiveHub()
+        stream = await hub.subscribe(program.qr_code_id, "stale")
+        kind, data = await _next(stream)
+        assert kind == "snapshot"
+        assert data["rev"] == _current_rev(program)
+
+        channel = hub._channels[program.id]
+        for index in range(LIVE_QUEUE_SIZE + 1):
+            hub._send(channel, f"event: diff\ndata: {index}\n\n".encode("utf-8"), "diff")
+        # The backlog is dropped for one snapshot
+        kind, data = await _next(stream)
+        assert kind == "snapshot"
+        await stream.aclose()
+
+    asyncio.run(scenario())
+
+def test_viewers_are_told_when_the_program_goes(db, program):
+    async def scenario():
+        hub = LiveHub()
+        stream = await hub.subscribe(program.qr_code_id, _current_rev(program))
+        await stream.__anext__()
+
+        db.execute(update(FuneralProgram.__table__).where(FuneralProgram.__table__.c.id == program.id).values(is_active=False))
+        db.commit()
+        await _changed(hub, program.id)
+
+        assert await _next(stream) == ("gone", {})
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        assert not hub._channels
+        assert await hub.subscribe(program.qr_code_id, None) is None
+
+    asyncio.run(scenario())
+
+def test_late_viewer_joins_the_newer_channel(db, program):
+    async def scenario():
+        hub = LiveHub()
+        rev = _current_rev(program)
+        late = await hub.subscribe(program.qr_code_id, rev)
+        # The channel's last viewer leaves before the late viewer starts streaming...
+        old = hub._channels[program.id]
+        hub._forget(old)
+        # ...and a new viewer opens a fresh channel meanwhile
+        fresh = await hub.subscribe(program.qr_code_id, rev)
+        await fresh.__anext__()
+        new = hub._channels[program.id]
+        assert new is not old
+
+        await late.__anext__()
+        assert hub._channels[program.id] is new
+        assert len(new.viewers) == 2
+
+        program.program_events[0].title = "Welcome and prayer"
+        db.commit()
+        await _changed(hub, program.id)
+        for stream in (late, fresh):
+            kind, data = await _next(stream)
+            assert kind == "diff"
+            assert data["upsert"][0]["title"] == "Welcome and prayer"
+            await stream.aclose()
+
+    asyncio.run(scenario())
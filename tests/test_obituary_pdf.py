@@ -0,0 +1,32 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.models.funeral import FuneralProgram, Obituary
+from app.utils.storage import get_storage, public_path
+
+@pytest.fixture
+def program(db):
+    key = f"pdfs/test-{os.urandom(6).hex()}.pdf"
+    get_storage().put(key, b"%PDF-1.4 test", "application/pdf")
+    program = FuneralProgram(
+        deceased_name="Jane Doe", funeral_date="2026-11-01", funeral_location="Chapel",
+        qr_code_id=f"test-{os.urandom(6).hex()}",
+        obituary=Obituary(biography="A life well lived", pdf_url=public_path(key), pdf_version=3)
+    )
+    db.add(program)
+    db.commit()
+    return program
+
+@pytest.mark.parametrize("query, cache_control", [
+    ("?v=3", "public, max-age=31536000, immutable"),
+    ("?v=2", "no-cache"),
+    ("", "no-cache"),
+])
+def test_only_the_current_version_is_cached(program, query, cache_control):
+    response = TestClient(main.app).get(f"/api/funeral/program/{program.qr_code_id}/obituary/pdf{query}")
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1.4 test"
+    assert response.headers["cache-control"] == cache_control
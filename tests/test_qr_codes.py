@@ -0,0 +1,23 @@
+import os
+
+from fastapi.testclient import TestClient
+
+import main
+from app.models.funeral import FuneralProgram
+
+def test_generate_does_not_assign_short_codes(db):
+    program = FuneralProgram(
+        deceased_name="Jane Doe", funeral_date="2026-11-01", funeral_location="Chapel",
+        qr_code_id=f"test-{os.urandom(6).hex()}"
+    )
+    db.add(program)
+    db.commit()
+    version = program.version
+
+    response = TestClient(main.app).get(f"/api/qr/generate/{program.id}")
+    assert response.status_code == 200
+    assert response.json()["access_url"] == f"/api/funeral/program/{program.qr_code_id}/view"
+
+    db.refresh(program)
+    assert program.short_code is None
+    assert program.version == version
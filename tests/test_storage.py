@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from app.utils.storage import LocalStorage, S3Storage, StorageError, key_from_url, public_path
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "funeral-test"
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield S3Storage(bucket=BUCKET, region="us-east-1", prefix="/media/", client=client)
+
+def test_key_from_url():
+    assert key_from_url("/static/qr_codes/abc.png") == "qr_codes/abc.png"
+    assert key_from_url(public_path("uploads/x.jpg")) == "uploads/x.jpg"
+    assert key_from_url("https://example.com/static/x.png") is None
+    assert key_from_url(None) is None
+    assert key_from_url("") is None
+
+def test_s3_put_get_exists_delete(s3):
+    assert not s3.exists("qr_codes/a.png")
+    s3.put("qr_codes/a.png", b"png bytes")
+    assert s3.exists("qr_codes/a.png")
+    assert s3.get("qr_codes/a.png") == b"png bytes"
+    assert b"".join(s3.stream("qr_codes/a.png", chunk_size=3)) == b"png bytes"
+
+    head = s3.client.head_object(Bucket=BUCKET, Key="media/qr_codes/a.png")
+    assert head["ContentType"] == "image/png"
+
+    s3.delete("qr_codes/a.png")
+    assert not s3.exists("qr_codes/a.png")
+    s3.delete("qr_codes/a.png")  # Missing objects are ignored
+    with pytest.raises(StorageError):
+        s3.get("qr_codes/a.png")
+
+def test_s3_put_file_removes_source(s3, tmp_path):
+    source = tmp_path / "upload"
+    source.write_bytes(b"pdf")
+    s3.put_file("pdfs/1.pdf", source)
+    assert not source.exists()
+    assert s3.get("pdfs/1.pdf") == b"pdf"
+
+def test_s3_presigned_urls_are_cached(s3):
+    calls = []
+    generate = s3.client.generate_presigned_url
+
+    def counting(*args, **kwargs):
+        calls.append(kwargs["Params"])
+        return generate(*args, **kwargs)
+
+    s3.client.generate_presigned_url = counting
+    s3.put("uploads/p.jpg", b"jpeg")
+
+    first = s3.url("uploads/p.jpg")
+    assert s3.url("uploads/p.jpg") == first
+    assert len(calls) == 1
+    assert "media/uploads/p.jpg" in first
+
+    download = s3.url("uploads/p.jpg", download_name="photo.jpg")
+    assert download != first
+    assert calls[-1]["ResponseContentDisposition"] == 'attachment; filename="photo.jpg"'
+    assert len(calls) == 2
+
+    # Deleting an object drops its cached URLs
+    s3.delete("uploads/p.jpg")
+    s3.url("uploads/p.jpg")
+    assert len(calls) == 3
+
+def test_local_put_concurrent_writers(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    payloads = [bytes([i]) * 200_000 for i in range(8)]
+    errors = []
+
+    def write(data):
+        try:
+            for _ in range(20):
+                storage.put("qr_codes/same.png", data)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(data,)) for data in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert storage.get("qr_codes/same.png") in payloads
+    assert [path.name for path in (tmp_path / "qr_codes").iterdir()] == ["same.png"]
+
+def test_local_rejects_keys_outside_root(tmp_path):
+    with pytest.raises(StorageError):
+        LocalStorage(str(tmp_path)).path("../outside.txt")
+
+@pytest.mark.parametrize("backend", ["local", "s3"])
+def test_touch_and_modified_at(backend, request, tmp_path):
+    storage = request.getfixturevalue("s3") if backend == "s3" else LocalStorage(str(tmp_path))
+    assert storage.modified_at("uploads/p.jpg") is None
+    assert not storage.touch("uploads/p.jpg")
+    assert not storage.exists("uploads/p.jpg")
+
+    storage.put("uploads/p.jpg", b"jpeg bytes")
+    written = storage.modified_at("uploads/p.jpg")
+    assert written is not None
+    assert storage.touch("uploads/p.jpg")
+    assert storage.modified_at("uploads/p.jpg") >= written
+    assert storage.get("uploads/p.jpg") == b"jpeg bytes"
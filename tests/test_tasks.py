@@ -0,0 +1,34 @@
+import os
+import time
+
+from sqlalchemy import select
+
+from app.models.funeral import Task
+from app.utils import tasks
+from app.utils.storage import get_storage, public_path
+
+def _stored_photo():
+    key = f"uploads/{os.urandom(8).hex()}.jpg"
+    get_storage().put(key, b"jpeg bytes")
+    return key
+
+def test_delete_files_spares_recently_uploaded_photos(db):
+    key = _stored_photo()
+    tasks._delete_files({"keys": [], "photo_url": public_path(key), "variant_urls": []})
+
+    # Another upload of the same photo may be about to be saved with its program
+    assert get_storage().exists(key)
+    retry = db.execute(select(Task).where(Task.idempotency_key.startswith(f"delete_files:{public_path(key)}:"))).scalar_one()
+    assert retry.payload == {"photo_url": public_path(key), "variant_urls": []}
+    assert retry.run_at > tasks._now()
+
+def test_delete_files_removes_settled_photos(db):
+    key = _stored_photo()
+    variant = _stored_photo()
+    settled = time.time() - tasks.UPLOAD_REUSE_GRACE - 60
+    os.utime(get_storage().path(key), (settled, settled))
+
+    tasks._delete_files({"keys": [], "photo_url": public_path(key), "variant_urls": [public_path(variant)]})
+
+    assert not get_storage().exists(key)
+    assert not get_storage().exists(variant)